@@ -0,0 +1,91 @@
+import asyncio
+import random
+from typing import (
+    Dict,
+    List
+)
+import httpx
+from .engine import DB_NAME, TABLE_NAME, make_record
+from .measure import PeakRss, Recorder, sample_ids
+
+PRELOAD_BATCH = 10000 # records per add_many call while the table is filled
+SNAPSHOT_POLL = 0.001 # seconds between two /snapshotStatus calls
+
+
+async def _save_snapshot(client: httpx.AsyncClient):
+    """ /saveSnapshot runs the save on a worker thread, the call ends once its job is done """
+    job = (await client.get("/saveSnapshot", params={"force": True, "table": TABLE_NAME})).json()
+    while isinstance(job, dict) and job["status"] in ("pending", "running"):
+        await asyncio.sleep(SNAPSHOT_POLL)
+        job = (await client.get("/snapshotStatus", params={"job_id": job["job_id"]})).json()
+    return job
+
+
+async def run_api(records: int, encrypt: bool, ops: int, repeat: int, directory: str) -> List[Dict]:
+    """ Benchmark the HTTP endpoints in process, through the httpx ASGI transport
+
+    The table is filled with `records` records through Burp.add_many, then /addData, /getSingle,
+    /updateData and /deleteData run `ops` times and /getAll and /saveSnapshot `repeat` times.
+    Latencies cover routing, validation, the middleware and the response rendering, not the network.
+
+    Args:
+        records (int): table size
+        encrypt (bool): Fernet encrypted table
+        ops (int): calls of the single record endpoints
+        repeat (int): calls of the whole table endpoints
+        directory (str): where the database folder is created, it should be empty
+
+    Returns:
+        List[dict]: one result per endpoint, see measure.Recorder.result
+    """
+    import main # the app, imported from the API folder
+
+    case = {"suite": "api", "records": records, "encrypted": encrypt}
+    results = []
+    ops = min(ops, records)
+    db = main._new_db()
+    db.cur_dir = directory
+    db.create_database(DB_NAME, save="manual")
+    db.create_table(TABLE_NAME, encrypt=encrypt)
+    for start in range(0, records, PRELOAD_BATCH):
+        db.add_many([make_record(i) for i in range(start, min(start + PRELOAD_BATCH, records))], TABLE_NAME)
+    main.DB = db
+    table = {"table": TABLE_NAME}
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://burp") as client:
+            with PeakRss() as rss:
+                with Recorder("/addData", rss) as recorder:
+                    for i in range(records, records + ops):
+                        await recorder.time_async(client.post, "/addData", params=table, json=make_record(i))
+                results.append(recorder.result(**case))
+
+                with Recorder("/getSingle", rss) as recorder:
+                    for uid in sample_ids(ops, records, seed=1):
+                        await recorder.time_async(client.get, "/getSingle", params={"id": uid, **table})
+                results.append(recorder.result(**case))
+
+                with Recorder("/updateData", rss) as recorder:
+                    for n, uid in enumerate(sample_ids(ops, records, seed=2)):
+                        await recorder.time_async(client.post, "/updateData", params={"id": uid, **table},
+                                                  json={"score": n % 100, "active": n % 2 == 0})
+                results.append(recorder.result(**case))
+
+                with Recorder("/getAll", rss) as recorder:
+                    for _ in range(repeat):
+                        await recorder.time_async(client.get, "/getAll", params=table, records=records)
+                results.append(recorder.result(**case))
+
+                with Recorder("/saveSnapshot", rss) as recorder:
+                    for _ in range(repeat):
+                        await recorder.time_async(_save_snapshot, client, records=records)
+                results.append(recorder.result(**case))
+
+                with Recorder("/deleteData", rss) as recorder:
+                    for uid in random.Random(3).sample(range(records), ops):
+                        await recorder.time_async(client.delete, "/deleteData", params={"id": uid, **table})
+                results.append(recorder.result(**case))
+    finally:
+        main.DB = None
+        db.close()
+    return results
@@ -0,0 +1,73 @@
+import sys
+import json
+import argparse
+from typing import (
+    Dict,
+    List
+)
+
+DEFAULT_TOLERANCE = 0.10 # relative change allowed before a result counts as a regression
+LATENCY_FLOOR_MS = 0.05 # p99 latencies below this are too noisy to compare
+
+
+def result_key(result: Dict):
+    return result["suite"], result["op"], result["records"], result["encrypted"]
+
+
+def compare(baseline: Dict, current: Dict, tolerance: float = DEFAULT_TOLERANCE) -> List[Dict]:
+    """ Results of the current run that are slower than the baseline
+
+    A result regresses when its throughput drops, or its p99 latency grows, by more than tolerance.
+    Results without a counterpart in the other run are not compared.
+
+    Args:
+        baseline (dict): report of the reference run, see run.main
+        current (dict): report of the run to check
+        tolerance (float, optional): relative change allowed. Defaults to DEFAULT_TOLERANCE.
+
+    Returns:
+        List[dict]: the regressions, the key of the result and what got worse
+    """
+    reference = {result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = reference.get(result_key(result))
+        if base is None:
+            continue
+        worse = {}
+        if base["throughput"] and result["throughput"] < base["throughput"] * (1 - tolerance):
+            worse["throughput"] = (base["throughput"], result["throughput"])
+        if max(base["p99_ms"], result["p99_ms"]) >= LATENCY_FLOOR_MS and \
+                result["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+            worse["p99_ms"] = (base["p99_ms"], result["p99_ms"])
+        if worse:
+            suite, op, records, encrypted = result_key(result)
+            regressions.append({"suite": suite, "op": op, "records": records, "encrypted": encrypted,
+                                "worse": worse})
+    return regressions
+
+
+def format_regression(regression: Dict) -> str:
+    changes = ", ".join(f"{metric} {before:.4g} -> {after:.4g}"
+                        for metric, (before, after) in regression["worse"].items())
+    mode = "encrypted" if regression["encrypted"] else "plain"
+    return f"{regression['suite']} {regression['op']} {regression['records']} {mode}: {changes}"
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare two benchmark reports, exit 1 on a regression")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args(argv)
+    with open(args.baseline, "r", encoding="utf-8") as baseline_file, \
+            open(args.current, "r", encoding="utf-8") as current_file:
+        regressions = compare(json.load(baseline_file), json.load(current_file), args.tolerance)
+    for regression in regressions:
+        print(format_regression(regression))
+    print(f"{len(regressions)} regressions")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+import random
+from typing import (
+    Dict,
+    List
+)
+from utils.main import Burp
+from .measure import PeakRss, Recorder, sample_ids
+
+DB_NAME = "bench"
+TABLE_NAME = "bench"
+CITIES = ("Mumbai", "Pune", "Delhi", "Bengaluru", "Chennai", "Kolkata", "Hyderabad", "Jaipur")
+
+
+def make_record(i: int) -> dict:
+    """ Record number i, the same for every run """
+    return {
+        "name": f"user{i}",
+        "email": f"user{i}@example.com",
+        "age": 18 + i % 60,
+        "city": CITIES[i % len(CITIES)],
+        "score": (i * 7919) % 10000 / 100,
+        "active": i % 3 != 0,
+    }
+
+
+def run_engine(records: int, encrypt: bool, ops: int, repeat: int, directory: str) -> List[Dict]:
+    """ Benchmark the Burp methods on one table of `records` records
+
+    add_one fills the table, get_one, update and delete run `ops` times on random ids,
+    get_all, save_snapshot and load_data run `repeat` times over the whole table.
+
+    Args:
+        records (int): table size
+        encrypt (bool): Fernet encrypted table
+        ops (int): calls of the single record operations
+        repeat (int): calls of the whole table operations
+        directory (str): where the database folder is created, it should be empty
+
+    Returns:
+        List[dict]: one result per operation, see measure.Recorder.result
+    """
+    case = {"suite": "engine", "records": records, "encrypted": encrypt}
+    results = []
+    ops = min(ops, records)
+    db = Burp(cur_dir=directory)
+    db.create_database(DB_NAME, save="manual")
+    db.create_table(TABLE_NAME, encrypt=encrypt)
+    key = db.tables[TABLE_NAME].encryption_key
+    with PeakRss() as rss:
+        with Recorder("add_one", rss) as recorder:
+            for i in range(records):
+                recorder.time(db.add_one, make_record(i), TABLE_NAME)
+        results.append(recorder.result(**case))
+
+        with Recorder("get_one", rss) as recorder:
+            for uid in sample_ids(ops, records, seed=1):
+                recorder.time(db.get_one, uid, TABLE_NAME)
+        results.append(recorder.result(**case))
+
+        with Recorder("update", rss) as recorder:
+            for n, uid in enumerate(sample_ids(ops, records, seed=2)):
+                recorder.time(db.update, uid, {"score": n % 100, "active": n % 2 == 0}, TABLE_NAME)
+        results.append(recorder.result(**case))
+
+        with Recorder("get_all", rss) as recorder:
+            for _ in range(repeat):
+                recorder.time(db.get_all, TABLE_NAME, records=records)
+        results.append(recorder.result(**case))
+
+        with Recorder("save_snapshot", rss) as recorder:
+            for _ in range(repeat):
+                recorder.time(db.save_snapshot, True, TABLE_NAME, records=records)
+        results.append(recorder.result(**case))
+        db.close()
+
+        with Recorder("load_data", rss) as recorder:
+            for _ in range(repeat):
+                db = Burp(cur_dir=directory)
+                recorder.time(db.load_data, DB_NAME, TABLE_NAME, encrypt, key or "", "manual", records=records)
+                db.close()
+        results.append(recorder.result(**case))
+
+        db = Burp(cur_dir=directory)
+        db.load_data(DB_NAME, TABLE_NAME, encrypt, key or "", "manual")
+        with Recorder("delete", rss) as recorder:
+            for uid in random.Random(3).sample(range(records), ops):
+                recorder.time(db.delete, uid, TABLE_NAME)
+        results.append(recorder.result(**case))
+        db.close()
+    return results
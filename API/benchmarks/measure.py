@@ -0,0 +1,132 @@
+import os
+import math
+import time
+import random
+import threading
+from array import array
+from typing import (
+    Dict,
+    Optional
+)
+import psutil
+
+
+def percentile(samples, fraction: float) -> float:
+    """ Nearest rank percentile of sorted samples, 0.0 when there are none """
+    if not samples:
+        return 0.0
+    rank = min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))
+    return samples[rank]
+
+
+class PeakRss:
+    """
+    Samples the resident set size of the process on a background thread,
+    the peak since the last reset is read with peak().
+    """
+    DEFAULT_INTERVAL = 0.005 # seconds between two samples
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL):
+        self.interval = interval
+        self._process = psutil.Process(os.getpid())
+        self._peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        rss = self._process.memory_info().rss
+        if rss > self._peak:
+            self._peak = rss
+        return rss
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self):
+        """ Start a new peak from the current RSS """
+        self._peak = 0
+        self._sample()
+
+    def peak(self) -> int:
+        """ Highest RSS in bytes seen since the last reset """
+        self._sample()
+        return self._peak
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+class Recorder:
+    """
+    Latencies of one benchmarked operation, in nanoseconds, plus the records it went through.
+
+    An operation over the whole table (get_all, save_snapshot, load_data) records one latency
+    per call and the table size as its records, throughput is then in records per second.
+    """
+
+    def __init__(self, op: str, rss: PeakRss):
+        self.op = op
+        self.rss = rss
+        self.latencies = array("q")
+        self.records = 0
+        self.started = None
+        self.seconds = 0.0
+
+    def __enter__(self):
+        self.rss.reset()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = time.perf_counter() - self.started
+
+    def time(self, fn, *args, records: int = 1, **kwargs):
+        """ Call fn and record its latency """
+        started = time.perf_counter_ns()
+        result = fn(*args, **kwargs)
+        self.latencies.append(time.perf_counter_ns() - started)
+        self.records += records
+        return result
+
+    async def time_async(self, fn, *args, records: int = 1, **kwargs):
+        started = time.perf_counter_ns()
+        result = await fn(*args, **kwargs)
+        self.latencies.append(time.perf_counter_ns() - started)
+        self.records += records
+        return result
+
+    def result(self, **case) -> Dict:
+        """ Summary of the operation, the case (suite, records, encrypted, ...) is copied in """
+        samples = sorted(self.latencies)
+        return dict(case, **{
+            "op": self.op,
+            "calls": len(samples),
+            "processed": self.records,
+            "seconds": self.seconds,
+            "throughput": self.records / self.seconds if self.seconds else 0.0,
+            "p50_ms": percentile(samples, 0.50) / 1e6,
+            "p99_ms": percentile(samples, 0.99) / 1e6,
+            "max_ms": samples[-1] / 1e6 if samples else 0.0,
+            "peak_rss_mb": self.rss.peak() / (1 << 20),
+        })
+
+
+def sample_ids(count: int, ids: int, seed: Optional[int] = 0):
+    """ count ids drawn from range(ids), the same ones for the same seed """
+    generator = random.Random(seed)
+    return [generator.randrange(ids) for _ in range(count)]
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Dict,
+    List
+)
+from .compare import DEFAULT_TOLERANCE, compare, format_regression
+
+DEFAULT_SIZES = "10000,1000000,10000000"
+DEFAULT_API_SIZES = "10000"
+DEFAULT_OPS = 10000
+DEFAULT_REPEAT = 3
+
+
+def run_case(suite: str, records: int, encrypt: bool, ops: int, repeat: int, quiet: bool = True) -> List[Dict]:
+    """ One suite at one size, in a database folder of its own that is removed afterwards """
+    from .api import run_api
+    from .engine import run_engine
+
+    with tempfile.TemporaryDirectory(prefix="burp-bench-") as directory, \
+            open(os.devnull, "w") as devnull, \
+            contextlib.redirect_stdout(devnull if quiet else sys.stdout):
+        if suite == "engine":
+            return run_engine(records, encrypt, ops, repeat, directory)
+        return asyncio.run(run_api(records, encrypt, ops, repeat, directory))
+
+
+def _sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Burp engine and its HTTP API. "
+                                                 "Run from the API folder: python -m benchmarks.run")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="table sizes of the engine suite")
+    parser.add_argument("--api-sizes", default=DEFAULT_API_SIZES, help="table sizes of the api suite")
+    parser.add_argument("--suites", default="engine,api")
+    parser.add_argument("--modes", default="plain,encrypted")
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="calls of the single record operations")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="calls of the whole table operations")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="report of a previous run, exit 1 when this run regresses")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--verbose", action="store_true", help="keep the output of the database")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for suite in args.suites.split(","):
+        sizes = _sizes(args.sizes if suite == "engine" else args.api_sizes)
+        for records in sizes:
+            for mode in args.modes.split(","):
+                cases.append((suite, records, mode == "encrypted"))
+    report = {
+        "meta": {
+            "started_at": time.time(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "ops": args.ops,
+            "repeat": args.repeat,
+        },
+        "results": [],
+    }
+    # every case runs in a fresh process so its peak RSS is its own
+    context = multiprocessing.get_context("spawn")
+    for suite, records, encrypt in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results = pool.submit(run_case, suite, records, encrypt, args.ops, args.repeat,
+                                  not args.verbose).result()
+        for result in results:
+            print(f"{suite:6} {result['op']:14} {records:>9} {'encrypted' if encrypt else 'plain':9} "
+                  f"{result['throughput']:>12.0f}/s p50 {result['p50_ms']:9.3f}ms p99 {result['p99_ms']:9.3f}ms "
+                  f"rss {result['peak_rss_mb']:8.1f}MB")
+        report["results"].extend(results)
+        # a partial report survives an interrupted run
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(report, output, indent=4)
+    print(f"Report written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as baseline_file:
+            regressions = compare(json.load(baseline_file), report, args.tolerance)
+        for regression in regressions:
+            print(format_regression(regression))
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
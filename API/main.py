@@ -1,17 +1,205 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse, PlainTextResponse
+from importlib.util import find_spec
+from itertools import islice
 import uvicorn
 from contextlib import asynccontextmanager
 import psutil
 import os
+import json
+import time
+import asyncio
+import logging
 from utils.main import Burp
-from typing import Optional, Dict
+from utils.feed import FeedClosed
+from utils.metrics import ENGINE_METRICS, Counter, Gauge, Histogram, render
+from utils.persist import DataPersistSettings
+from utils.replica import ReplicaFollower
+from utils.filelock import FileLock, FileLockTimeout
+from utils.scheduler import SnapshotScheduler
+from utils.serializers import get_serializer
+from typing import Optional, Dict, List
+
+# ORJSONResponse imports orjson when it renders, the stdlib encoder is the fallback
+DefaultResponse = ORJSONResponse if find_spec("orjson") is not None else JSONResponse
+
+# "standalone", "writer" publishing its tables to read replicas, or "replica" following a writer.
+# A replica follows the database BURP_DATABASE, a standalone server or a writer loads every table of it at startup.
+# BURP_KEYS holds the keys of the encrypted tables as {"table": "key"}
+# Every worker of a gunicorn or uvicorn deployment shares the environment: with "auto" the first worker to
+# lock BURP_DATABASE/writer.lock becomes the writer and the others its replicas. A replica never takes over,
+# restart the deployment when the writer dies.
+ROLE = os.environ.get("BURP_ROLE", "standalone")
+DATABASE = os.environ.get("BURP_DATABASE")
+KEYS = json.loads(os.environ.get("BURP_KEYS", "{}"))
+SAVE = os.environ.get("BURP_SAVE", "auto") # save policy of the tables loaded at startup
+WARM_START = os.environ.get("BURP_WARM_START", "1") != "0"
+WARM_START_WORKERS = int(os.environ["BURP_WARM_START_WORKERS"]) if os.environ.get("BURP_WARM_START_WORKERS") else None
+REPLICA_MAX_LAG = float(os.environ.get("BURP_MAX_LAG", ReplicaFollower.DEFAULT_MAX_LAG))
+MIN_SEQ_TIMEOUT = 1.0 # seconds a replica read waits for the writes it must see
+# bytes of records every table keeps in memory before the cold ones spill to disk, unset keeps them all
+MEMORY_BUDGET = int(os.environ["BURP_MEMORY_BUDGET"]) if os.environ.get("BURP_MEMORY_BUDGET") else None
+CACHE_POLICY = os.environ.get("BURP_CACHE_POLICY") # "lru" or "clock"
+WRITE_PATHS = {"/createDatabase", "/createTable", "/addData", "/addMany", "/updateData", "/updateMany",
+               "/deleteData", "/deleteMany", "/createIndex", "/dropIndex", "/saveSnapshot", "/loadData",
+               "/deleteTable"}
+HEALTH_PATHS = {"/live", "/ready", "/metrics"} # served while the tables load
+LOG_LEVEL = os.environ.get("BURP_LOG_LEVEL", "INFO")
+
+logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("burp")
+# the engine logs under "utils", other libraries keep the default WARNING level
+for name in ("burp", "utils"):
+    logging.getLogger(name).setLevel(LOG_LEVEL)
+HTTP_REQUEST_SECONDS = Histogram("burp_http_request_seconds", "Latency of the HTTP requests", ("method", "path"))
+HTTP_REQUESTS = Counter("burp_http_requests_total", "HTTP requests by response status", ("method", "path", "status"))
 
-app = FastAPI()
 DB = None
+FOLLOWER = None
+# progress of the warm start: "off", "loading", "ready" or "failed", and table name -> load seconds or error
+WARMUP = {"state": "off", "tables": {}, "seconds": None}
+
+def _new_db() -> Burp:
+    return Burp(role=ROLE, settings=DataPersistSettings(memory_budget=MEMORY_BUDGET, cache_policy=CACHE_POLICY))
+
+async def warm_start():
+    """ Load every table of DATABASE on an executor thread, the event loop keeps serving the health checks """
+    global DB
+    WARMUP.update(state="loading", tables={}, seconds=None)
+    started = time.perf_counter()
+    try:
+        WARMUP["tables"] = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: DB.warm_start(DATABASE, KEYS, SAVE, WARM_START_WORKERS))
+    except FileNotFoundError:
+        # first deploy, /createDatabase creates it
+        logger.info("No database %s to load yet", DATABASE)
+        DB = None
+        WARMUP["state"] = "ready"
+        return
+    except Exception as e:
+        logger.error("Warm start of %s failed: %s - %s", DATABASE, type(e).__name__, e)
+        WARMUP["state"] = "failed"
+        return
+    WARMUP["seconds"] = time.perf_counter() - started
+    failed = [name for name, result in WARMUP["tables"].items() if isinstance(result, str)]
+    WARMUP["state"] = "failed" if failed else "ready"
+    logger.info("Warm start loaded %d tables of %s in %.3fs", len(WARMUP["tables"]) - len(failed), DATABASE,
+                WARMUP["seconds"])
+    if failed:
+        logger.error("Warm start could not load the tables %s", failed)
+
+WRITER_LOCK = "writer" # lock file of the writer elected by BURP_ROLE=auto, in the database folder
+
+def elect_role():
+    """ Role of this worker under BURP_ROLE=auto: writer when it gets the writer lock, replica otherwise.
+    The lock is held until the process exits, then another deployment can elect a writer again
+    """
+    if not DATABASE:
+        raise RuntimeError("BURP_ROLE=auto needs the BURP_DATABASE its workers share")
+    probe = Burp() # only for the folder the databases live in
+    probe.close()
+    lock = FileLock(os.path.join(probe.cur_dir, DATABASE, WRITER_LOCK), timeout=0)
+    try:
+        return "writer", lock.acquire()
+    except FileLockTimeout:
+        return "replica", None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global DB, FOLLOWER, ROLE
+    warmup = None
+    writer_lock = None
+    if ROLE == "auto":
+        ROLE, writer_lock = elect_role()
+        logger.info("Elected as the %s of %s", ROLE, DATABASE)
+    if ROLE == "replica":
+        if not DATABASE:
+            raise RuntimeError("A replica needs the BURP_DATABASE to follow")
+        DB = _new_db()
+        FOLLOWER = ReplicaFollower(lambda: DB, DATABASE, KEYS, max_lag=REPLICA_MAX_LAG)
+        FOLLOWER.start()
+    elif DATABASE and WARM_START:
+        DB = _new_db()
+        warmup = asyncio.create_task(warm_start())
+    # a writer commits the buffered log records every group commit interval, the lag of its replicas
+    tick = DataPersistSettings.DEFAULT_GROUP_COMMIT_INTERVAL if ROLE == "writer" else 1.0
+    scheduler = SnapshotScheduler(lambda: DB, tick)
+    scheduler.start()
     yield 
-    
+    if warmup is not None:
+        await warmup
+    await scheduler.stop()
+    if FOLLOWER is not None:
+        await FOLLOWER.stop()
+    if DB is not None:
+        if DB.save_policy.mode != "manual":
+            for table_name in DB.dirty_tables():
+                DB.save_snapshot(table_name=table_name)
+        DB.close()
+    if writer_lock is not None:
+        writer_lock.release()
+
+app = FastAPI(lifespan=lifespan, default_response_class=DefaultResponse)
+SERIALIZER = get_serializer()
+
+@app.middleware("http")
+async def replication(request: Request, call_next):
+    """ Keeps writes off the replicas and makes a read wait for the writes it asks for with min_seq.
+    Every response carries X-Burp-Seq, the sequence number of the last write of the table it concerns.
+    """
+    table_name = request.query_params.get("table")
+    if WARMUP["state"] == "loading" and request.url.path not in HEALTH_PATHS:
+        return DefaultResponse("The server is loading its tables, retry once /ready says so", status_code=503)
+    # the probes report the lag themselves, see /ready
+    if ROLE == "replica" and request.url.path not in HEALTH_PATHS:
+        if request.url.path in WRITE_PATHS:
+            return DefaultResponse("This server is a read replica, send writes to the writer", status_code=405)
+        if FOLLOWER.lag() > FOLLOWER.max_lag:
+            return DefaultResponse(f"The replica is {FOLLOWER.lag():.1f}s behind the writer", status_code=503,
+                                   headers={"Retry-After": "1"})
+        min_seq = request.query_params.get("min_seq")
+        if min_seq is not None:
+            try:
+                min_seq = int(min_seq)
+            except ValueError:
+                return DefaultResponse("min_seq must be an integer", status_code=400)
+            deadline = time.monotonic() + MIN_SEQ_TIMEOUT
+            while True:
+                table = DB.tables.get(table_name or DB.table_name)
+                if table is not None and table.seq >= min_seq:
+                    break
+                if time.monotonic() >= deadline:
+                    return DefaultResponse(f"The replica has not applied the write {min_seq} yet", status_code=503,
+                                           headers={"Retry-After": "1"})
+                if table is not None:
+                    FOLLOWER.poll_table(table.name)
+                await asyncio.sleep(FOLLOWER.tick)
+    response = await call_next(request)
+    if DB is not None:
+        table = DB.tables.get(table_name or DB.table_name)
+        if table is not None:
+            response.headers["X-Burp-Seq"] = str(table.seq)
+    return response
+
+ROUTE_PATHS = None
+
+@app.middleware("http")
+async def metrics(request: Request, call_next):
+    """ Latency and status of every request, by route so unknown paths share one label """
+    global ROUTE_PATHS
+    if ROUTE_PATHS is None:
+        ROUTE_PATHS = {route.path for route in app.routes}
+    path = request.url.path if request.url.path in ROUTE_PATHS else "unmatched"
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, request.method, path)
+        HTTP_REQUESTS.inc(request.method, path, status)
+
 @app.get("/")
 async def home():
     res = {}
@@ -19,12 +207,65 @@ async def home():
     res["Total cpu threads"] = psutil.cpu_count()
     return res
 
+@app.get("/metrics")
+async def metrics_text():
+    """ Prometheus text format: engine and HTTP latencies, bytes read and written, tables and process memory """
+    records = Gauge("burp_table_records", "Records of the open tables", ("table",))
+    memory = Gauge("burp_table_memory_bytes", "Approximate bytes of records held in memory", ("table",))
+    dirty = Gauge("burp_table_dirty_operations", "Writes not in the snapshot yet", ("table",))
+    seq = Gauge("burp_table_seq", "Sequence number of the last write", ("table",))
+    load_records = Gauge("burp_load_records", "Records read so far by the snapshot loads in progress", ("table",))
+    load_bytes = Gauge("burp_load_bytes", "Bytes read so far and size of the snapshots being loaded",
+                       ("table", "kind"))
+    if DB is not None:
+        for name, table in list(DB.tables.items()):
+            records.set(len(table), name)
+            memory.set(table.memory_bytes(), name)
+            dirty.set(table.dirty_count, name)
+            seq.set(table.seq, name)
+        for name, progress in DB.load_progress().items():
+            if progress:
+                load_records.set(progress["records"], name)
+                load_bytes.set(progress["bytes_read"], name, "read")
+                load_bytes.set(progress["total_bytes"], name, "total")
+    process = psutil.Process()
+    rss = Gauge("burp_process_resident_memory_bytes", "Resident set size of the server")
+    rss.set(process.memory_info().rss)
+    cpu = Gauge("burp_process_cpu_seconds", "User and system CPU time of the server")
+    cpu_times = process.cpu_times()
+    cpu.set(cpu_times.user + cpu_times.system)
+    gauges = [records, memory, dirty, seq, load_records, load_bytes, rss, cpu]
+    if FOLLOWER is not None:
+        lag = Gauge("burp_replica_lag_seconds", "Seconds since the replica last polled its writer")
+        lag.set(FOLLOWER.lag())
+        gauges.append(lag)
+    return PlainTextResponse(render(ENGINE_METRICS + (HTTP_REQUEST_SECONDS, HTTP_REQUESTS) + tuple(gauges)),
+                             media_type="text/plain; version=0.0.4")
+
+@app.get("/live")
+async def live():
+    """ Liveness probe: the event loop answers, whether or not the tables are loaded """
+    return {"status": "alive"}
+
+@app.get("/ready")
+async def ready():
+    """ Readiness probe: 200 once the warm start loaded every table, or once a replica follows its writer """
+    if ROLE == "replica":
+        lag = FOLLOWER.lag() if FOLLOWER is not None else float("inf")
+        is_ready = lag <= FOLLOWER.max_lag
+        body = {"ready": is_ready, "lag": lag if is_ready else None}
+    else:
+        is_ready = WARMUP["state"] in ("off", "ready")
+        body = {"ready": is_ready, "warm_start": WARMUP["state"], "tables": WARMUP["tables"],
+                "seconds": WARMUP["seconds"], "loading": DB.load_progress() if DB is not None else {}}
+    return DefaultResponse(body, status_code=200 if is_ready else 503)
+
 @app.get("/createDatabase")
 async def create(database_name: str, encoding : str = None, save: str = "auto"):
     global DB
     if DB is not None:
         return f"Database with name : {DB.db_name} already exists"
-    DB = Burp()
+    DB = _new_db()
     try:
         DB.create_database(database_name, encoding, save)
         return f"Database created with name: {database_name}"
@@ -32,69 +273,311 @@ async def create(database_name: str, encoding : str = None, save: str = "auto"):
         return e
 
 @app.get("/createTable")
-async def createTable(table_name: str, extension: str = None, auto_increment=True, encrypt=False):
+async def createTable(table_name: str, extension: str = None, auto_increment=True, encrypt=False, pretty: bool = False,
+                      memory_budget: int = None, schema: str = None, compression: str = None, shards: int = None,
+                      ttl: float = None):
     if DB is None:
         return "First create a database"
     try:
-        DB.create_table(table_name, extension, auto_increment, encrypt)
+        # schema is a JSON object of field name -> column type, e.g. {"name": "str", "age": "int"}
+        DB.create_table(table_name, extension, auto_increment, encrypt, pretty, memory_budget,
+                        json.loads(schema) if schema else None, compression, shards, ttl)
     except Exception as e:
         return e
     return f"The table with name : {table_name} is created."
 
 @app.post("/addData")
-async def setVal(data: dict):
+async def setVal(data: dict, table: str = None, ttl: float = None):
     if DB is None: return "Create a Database first"
-    uid = DB.add_one(data)
+    try:
+        uid = DB.add_one(data, table, ttl)
+    except (KeyError, ValueError) as e:
+        return str(e)
     return uid
 
+@app.post("/addMany")
+async def addMany(data: List[dict], table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.add_many(data, table)
+    except (KeyError, ValueError) as e:
+        return str(e)
+
 @app.get("/getSingle")
-async def getSingle(id: int):
+async def getSingle(id: int, table: str = None):
     if DB is None: return "Create a Database first"
-    data = DB.get_one(id)
-    return data 
+    data = DB.get_one(id, table)
+    # returning the response skips jsonable_encoder, the record is serialized once
+    return DefaultResponse(data)
+
+STREAM_CHUNK_RECORDS = 1000
+
+def _ndjson_lines(limit: Optional[int], after_id: Optional[int], table: Optional[str]):
+    """ One {"id", "data"} JSON object per line, sent in chunks of STREAM_CHUNK_RECORDS records """
+    records = islice(DB.iter_records(after_id, table), limit)
+    while True:
+        chunk = [SERIALIZER.dumps({"id": uid, "data": record}) + b"\n"
+                 for uid, record in islice(records, STREAM_CHUNK_RECORDS)]
+        if not chunk:
+            return
+        yield b"".join(chunk)
 
 @app.get("/getAll")
-async def getAll():
+async def getAll(limit: int = None, after_id: int = None, stream: bool = False, table: str = None):
     if DB is None: return "Create a Database first"
-    data = DB.get_all()
-    return data
+    if stream:
+        if DB.tables.get(table or DB.table_name) is None:
+            return "Table name does not exists"
+        # a sync generator is iterated on the threadpool, memory stays flat whatever the table size
+        return StreamingResponse(_ndjson_lines(limit, after_id, table), media_type="application/x-ndjson")
+    if limit is not None:
+        try:
+            return DefaultResponse(DB.get_page(limit, after_id, table))
+        except (KeyError, ValueError) as e:
+            return str(e)
+    data = DB.get_all(table)
+    if isinstance(data, str):
+        return data
+    return DefaultResponse(data)
+
+async def _send(websocket: WebSocket, message: dict):
+    await websocket.send_text(SERIALIZER.dumps(message).decode())
+
+async def _wait_disconnect(websocket: WebSocket):
+    """ Messages from a feed client are ignored, the feed only needs to know when it leaves """
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+@app.websocket("/changes")
+async def changes(websocket: WebSocket, table: str = None, after_seq: int = None, incarnation: str = None,
+                  buffer: int = None):
+    """ Change feed of a table, instead of polling /getAll
+
+    Messages are JSON objects with a "type":
+    "start" gives the "seq" and "incarnation" the client starts from and whether a "snapshot" follows.
+    The "snapshot" messages then hold the records keyed by id, STREAM_CHUNK_RECORDS at a time, until "snapshot_end".
+    "changes" holds "events" in sequence order: {"op": "add", "id", "data": record}, {"op": "update", "id",
+    "data": changed fields} or {"op": "delete", "id"}, each with its "seq" and the "expires_at" of records given one.
+    A client reconnecting with after_seq and incarnation gets the events it missed without a snapshot while
+    the server still holds them. A client that lets `buffer` events pile up gets "end" with reason "overflow"
+    and the last "seq" it was sent, then the connection closes, it resumes from there.
+    """
+    await websocket.accept()
+    if DB is None or WARMUP["state"] == "loading":
+        await _send(websocket, {"type": "error", "message": "No database is open yet, retry later"})
+        await websocket.close(code=1013)
+        return
+    try:
+        feed = DB.subscribe_changes(table, after_seq, incarnation, buffer)
+    except KeyError as e:
+        await _send(websocket, {"type": "error", "message": str(e)})
+        await websocket.close(code=1008)
+        return
+    subscription = feed["subscription"]
+    disconnected = asyncio.ensure_future(_wait_disconnect(websocket))
+    try:
+        snapshot = feed.pop("snapshot")
+        await _send(websocket, {"type": "start", "table": table or DB.table_name, "seq": feed["seq"],
+                                "incarnation": feed["incarnation"], "snapshot": snapshot is not None})
+        if snapshot is not None:
+            records = iter(snapshot.items())
+            while True:
+                chunk = dict(islice(records, STREAM_CHUNK_RECORDS))
+                if not chunk:
+                    break
+                await _send(websocket, {"type": "snapshot", "records": chunk})
+            await _send(websocket, {"type": "snapshot_end", "seq": feed["seq"]})
+            # the copy is not kept for the life of the connection
+            snapshot = records = None
+        if feed["events"]:
+            await _send(websocket, {"type": "changes", "events": feed["events"]})
+        while True:
+            getter = asyncio.ensure_future(subscription.get())
+            await asyncio.wait({getter, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if not getter.done():
+                getter.cancel()
+                return
+            await _send(websocket, {"type": "changes", "events": getter.result()})
+    except FeedClosed as e:
+        await _send(websocket, {"type": "end", "reason": e.reason, "seq": e.seq})
+        await websocket.close(code=1013 if e.reason == "overflow" else 1001)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+        disconnected.cancel()
 
 @app.get("/saveSnapshot")
-async def saveSnapshot():
+async def saveSnapshot(force: bool = False, table: str = None):
     if DB is None: return "Create a Database first"
-    status = DB.save_snapshot()
-    return status
+    try:
+        job = DB.submit_snapshot(force, table)
+    except KeyError as e:
+        return str(e)
+    if job is None:
+        return "No changes since the last snapshot"
+    return job.to_dict()
+
+@app.get("/snapshotStatus")
+async def snapshotStatus(job_id: str):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.snapshot_status(job_id)
+    except KeyError as e:
+        return str(e)
 
 @app.post("/updateData")
-async def updateData(id: int, data: dict):
+async def updateData(id: int, data: dict, table: str = None, ttl: float = None):
     if DB is None: return "Create a Database first"
-    data = DB.update(id, data)
+    try:
+        data = DB.update(id, data, table, ttl)
+    except (KeyError, ValueError) as e:
+        return str(e)
     return data 
 
+@app.post("/updateMany")
+async def updateMany(data: Dict[int, dict], table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.update_many(data, table)
+    except (KeyError, ValueError) as e:
+        return str(e)
+
+def _parse_query_value(value: Optional[str]):
+    """ Query strings are untyped, read numbers and booleans as JSON and fall back to the raw string """
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+@app.get("/createIndex")
+async def createIndex(field: str, unique: bool = False, kind: str = "hash", table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.create_index(table, field, unique, kind)
+    except (KeyError, ValueError) as e:
+        return str(e)
+
+@app.delete("/dropIndex")
+async def dropIndex(field: str, table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.drop_index(table, field)
+    except KeyError as e:
+        return str(e)
+
+@app.get("/find")
+async def find(field: str, value: str, table: str = None):
+    if DB is None: return "Create a Database first"
+    # 7738959108 matches both the int and the str form of the value
+    typed_value = _parse_query_value(value)
+    try:
+        data = DB.find(field, typed_value, table)
+        if typed_value != value:
+            data.update(DB.find(field, value, table))
+    except KeyError as e:
+        return str(e)
+    return data
+
+@app.get("/range")
+async def range_query(field: str, low: str = None, high: str = None, prefix: str = None,
+                      limit: int = 100, offset: int = 0, order: str = "asc", table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.range(field, _parse_query_value(low), _parse_query_value(high), prefix, limit, offset, order, table)
+    except (KeyError, ValueError) as e:
+        return str(e)
+
 @app.delete("/deleteData")
-async def deleteData(id: int):
+async def deleteData(id: int, table: str = None):
     if DB is None: return "Create a Database first"
-    status = DB.delete(id)
+    status = DB.delete(id, table)
     return status
 
+@app.post("/deleteMany")
+async def deleteMany(ids: List[int], table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.delete_many(ids, table)
+    except KeyError as e:
+        return str(e)
+
 @app.get("/loadData")
-async def load_data(database_name: str, table_name: str, encrypt: bool = None, key: str = ""):
+async def load_data(database_name: str, table_name: str, encrypt: bool = None, key: str = "", save: str = "auto",
+                    extension: str = None, lazy: bool = False, memory_budget: int = None):
     global DB
-    if DB is not None: return f"Database with name {DB.db_name} already exists"
     if DB is None:
-        DB = Burp()
-    status = DB.load_data(database_name, table_name, encrypt, key)
+        DB = _new_db()
+    # tables of the same database are loaded next to the ones already open.
+    # Reading the snapshot and replaying the log run on an executor thread, the event loop keeps serving
+    try:
+        status = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: DB.load_data(database_name, table_name, encrypt, key, save, extension, lazy,
+                                       memory_budget=memory_budget))
+    except (KeyError, ValueError) as e:
+        return str(e)
+    return status
+
+@app.get("/tables")
+async def tables():
+    if DB is None: return "Create a Database first"
+    return {name: {"records": len(table), "extension": table.extension, "encrypt": table.encrypt,
+                   "indexes": list(table.indexes), "dirty": table.dirty_count, "schema": table.schema,
+                   "compression": table.compression, "shards": table.shards, "ttl": table.ttl,
+                   "expiring": len(table.expiry)}
+            for name, table in DB.tables.items()}
+
+@app.get("/lockStats")
+async def lockStats(table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.lock_stats(table)
+    except KeyError as e:
+        return str(e)
+
+@app.get("/column")
+async def column(field: str, table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DefaultResponse(DB.column(field, table))
+    except (KeyError, ValueError) as e:
+        return str(e)
+
+@app.get("/cacheStats")
+async def cacheStats(table: str = None):
+    if DB is None: return "Create a Database first"
+    try:
+        return DB.cache_stats(table)
+    except KeyError as e:
+        return str(e)
+
+@app.get("/replicaStatus")
+async def replicaStatus():
+    status = {"role": ROLE}
+    if DB is not None:
+        status["tables"] = {name: table.seq for name, table in DB.tables.items()}
+    if FOLLOWER is not None:
+        status["lag"] = FOLLOWER.lag()
+        status["max_lag"] = FOLLOWER.max_lag
     return status
 
 @app.delete("/deleteTable")
-async def deleteTable():
+async def deleteTable(table: str = None):
     if DB is None: return "Create a Database first"
-    return DB.delete_table()
+    try:
+        return DB.delete_table(table)
+    except KeyError as e:
+        return str(e)
 
 @app.get("/getKey")
-async def getKey():
+async def getKey(table: str = None):
     if DB is None: return "Create a Database first"
-    return DB.encryption_key
+    try:
+        return DB.get_table(table).encryption_key
+    except KeyError as e:
+        return str(e)
 
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True)
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import sys
+import pytest
+
+# the tests import the engine the way main.py and the benchmarks do, from the API folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.main import Burp
+
+
+@pytest.fixture
+def open_db(tmp_path):
+    """ Burp instances on a database folder of the test's own, closed at the end of the test """
+    opened = []
+
+    def open_db(**kwargs):
+        kwargs.setdefault("cur_dir", str(tmp_path))
+        db = Burp(**kwargs)
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        db.close()
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """ The API module serving from tmp_path, its globals are restored after the test """
+    main = pytest.importorskip("main")
+    monkeypatch.chdir(tmp_path)
+    for name in ("ROLE", "DATABASE", "DB", "FOLLOWER"):
+        monkeypatch.setattr(main, name, getattr(main, name))
+    return main
@@ -0,0 +1,30 @@
+import asyncio
+
+from utils.main import Burp
+
+
+def test_load_data_runs_off_the_event_loop(server, open_db, tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    db = open_db(cur_dir=str(tmp_path / "utils"))
+    db.create_database("shop", save="manual")
+    db.create_table("users")
+    db.add_one({"name": "a"}, "users")
+    db.close()
+    on_loop = []
+    load_data = Burp.load_data
+
+    def watch(self, *args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return load_data(self, *args, **kwargs)
+
+    monkeypatch.setattr(Burp, "load_data", watch)
+    server.ROLE, server.DATABASE = "standalone", None
+    with TestClient(server.app) as client:
+        assert client.get("/loadData?database_name=shop&table_name=users&save=manual").json() == "Loaded the data in memory"
+        assert client.get("/getSingle?id=0&table=users").json() == {"name": "a"}
+    assert on_loop == [False]
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture
+def users(open_db):
+    db = open_db()
+    db.create_database("batches", save="manual")
+    db.create_table("users")
+    db.add_many([{"n": i} for i in range(10)], "users")
+    db.create_index("users", "n")
+    db.create_index("users", "m", kind="ordered")
+    return db
+
+
+@pytest.mark.parametrize("records", [
+    [{"n": 10}, "not a record"], # rejected by the checks
+    [{"n": 10}, {"n": 11, "m": object()}], # stored, then fails to reach the log
+])
+def test_add_many_rolls_back_on_a_failing_record(users, records):
+    before = users.get_all("users")
+    with pytest.raises(TypeError):
+        users.add_many(records, "users")
+    assert users.get_all("users") == before
+    assert users.tables["users"].auto_inc_id == 10
+    assert users.find("n", 10, "users") == {}
+    assert users.add_one({"n": 10}, "users") == 10
+
+
+@pytest.mark.parametrize("updates", [
+    {1: {"m": 5}, 2: "not a record"},
+    {1: {"m": 5}, 2: {"m": object()}},
+])
+def test_update_many_rolls_back_on_a_failing_update(users, updates):
+    before = users.get_all("users")
+    with pytest.raises(TypeError):
+        users.update_many(updates, "users")
+    assert users.get_all("users") == before
+    assert users.range("m", table_name="users") == {}
+
+
+def test_a_rolled_back_batch_is_not_replayed(users, open_db):
+    with pytest.raises(TypeError):
+        users.add_many([{"n": 10}, {"n": 11, "m": object()}], "users")
+    users.update_many({1: {"m": 5}, 2: {"m": 6}}, "users")
+    expected = users.get_all("users")
+    users.close()
+
+    reloaded = open_db()
+    reloaded.load_data("batches", "users", save="manual")
+    assert reloaded.get_all("users") == expected
@@ -0,0 +1,77 @@
+import threading
+
+from utils.rwlock import ReadWriteLock
+
+ROUNDS = 300
+
+
+def test_readers_never_see_half_applied_writes(open_db):
+    db = open_db()
+    db.create_database("concurrent", save="manual")
+    db.create_table("pairs")
+    db.add_many([{"a": 0, "b": 0} for _ in range(20)], "pairs")
+    db.create_index("pairs", "a")
+    errors = []
+    done = threading.Event()
+
+    def write():
+        try:
+            for k in range(1, ROUNDS):
+                # both fields change together, a reader must see them equal
+                db.update_many({uid: {"a": k, "b": k} for uid in range(0, 20, 2)}, "pairs")
+                db.update(1 + 2 * (k % 10), {"a": k, "b": k}, "pairs")
+                db.add_one({"a": k, "b": k}, "pairs")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def read():
+        try:
+            while not done.is_set():
+                for uid, record in db.get_all("pairs").items():
+                    assert record["a"] == record["b"], (uid, record)
+                record = db.get_one(2, "pairs")
+                assert record["a"] == record["b"], record
+                value = record["a"]
+                for uid, found in db.find("a", value, "pairs").items():
+                    assert found["a"] == value and found["b"] == value, (uid, found)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    assert not errors, errors
+    assert len(db.get_all("pairs")) == 20 + ROUNDS - 1
+    assert db.find("a", ROUNDS - 1, "pairs").keys() >= set(range(0, 20, 2))
+
+
+def test_readers_share_the_lock_and_a_writer_waits_for_them():
+    lock = ReadWriteLock()
+    inside = threading.Barrier(2, timeout=5)
+    written = threading.Event()
+    release = threading.Event()
+
+    def reader():
+        with lock.read():
+            inside.wait() # both readers hold the lock at once
+            release.wait(5)
+
+    def writer():
+        with lock.write():
+            written.set()
+
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in readers:
+        thread.start()
+    writing = threading.Thread(target=writer)
+    writing.start()
+    assert not written.wait(0.2)
+    release.set()
+    for thread in readers + [writing]:
+        thread.join(5)
+    assert written.is_set()
+    assert lock.write_stats.contended >= 1
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+
+def all_pages(db, table_name, limit):
+    records, after_id = {}, None
+    while True:
+        page = db.get_page(limit, after_id, table_name)
+        records.update(page["data"])
+        after_id = page["next_after_id"]
+        if after_id is None:
+            return records
+
+
+def test_pages_of_a_table_without_auto_increment(open_db):
+    db = open_db()
+    db.create_database("pages", save="manual")
+    db.create_table("settings", auto_increment=False)
+    db.add_one({"theme": "dark"}, "settings")
+    assert db.get_page(10, table_name="settings") == {"data": {0: {"theme": "dark"}}, "next_after_id": None}
+    assert dict(db.iter_records(table_name="settings")) == db.get_all("settings")
+
+
+def test_pages_of_sparse_ids(open_db, tmp_path):
+    db = open_db()
+    db.create_database("pages", save="manual")
+    db.create_table("sparse")
+    db.close()
+    records = {3: {"n": 3}, 40: {"n": 40}, 10 ** 9: {"n": 10 ** 9}}
+    (tmp_path / "pages" / "sparse.json").write_text(json.dumps(records))
+
+    loaded = open_db()
+    loaded.load_data("pages", "sparse", save="manual")
+    assert all_pages(loaded, "sparse", 2) == records
+    assert loaded.get_page(2, 3, "sparse") == {"data": {40: {"n": 40}, 10 ** 9: {"n": 10 ** 9}}, "next_after_id": None}
+
+
+def test_pages_follow_writes_and_rollbacks(open_db):
+    db = open_db()
+    db.create_database("pages", save="manual")
+    db.create_table("users")
+    db.add_many([{"n": i} for i in range(1000)], "users")
+    db.delete_many(list(range(100, 900)), "users")
+    db.update(5, {"m": 1}, "users")
+    with pytest.raises(TypeError):
+        db.add_many([{"n": 1000}, "not a record"], "users")
+    db.add_one({"n": "last"}, "users")
+    assert all_pages(db, "users", 7) == db.get_all("users")
+    assert list(db.iter_records(950, "users")) == sorted((uid, record) for uid, record in db.get_all("users").items()
+                                                          if uid > 950)
+
+
+def test_scans_leave_the_hot_set_resident(open_db):
+    db = open_db()
+    db.create_database("spilled", save="manual")
+    # room for about four records
+    db.create_table("users", extension=".burp", memory_budget=2000)
+    db.add_many([{"n": i, "pad": "x" * 100} for i in range(50)], "users")
+    records = db.tables["users"].records
+    for uid in (1, 2, 3):
+        db.get_one(uid, "users")
+    hot, evictions = list(records._resident), records.stats.evictions
+
+    assert len(db.get_all("users")) == 50
+    assert [uid for uid, _ in db.iter_records(table_name="users")] == list(range(50))
+    assert len(db.get_page(50, table_name="users")["data"]) == 50
+    db.save_snapshot(force=True, table_name="users")
+    assert list(records._resident) == hot
+    assert records.stats.evictions == evictions
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+from utils.persist import DataPersistSettings
+
+
+@pytest.fixture
+def busy_thread():
+    """ A thread holding a lock while the pool starts, a forked worker would inherit it held """
+    lock, release = threading.Lock(), threading.Event()
+
+    def hold():
+        with lock:
+            release.wait(30)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+    yield lock
+    release.set()
+    thread.join()
+
+
+def test_encryption_workers_round_trip(open_db, busy_thread):
+    settings = DataPersistSettings(crypto_workers=2, parallel_min_records=10)
+    db = open_db(settings=settings)
+    db.create_database("parallel", save="manual")
+    # binary snapshots encrypt batches of records on the pool, JSON ones only past CHUNK_SIZE
+    db.create_table("users", extension=".burp", encrypt=True)
+    key = db.tables["users"].encryption_key
+    db.add_many([{"n": i} for i in range(500)], "users")
+    db.save_snapshot(force=True, table_name="users")
+    expected = db.get_all("users")
+    db.close()
+
+    loaded = open_db(settings=DataPersistSettings(crypto_workers=2, parallel_min_records=10))
+    loaded.load_data("parallel", "users", encrypt=True, key=key, save="manual")
+    assert loaded.get_all("users") == expected
+
+
+def test_shard_workers_round_trip(open_db, busy_thread):
+    settings = DataPersistSettings(shard_workers=2, parallel_min_records=10, parallel_min_bytes=1)
+    db = open_db(settings=settings)
+    db.create_database("sharded", save="manual")
+    db.create_table("users", shards=4)
+    db.add_many([{"n": i} for i in range(500)], "users")
+    db.save_snapshot(force=True, table_name="users")
+    expected = db.get_all("users")
+    db.close()
+
+    loaded = open_db(settings=DataPersistSettings(shard_workers=2, parallel_min_bytes=1))
+    loaded.load_data("sharded", "users", save="manual")
+    assert loaded.get_all("users") == expected
@@ -0,0 +1,82 @@
+import os
+
+from utils.filelock import FileLock
+from utils.replica import ReplicaFollower
+
+
+def flush(db):
+    for table in db.tables.values():
+        table.wal.flush()
+
+
+def test_replica_tails_the_log_across_a_truncate(open_db):
+    writer = open_db(role="writer")
+    writer.create_database("replicated", save="manual")
+    writer.create_table("users", extension=".burp")
+    writer.create_table("secrets", encrypt=True)
+    writer.add_many([{"n": i} for i in range(5)], "users")
+    writer.add_one({"s": 1}, "secrets")
+    flush(writer)
+    replica = open_db(role="replica")
+    follower = ReplicaFollower(lambda: replica, "replicated", {"secrets": writer.tables["secrets"].encryption_key})
+    follower.run_once()
+    assert replica.get_all("users") == writer.get_all("users")
+    assert replica.get_all("secrets") == writer.get_all("secrets")
+
+    writer.update(1, {"m": 2}, "users")
+    writer.delete(0, "users")
+    writer.add_one({"n": 99}, "users")
+    flush(writer)
+    # the snapshot truncates the log the replica is reading, the writes after it land in the new log
+    writer.save_snapshot(force=True, table_name="users")
+    writer.add_one({"n": 100}, "users")
+    flush(writer)
+    follower.run_once()
+    assert replica.get_all("users") == writer.get_all("users")
+    assert replica.tables["users"].seq == writer.tables["users"].seq
+
+    writer.save_snapshot(force=True, table_name="users")
+    writer.save_snapshot(force=True, table_name="users")
+    writer.update_many({1: {"m": 3}, 2: {"m": 4}}, "users")
+    flush(writer)
+    follower.run_once()
+    assert replica.get_all("users") == writer.get_all("users")
+
+
+def test_replica_answers_writes_and_lag_with_error_statuses(server, open_db, tmp_path):
+    from fastapi.testclient import TestClient
+
+    server.DATABASE = "replicated"
+    writer = open_db(role="writer", cur_dir=str(tmp_path / "utils"))
+    writer.create_database("replicated", save="manual")
+    writer.create_table("users")
+    writer.add_one({"n": 1}, "users")
+    flush(writer)
+    server.ROLE = "replica"
+    with TestClient(server.app) as client:
+        assert client.post("/addData?table=users", json={"n": 2}).status_code == 405
+        server.FOLLOWER.max_lag = -1 # every replica is too far behind
+        response = client.get("/getAll?table=users")
+        assert response.status_code == 503 and "Retry-After" in response.headers
+        assert client.get("/live").status_code == 200
+
+
+def test_auto_role_elects_one_writer(server, open_db, tmp_path):
+    from fastapi.testclient import TestClient
+
+    server.DATABASE = "replicated"
+    writer = open_db(role="writer", cur_dir=str(tmp_path / "utils"))
+    writer.create_database("replicated", save="manual")
+    writer.create_table("users")
+    flush(writer)
+    held = FileLock(os.path.join(str(tmp_path), "utils", "replicated", server.WRITER_LOCK), timeout=0).acquire()
+    try:
+        server.ROLE = "auto"
+        with TestClient(server.app):
+            assert server.ROLE == "replica"
+    finally:
+        held.release()
+    writer.close()
+    server.ROLE = "auto"
+    with TestClient(server.app):
+        assert server.ROLE == "writer"
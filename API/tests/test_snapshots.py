@@ -0,0 +1,87 @@
+import threading
+
+import pytest
+
+
+@pytest.mark.parametrize("encrypt", [False, True])
+def test_back_to_back_snapshots_keep_the_writes_between_them(open_db, encrypt):
+    db = open_db()
+    db.create_database("snapshots", save="manual")
+    db.create_table("users", encrypt=encrypt)
+    key = db.tables["users"].encryption_key
+    table = db.tables["users"]
+    gate = threading.Event()
+    db.jobs.submit("users", gate.wait) # holds the snapshot worker so the jobs queue up
+    try:
+        db.add_many([{"n": i} for i in range(100)], "users")
+        first = db.jobs.submit("users", db._write_snapshot, db._freeze_table(table))
+        db.add_many([{"n": i} for i in range(3)], "users")
+        second = db.jobs.submit("users", db._write_snapshot, db._freeze_table(table))
+        db.add_many([{"n": i} for i in range(2)], "users")
+        # a manual snapshot while one is pending joins it
+        assert db.submit_snapshot(True, "users") is second
+    finally:
+        gate.set()
+    first.wait()
+    second.wait()
+    db.close()
+
+    reloaded = open_db()
+    reloaded.load_data("snapshots", "users", encrypt=encrypt, key=key or "", save="manual")
+    assert len(reloaded.get_all("users")) == 105
+
+
+def test_snapshots_during_concurrent_writes(open_db):
+    db = open_db()
+    db.create_database("busy", save="manual")
+    db.create_table("users")
+    done = threading.Event()
+
+    def write():
+        try:
+            for i in range(2000):
+                db.add_one({"n": i}, "users")
+        finally:
+            done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    while not done.is_set():
+        db.save_snapshot(force=True, table_name="users")
+    writer.join()
+    db.save_snapshot(force=True, table_name="users")
+    db.add_one({"n": "after"}, "users")
+    expected = db.get_all("users")
+    db.close()
+
+    reloaded = open_db()
+    reloaded.load_data("busy", "users", save="manual")
+    assert reloaded.get_all("users") == expected
+    assert len(expected) == 2001
+
+
+def test_the_table_is_frozen_on_the_snapshot_worker(open_db, monkeypatch):
+    db = open_db()
+    db.create_database("frozen", save="manual")
+    db.create_table("users")
+    db.add_many([{"n": i} for i in range(10)], "users")
+    threads = []
+    freeze = db._freeze_table
+
+    def watch(table):
+        threads.append(threading.current_thread())
+        return freeze(table)
+
+    monkeypatch.setattr(db, "_freeze_table", watch)
+    gate = threading.Event()
+    db.jobs.submit("gate", gate.wait) # holds the single snapshot worker
+    try:
+        job = db.submit_snapshot(True, "users")
+        # queued behind the gate: nothing is frozen yet, the writes made until it runs are saved too
+        assert threads == []
+        db.add_one({"n": 10}, "users")
+    finally:
+        gate.set()
+    job.wait()
+    assert len(threads) == 1 and threads[0] is not threading.current_thread()
+    assert db.tables["users"].dirty_count == 0
@@ -0,0 +1,77 @@
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize("options", [{}, {"extension": ".burp"}, {"compression": "gzip"}, {"shards": 2}])
+def test_create_table_refuses_a_table_saved_by_another_process(open_db, options):
+    db = open_db()
+    db.create_database("saved", save="manual")
+    db.create_table("users", **options)
+    db.create_table("other")
+    db.add_one({"name": "a"}, "users")
+    db.save_snapshot(force=True, table_name="users")
+    db.add_one({"name": "b"}, "users")
+    db.close()
+
+    # a process that opened the database through another of its tables
+    fresh = open_db()
+    fresh.load_data("saved", "other", save="manual")
+    with pytest.raises(KeyError):
+        fresh.create_table("users")
+    fresh.load_data("saved", "users", save="manual")
+    assert fresh.get_all("users") == {0: {"name": "a"}, 1: {"name": "b"}}
+
+
+def test_a_deleted_table_can_be_created_again(open_db):
+    db = open_db()
+    db.create_database("saved", save="manual")
+    db.create_table("users")
+    db.add_one({"name": "a"}, "users")
+    db.delete_table("users")
+    db.create_table("users")
+    assert db.get_all("users") == {}
+
+
+def test_load_progress_is_reported_while_a_table_loads(open_db, monkeypatch):
+    from utils.persist import DataPersister
+
+    db = open_db()
+    db.create_database("progress", save="manual")
+    db.create_table("users")
+    db.add_many([{"n": i} for i in range(1000)], "users")
+    db.save_snapshot(force=True, table_name="users")
+    db.close()
+
+    loaded = open_db()
+    seen = []
+    replay_log = DataPersister.replay_log
+
+    def watch(persister, *args, **kwargs):
+        # the snapshot is read, the log is not replayed yet
+        seen.append(loaded.load_progress())
+        return replay_log(persister, *args, **kwargs)
+
+    monkeypatch.setattr(DataPersister, "replay_log", watch)
+    loaded.load_data("progress", "users", save="manual")
+    progress = seen[0]["users"]
+    assert progress["records"] == 1000
+    assert progress["bytes_read"] == progress["total_bytes"] > 0
+    assert loaded.load_progress() == {}
+
+
+def test_column_sizes_are_kept_on_write(open_db):
+    db = open_db()
+    db.create_database("columns", save="manual")
+    db.create_table("users", schema={"name": "str", "tags": "object"})
+    db.add_many([{"name": f"user {i % 5}", "tags": ["x"] * i} for i in range(20)], "users")
+    db.update(3, {"name": "renamed", "tags": {"a": 1}}, "users")
+    db.update(4, {"tags": None}, "users")
+    db.delete(5, "users")
+    db.delete(0, "users")
+    records = db.tables["users"].records
+    names, tags = records.columns["name"], records.columns["tags"]
+    # the running counts match a full walk of the column
+    assert names.dictionary.string_bytes == sum(sys.getsizeof(value) for value in names.dictionary.values if value is not None)
+    assert tags.object_bytes == sum(sys.getsizeof(value) for value in tags.values if value is not None)
+    assert tags.copy().object_bytes == tags.object_bytes
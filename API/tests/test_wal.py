@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# writes, then dies without closing the table or flushing the log
+CRASH = textwrap.dedent("""
+    import os, sys, time
+    from utils.main import Burp
+    db = Burp(cur_dir=sys.argv[1])
+    db.create_database("crash", save="manual")
+    db.create_table("users")
+    db.add_one({"name": "a"}, "users")
+    db.add_many([{"name": "b"}, {"name": "c"}], "users")
+    db.update(0, {"age": 30}, "users")
+    db.delete(1, "users")
+    # longer than group_commit_interval, the buffered group reaches the log on its own
+    time.sleep(0.5)
+    os._exit(1)
+""")
+
+
+def test_replays_the_log_after_a_crash(tmp_path, open_db):
+    crashed = subprocess.run([sys.executable, "-c", CRASH, str(tmp_path)], cwd=API_DIR, timeout=60)
+    assert crashed.returncode == 1
+
+    db = open_db()
+    db.load_data("crash", "users", save="manual")
+    assert db.get_all("users") == {0: {"name": "a", "age": 30}, 2: {"name": "c"}}
+    assert db.add_one({"name": "d"}, "users") == 3
+
+
+def test_closing_stops_the_flusher(tmp_path, open_db):
+    db = open_db()
+    db.create_database("flusher", save="manual")
+    db.create_table("users")
+    flusher = db.tables["users"].wal._flusher
+    assert flusher is not None and flusher.is_alive()
+    db.close()
+    assert not flusher.is_alive()
+
+
+class FailingLog:
+    """ Log whose appends fail, like a full disk """
+
+    def __init__(self, wal):
+        self.wal = wal
+        self.seq = wal.seq
+
+    def append(self, *args, **kwargs):
+        raise OSError("No space left on device")
+
+    def append_batch(self, *args, **kwargs):
+        raise OSError("No space left on device")
+
+    def __getattr__(self, name):
+        return getattr(self.wal, name)
+
+
+def test_a_write_the_log_refuses_is_undone(open_db):
+    db = open_db()
+    db.create_database("full", save="manual")
+    db.create_table("users")
+    db.add_many([{"name": "a"}, {"name": "b"}], "users")
+    db.create_index("users", "name")
+    db.update(1, {"name": "b"}, "users", ttl=3600)
+    table = db.tables["users"]
+    before, deadline = db.get_all("users"), table.expiry.get(1)
+    wal, table.wal = table.wal, FailingLog(table.wal)
+    try:
+        for write in (lambda: db.add_one({"name": "c"}, "users"),
+                      lambda: db.update(0, {"name": "z"}, "users", ttl=10),
+                      lambda: db.update(1, {"name": "z"}, "users"),
+                      lambda: db.delete(1, "users")):
+            with pytest.raises(OSError):
+                write()
+            assert db.get_all("users") == before
+            assert table.auto_inc_id == 2
+            assert table.expiry.get(0) is None and table.expiry.get(1) == deadline
+            assert db.find("name", "z", "users") == {} and db.find("name", "c", "users") == {}
+            assert db.find("name", "b", "users") == {1: {"name": "b"}}
+            assert db.get_page(10, table_name="users")["data"] == before
+    finally:
+        table.wal = wal
+    assert db.add_one({"name": "c"}, "users") == 2
@@ -0,0 +1,341 @@
+"""
+Binary snapshot format
+
+    header  : MAGIC (8 bytes) | flags (u32) | reserved (u32)
+    records : length (u32) | crc32 (u32) | payload, one per record
+    index   : count (u64) | ids (count x i64, ascending) | offsets (count x u64)
+    trailer : index offset (u64) | INDEX_MAGIC (8 bytes)
+
+The payload is the serialized record, Fernet encrypted on its own when the
+FLAG_ENCRYPTED bit is set. Opening a snapshot only reads the header, the trailer
+and the index, so a single record can be served without parsing the others, and
+a new snapshot copies the payloads of unchanged records from the previous one.
+"""
+import os
+import sys
+import mmap
+import struct
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import (
+    Dict,
+    Iterator,
+    Optional,
+    Set,
+    Tuple
+)
+from cryptography.fernet import Fernet
+from .serializers import get_serializer
+from .filelock import FileLock, publish, temp_path, write_atomic
+from .compression import decompress
+from .generator import encrypt_chunks, decrypt_data, encrypt_batches, decrypt_batches
+
+MAGIC = b"BURPSNP1"
+INDEX_MAGIC = b"BURPIDX1"
+FLAG_ENCRYPTED = 1
+BINARY_EXTENSION = ".burp"
+WRITE_BATCH_SIZE = 4096 # records serialized and encrypted together, the unit handed to a worker process
+
+_HEADER = struct.Struct("<8sII")
+_RECORD = struct.Struct("<II")
+_COUNT = struct.Struct("<Q")
+_TRAILER = struct.Struct("<Q8s")
+
+
+class SnapshotFormatError(ValueError):
+    """ The file is not a valid binary snapshot """
+
+
+def write_binary_snapshot(filepath: str, data: Dict[int, dict], serializer=None,
+                          fernet_instance: Optional[Fernet] = None, changed_ids: Optional[Set[int]] = None,
+                          workers: int = 1, lock: Optional[FileLock] = None) -> str:
+    """ Write a table as a binary snapshot, the file is replaced atomically
+
+    Args:
+        filepath (str): destination file
+        data (dict): table keyed by int ids
+        serializer (optional): record encoder, see serializers.get_serializer. Defaults to None.
+        fernet_instance (Fernet, optional): encrypts every record on its own. Defaults to None.
+        changed_ids (set, optional): ids written or deleted since the snapshot at filepath was saved.
+            When given, the stored bytes of the other records are copied from that snapshot
+            instead of being serialized and encrypted again. Defaults to None.
+        workers (int, optional): processes encrypting the records, see generator.encrypt_batches. Defaults to 1.
+        lock (FileLock, optional): exclusive lock on filepath, only held to replace it. Defaults to None.
+
+    Raises:
+        FileLockTimeout: The lock was not acquired, filepath is unchanged
+
+    Returns:
+        str: the file path
+    """
+    serializer = serializer or get_serializer()
+    ids = array("q", sorted(data))
+    offsets = array("Q")
+    previous = _open_previous(filepath, serializer, fernet_instance) if changed_ids is not None else None
+    tmp_path = temp_path(filepath)
+    try:
+        with open(tmp_path, "wb") as snapshot_file:
+            flags = FLAG_ENCRYPTED if fernet_instance is not None else 0
+            snapshot_file.write(_HEADER.pack(MAGIC, flags, 0))
+            offset = _HEADER.size
+            for payloads in _record_payloads(ids, data, serializer, fernet_instance, previous, changed_ids, workers):
+                for payload in payloads:
+                    offsets.append(offset)
+                    snapshot_file.write(_RECORD.pack(len(payload), zlib.crc32(payload)))
+                    snapshot_file.write(payload)
+                    offset += _RECORD.size + len(payload)
+            snapshot_file.write(_COUNT.pack(len(ids)))
+            if sys.byteorder != "little":
+                ids.byteswap()
+                offsets.byteswap()
+            snapshot_file.write(ids.tobytes())
+            snapshot_file.write(offsets.tobytes())
+            snapshot_file.write(_TRAILER.pack(offset, INDEX_MAGIC))
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        if previous is not None:
+            previous.close()
+    try:
+        publish(tmp_path, filepath, lock)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filepath
+
+
+def _open_previous(filepath: str, serializer, fernet_instance: Optional[Fernet]):
+    """ The snapshot a new one can copy records from, None when there is none or it is not compatible """
+    if not os.path.exists(filepath):
+        return None
+    try:
+        snapshot = BinarySnapshot(filepath, serializer, fernet_instance, use_mmap=True)
+    except (SnapshotFormatError, ValueError):
+        return None
+    if snapshot.encrypted != (fernet_instance is not None):
+        snapshot.close()
+        return None
+    return snapshot
+
+
+def _record_payloads(ids, data, serializer, fernet_instance, previous, changed_ids, workers) -> Iterator[list]:
+    """ Stored payloads of the records in id order, one list per batch of WRITE_BATCH_SIZE ids.
+    Unchanged records are copied from the previous snapshot, the others are serialized and encrypted.
+    """
+    def batches():
+        for start in range(0, len(ids), WRITE_BATCH_SIZE):
+            batch_ids = ids[start:start + WRITE_BATCH_SIZE]
+            payloads = [None] * len(batch_ids)
+            if previous is not None:
+                for i, uid in enumerate(batch_ids):
+                    if uid not in changed_ids:
+                        payloads[i] = previous.raw(uid)
+            fresh = [i for i, payload in enumerate(payloads) if payload is None]
+            yield (payloads, fresh), [serializer.dumps(data[batch_ids[i]]) for i in fresh]
+
+    if fernet_instance is None:
+        encoded = batches()
+    else:
+        encoded = encrypt_batches(fernet_instance, batches(), workers)
+    for (payloads, fresh), fresh_payloads in encoded:
+        for i, payload in zip(fresh, fresh_payloads):
+            payloads[i] = payload
+        yield payloads
+
+
+def is_binary_snapshot(filepath: str) -> bool:
+    """ Whether the file starts with the binary snapshot magic """
+    with open(filepath, "rb") as snapshot_file:
+        return snapshot_file.read(len(MAGIC)) == MAGIC
+
+
+class BinarySnapshot:
+    """
+    Read access to a binary snapshot. Only the id -> offset index is held in memory,
+    records are read and decoded one at a time.
+
+    With use_mmap the file is memory mapped: the index is a zero copy view of the
+    mapping, so opening costs the same whatever the table size, and reads are
+    slices of the mapping, safe to run from several threads at once.
+    """
+
+    def __init__(self, filepath: str, serializer=None, fernet_instance: Optional[Fernet] = None,
+                 use_mmap: bool = False):
+        """
+        Raises:
+            SnapshotFormatError: Bad magic, truncated file or inconsistent index
+            ValueError: The snapshot is encrypted and no fernet instance was given
+        """
+        self.filepath = filepath
+        self.serializer = serializer or get_serializer()
+        self.fernet_instance = fernet_instance
+        self._file = open(filepath, "rb")
+        self._map = None
+        self._views = []
+        try:
+            if use_mmap:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _read(self, offset: int, size: int) -> bytes:
+        if self._map is not None:
+            return self._map[offset:offset + size]
+        self._file.seek(offset)
+        return self._file.read(size)
+
+    def _read_array(self, typecode: str, offset: int, count: int):
+        if self._map is not None and sys.byteorder == "little":
+            base = memoryview(self._map)
+            window = base[offset:offset + count * 8]
+            view = window.cast(typecode)
+            # released in reverse order by close, the mapping cannot close while views are exported
+            self._views.extend((base, window, view))
+            return view
+        values = array(typecode)
+        values.frombytes(self._read(offset, count * 8))
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    def _read_index(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size < _HEADER.size + _COUNT.size + _TRAILER.size:
+            raise SnapshotFormatError(f"{self.filepath} is too small to be a binary snapshot")
+        magic, flags, _ = _HEADER.unpack(self._read(0, _HEADER.size))
+        if magic != MAGIC:
+            raise SnapshotFormatError(f"{self.filepath} is not a binary snapshot")
+        self.encrypted = bool(flags & FLAG_ENCRYPTED)
+        if self.encrypted and self.fernet_instance is None:
+            raise ValueError(f"{self.filepath} is encrypted, a key is required")
+        index_offset, index_magic = _TRAILER.unpack(self._read(size - _TRAILER.size, _TRAILER.size))
+        if index_magic != INDEX_MAGIC or not _HEADER.size <= index_offset <= size - _TRAILER.size - _COUNT.size:
+            raise SnapshotFormatError(f"{self.filepath} has a corrupt trailer")
+        (count,) = _COUNT.unpack(self._read(index_offset, _COUNT.size))
+        if index_offset + _COUNT.size + count * 16 + _TRAILER.size != size:
+            raise SnapshotFormatError(f"{self.filepath} has a corrupt index")
+        ids_offset = index_offset + _COUNT.size
+        self.ids = self._read_array("q", ids_offset, count)
+        self.offsets = self._read_array("Q", ids_offset + count * 8, count)
+        self.index_offset = index_offset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, uid: int):
+        return self._position(uid) is not None
+
+    def _position(self, uid: int):
+        pos = bisect_left(self.ids, uid)
+        if pos < len(self.ids) and self.ids[pos] == uid:
+            return pos
+        return None
+
+    def max_id(self):
+        return self.ids[-1] if self.ids else None
+
+    def _read_payload(self, offset: int) -> bytes:
+        length, crc = _RECORD.unpack(self._read(offset, _RECORD.size))
+        payload = self._read(offset + _RECORD.size, length)
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            raise SnapshotFormatError(f"Corrupt record at offset {offset} of {self.filepath}")
+        return payload
+
+    def _read_at(self, offset: int) -> dict:
+        payload = self._read_payload(offset)
+        if self.encrypted:
+            payload = self.fernet_instance.decrypt(payload)
+        return self.serializer.loads(payload)
+
+    def get(self, uid: int) -> Optional[dict]:
+        """ Read and decode one record, None when the id is not in the snapshot """
+        pos = self._position(uid)
+        if pos is None:
+            return None
+        return self._read_at(self.offsets[pos])
+
+    def raw(self, uid: int) -> Optional[bytes]:
+        """ The stored payload of a record, still encrypted, None when the id is not in the snapshot """
+        pos = self._position(uid)
+        if pos is None:
+            return None
+        return self._read_payload(self.offsets[pos])
+
+    def items(self, workers: int = 1) -> Iterator[Tuple[int, dict]]:
+        """ Yield (id, record) pairs in id order
+
+        Args:
+            workers (int, optional): processes decrypting the records of an encrypted snapshot. Defaults to 1.
+        """
+        if not self.encrypted or workers <= 1:
+            for uid, offset in zip(self.ids, self.offsets):
+                yield uid, self._read_at(offset)
+            return
+        batches = ((self.ids[start:start + WRITE_BATCH_SIZE].tolist(),
+                    [self._read_payload(offset) for offset in self.offsets[start:start + WRITE_BATCH_SIZE]])
+                   for start in range(0, len(self.ids), WRITE_BATCH_SIZE))
+        for batch_ids, payloads in decrypt_batches(self.fernet_instance, batches, workers):
+            for uid, payload in zip(batch_ids, payloads):
+                yield uid, self.serializer.loads(payload)
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_snapshot(src: str, dst: str, serializer=None, fernet_instance: Optional[Fernet] = None) -> str:
+    """ Convert a table snapshot between the JSON and the binary format.
+    The direction follows the source file: binary snapshots become JSON and JSON snapshots, compressed or not, become binary.
+
+    Args:
+        src (str): existing snapshot
+        dst (str): file to write
+        serializer (optional): see serializers.get_serializer. Defaults to None.
+        fernet_instance (Fernet, optional): key of an encrypted table, the output stays encrypted. Defaults to None.
+
+    Returns:
+        str: the destination path
+    """
+    serializer = serializer or get_serializer()
+    if is_binary_snapshot(src):
+        with BinarySnapshot(src, serializer, fernet_instance) as snapshot:
+            data = dict(snapshot.items())
+        if fernet_instance is not None:
+            payload = b"\n".join(encrypt_chunks(fernet_instance, data, serializer))
+        else:
+            payload = serializer.dumps(data)
+        return write_atomic(dst, [payload])
+    with open(src, "rb") as json_file:
+        payload = json_file.read()
+    if fernet_instance is not None:
+        data = decrypt_data(fernet_instance, payload, serializer)
+    else:
+        data = serializer.loads(decompress(payload))
+    return write_binary_snapshot(dst, {int(uid): record for uid, record in data.items()}, serializer, fernet_instance)
+
+
+if __name__ == "__main__":
+    # python -m utils.binary SRC DST [KEY]
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python -m utils.binary SRC DST [KEY]")
+    key = Fernet(sys.argv[3]) if len(sys.argv) == 4 else None
+    print(convert_snapshot(sys.argv[1], sys.argv[2], fernet_instance=key))
@@ -0,0 +1,303 @@
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import (
+    Dict,
+    Iterator,
+    Optional
+)
+from cryptography.fernet import Fernet
+from .serializers import get_serializer
+
+CACHE_POLICIES = ("lru", "clock")
+COMPACT_MIN_BYTES = 1 << 26 # dead bytes in a spill file before it is worth rewriting
+
+
+def record_size(record: dict) -> int:
+    """ Approximate bytes held by a record: the dict, its keys and its top level values """
+    size = sys.getsizeof(record)
+    for key, value in record.items():
+        size += sys.getsizeof(key) + sys.getsizeof(value)
+    return size
+
+
+class CacheStats:
+    """ Counters of a SpillTable """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0 # reads served from the spill file
+        self.evictions = 0
+        self.spilled_bytes = 0 # written to the spill file
+        self.compactions = 0
+
+    def to_dict(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "spilled_bytes": self.spilled_bytes,
+            "compactions": self.compactions,
+        }
+
+
+class SpillFile:
+    """
+    Append only file of serialized records. It is unlinked as soon as it is created,
+    the space is given back when the last table or view using it lets it go.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self._lock = threading.Lock()
+        self.size = 0
+
+    def append(self, payload: bytes) -> int:
+        """ Write a payload at the end of the file and return its offset """
+        with self._lock:
+            offset = self.size
+            self._file.seek(offset)
+            self._file.write(payload)
+            self.size += len(payload)
+            return offset
+
+    def read(self, offset: int, length: int) -> bytes:
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def close(self):
+        self._file.close()
+
+
+class SpillTable(MutableMapping):
+    """
+    Table that keeps at most `budget` bytes of records in memory and spills the cold ones to disk.
+
+    Resident records are evicted in least recently used order ("lru"), or with the
+    second chance CLOCK policy ("clock") where a read only sets a reference bit instead of
+    reordering the records. An evicted record is serialized to the spill file, once: the copy
+    stays valid until the record is written again, so a record read back and evicted
+    once more costs nothing. A miss reads the record back and makes it resident again.
+
+    Records must be replaced, never mutated in place, or the change can be lost when the
+    record is evicted. Encrypted tables spill encrypted records.
+    """
+
+    def __init__(self, budget: int, policy: str = "lru", serializer=None,
+                 fernet_instance: Optional[Fernet] = None, directory: Optional[str] = None):
+        """
+        Args:
+            budget (int): bytes of records kept in memory, see record_size
+            policy (str, optional): one of CACHE_POLICIES. Defaults to "lru".
+            serializer (optional): encodes the spilled records, see serializers.get_serializer. Defaults to None.
+            fernet_instance (Fernet, optional): encrypts the spilled records. Defaults to None.
+            directory (str, optional): where the spill file is created. Defaults to the system temp directory.
+
+        Raises:
+            ValueError: Unknown policy or a budget that is not positive
+        """
+        if policy not in CACHE_POLICIES:
+            raise ValueError(f"Cache policy must be one of {CACHE_POLICIES}, got {policy}")
+        if budget <= 0:
+            raise ValueError("The memory budget must be positive")
+        self.budget = budget
+        self.policy = policy
+        self.serializer = serializer or get_serializer()
+        self.fernet_instance = fernet_instance
+        self.directory = directory
+        self.stats = CacheStats()
+        self.resident_bytes = 0
+        self._resident = OrderedDict() # id -> record, coldest first
+        self._sizes = {} # id -> record_size of the resident records
+        self._referenced = set() # CLOCK reference bits
+        self._spilled = {} # id -> (offset, length) of the valid copies in the spill file
+        self._spill = None # created on the first eviction
+        self._garbage = 0 # spill file bytes of records written or deleted since they were spilled
+        self._len = 0
+        self.admit = True # False for frozen views, reads then never make records resident
+        self._lock = threading.RLock()
+
+    def _encode(self, record: dict) -> bytes:
+        payload = self.serializer.dumps(record)
+        if self.fernet_instance is not None:
+            payload = self.fernet_instance.encrypt(payload)
+        return payload
+
+    def _read_spilled(self, uid: int) -> dict:
+        offset, length = self._spilled[uid]
+        payload = self._spill.read(offset, length)
+        if self.fernet_instance is not None:
+            payload = self.fernet_instance.decrypt(payload)
+        return self.serializer.loads(payload)
+
+    def _touch(self, uid: int):
+        if self.policy == "lru":
+            self._resident.move_to_end(uid)
+        else:
+            self._referenced.add(uid)
+
+    def _admit(self, uid: int, record: dict):
+        """ Make a record resident, then evict until the budget holds """
+        self._resident[uid] = record
+        self._resident.move_to_end(uid)
+        size = record_size(record)
+        self._sizes[uid] = size
+        self.resident_bytes += size
+        self._evict()
+
+    def _evict(self):
+        # the record just admitted is the last candidate, a single record over budget stays resident
+        while self.resident_bytes > self.budget and len(self._resident) > 1:
+            uid, record = self._resident.popitem(last=False)
+            if uid in self._referenced:
+                # second chance
+                self._referenced.discard(uid)
+                self._resident[uid] = record
+                continue
+            self.resident_bytes -= self._sizes.pop(uid)
+            if uid not in self._spilled:
+                payload = self._encode(record)
+                if self._spill is None:
+                    self._spill = SpillFile(self.directory)
+                self._spilled[uid] = (self._spill.append(payload), len(payload))
+                self.stats.spilled_bytes += len(payload)
+            self.stats.evictions += 1
+
+    def _forget_spilled(self, uid: int):
+        location = self._spilled.pop(uid, None)
+        if location is not None:
+            self._garbage += location[1]
+
+    def _drop_resident(self, uid: int):
+        if self._resident.pop(uid, None) is not None:
+            self.resident_bytes -= self._sizes.pop(uid)
+            self._referenced.discard(uid)
+
+    def __contains__(self, uid) -> bool:
+        return uid in self._resident or uid in self._spilled
+
+    def peek(self, uid: int, default=None):
+        """ Read a record for a scan: a spilled record is read back without being made resident,
+        and a resident one is not touched, so scanning the table leaves the hot set in place
+        """
+        with self._lock:
+            record = self._resident.get(uid)
+            if record is not None:
+                return record
+            if uid not in self._spilled:
+                return default
+            return self._read_spilled(uid)
+
+    def get(self, uid: int, default=None):
+        if not self.admit:
+            return self.peek(uid, default)
+        with self._lock:
+            record = self._resident.get(uid)
+            if record is not None:
+                self.stats.hits += 1
+                self._touch(uid)
+                return record
+            if uid not in self._spilled:
+                return default
+            self.stats.misses += 1
+            record = self._read_spilled(uid)
+            self._admit(uid, record)
+            return record
+
+    def __getitem__(self, uid: int) -> dict:
+        record = self.get(uid)
+        if record is None:
+            raise KeyError(uid)
+        return record
+
+    def __setitem__(self, uid: int, record: dict):
+        with self._lock:
+            if uid not in self:
+                self._len += 1
+            self._forget_spilled(uid)
+            self._drop_resident(uid)
+            self._admit(uid, record)
+            self._maybe_compact()
+
+    def __delitem__(self, uid: int):
+        with self._lock:
+            if uid not in self:
+                raise KeyError(uid)
+            self._forget_spilled(uid)
+            self._drop_resident(uid)
+            self._len -= 1
+            self._maybe_compact()
+
+    def _ids(self):
+        with self._lock:
+            return list(self._resident) + [uid for uid in self._spilled if uid not in self._resident]
+
+    def __iter__(self) -> Iterator[int]:
+        """ Ids at the time of the call, resident ones first """
+        return iter(self._ids())
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self):
+        """ (id, record) pairs without making the spilled records resident, see peek """
+        for uid in self._ids():
+            record = self.peek(uid)
+            if record is not None:
+                yield uid, record
+
+    def _maybe_compact(self):
+        """ Rewrite the live spilled records to a new file once most of the old one is dead """
+        if self._spill is None or self._garbage < COMPACT_MIN_BYTES or self._garbage * 2 < self._spill.size:
+            return
+        spill = SpillFile(self.directory)
+        spilled = {}
+        for uid, (offset, length) in self._spilled.items():
+            spilled[uid] = (spill.append(self._spill.read(offset, length)), length)
+        # frozen views keep reading the old file, it is closed when the last of them is gone
+        self._spill, self._spilled, self._garbage = spill, spilled, 0
+        self.stats.compactions += 1
+
+    def frozen(self):
+        """ Point in time view for snapshots: copies the resident records and the spill index,
+        shares the spill file which is only ever appended to, and never admits nor evicts:
+        the snapshot writer reading every record holds no more than the resident ones
+        """
+        with self._lock:
+            view = SpillTable(self.budget, self.policy, self.serializer, self.fernet_instance, self.directory)
+            view._spill = self._spill
+            view.budget = float("inf")
+            view.admit = False
+            view._resident = OrderedDict(self._resident)
+            view._sizes = dict(self._sizes)
+            view.resident_bytes = self.resident_bytes
+            view._spilled = dict(self._spilled)
+            view._len = self._len
+            return view
+
+    def to_dict(self) -> Dict[int, dict]:
+        return dict(self.items())
+
+    def cache_stats(self) -> Dict:
+        """ Counters, budget and occupancy in bytes """
+        with self._lock:
+            stats = self.stats.to_dict()
+            stats.update({
+                "policy": self.policy,
+                "budget": self.budget,
+                "resident_bytes": self.resident_bytes,
+                "resident_records": len(self._resident),
+                "spilled_records": len(self._spilled),
+                "spill_file_bytes": self._spill.size if self._spill is not None else 0,
+                "records": self._len,
+            })
+            return stats
+
+    def close(self):
+        if self._spill is not None:
+            self._spill.close()
@@ -0,0 +1,362 @@
+import sys
+import threading
+from array import array
+from collections.abc import MutableMapping
+from typing import (
+    Any,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple
+)
+
+COLUMN_TYPES = ("int", "float", "bool", "str", "object")
+_TYPECODES = {"int": "q", "float": "d", "bool": "b", "str": "i"} # "str" stores dictionary codes
+_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)] # set bits of every byte
+
+
+class Bitmap:
+    """ Growable bit set over row numbers """
+
+    def __init__(self, data: Optional[bytearray] = None):
+        self.data = data if data is not None else bytearray()
+
+    def get(self, row: int) -> bool:
+        byte = row >> 3
+        return byte < len(self.data) and bool(self.data[byte] & (1 << (row & 7)))
+
+    def set(self, row: int):
+        byte = row >> 3
+        if byte >= len(self.data):
+            self.data.extend(bytes(byte + 1 - len(self.data)))
+        self.data[byte] |= 1 << (row & 7)
+
+    def clear(self, row: int):
+        byte = row >> 3
+        if byte < len(self.data):
+            self.data[byte] &= ~(1 << (row & 7)) & 0xFF
+
+    def rows(self) -> List[int]:
+        """ Set rows in ascending order, empty bytes are skipped whole """
+        return [byte << 3 | bit for byte, bits in enumerate(self.data) if bits for bit in _BITS[bits]]
+
+    def copy(self):
+        return Bitmap(bytearray(self.data))
+
+    def intersection(self, other):
+        """ Rows set in both bitmaps """
+        size = min(len(self.data), len(other.data))
+        both = int.from_bytes(self.data[:size], "little") & int.from_bytes(other.data[:size], "little")
+        return Bitmap(bytearray(both.to_bytes(size, "little")))
+
+
+class StringDictionary:
+    """
+    Distinct strings of a column, each stored once and referred to by its code.
+    Every code counts the rows holding it. Once no row does, the string is dropped and its code
+    is handed out again, so rewritten or high cardinality text does not pile up.
+    Codes are reused, a frozen view gets a copy of the dictionary.
+    """
+
+    def __init__(self):
+        self.values: List[Optional[str]] = [] # code -> string, None for a free code
+        self.codes: Dict[str, int] = {}
+        self.counts: List[int] = [] # code -> rows holding it
+        self.free: List[int] = []
+        self.string_bytes = 0 # getsizeof of the strings held, kept on write so measuring is O(1)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def encode(self, value: str) -> int:
+        """ Code of a string, counting one more row holding it """
+        code = self.codes.get(value)
+        if code is None:
+            value = sys.intern(value)
+            if self.free:
+                code = self.free.pop()
+                self.values[code] = value
+            else:
+                code = len(self.values)
+                self.values.append(value)
+                self.counts.append(0)
+            self.codes[value] = code
+            self.string_bytes += sys.getsizeof(value)
+        self.counts[code] += 1
+        return code
+
+    def release(self, code: int):
+        """ One row less holds the code, the string is dropped with the last one """
+        self.counts[code] -= 1
+        if self.counts[code] == 0:
+            value = self.values[code]
+            del self.codes[value]
+            self.string_bytes -= sys.getsizeof(value)
+            self.values[code] = None
+            self.free.append(code)
+
+    def copy(self):
+        dictionary = StringDictionary.__new__(StringDictionary)
+        dictionary.values = self.values[:]
+        dictionary.codes = dict(self.codes)
+        dictionary.counts = self.counts[:]
+        dictionary.free = self.free[:]
+        dictionary.string_bytes = self.string_bytes
+        return dictionary
+
+
+class Column:
+    """
+    Values of one field indexed by row. Numbers and booleans live in typed arrays,
+    strings are dictionary encoded and "object" keeps any JSON value as is.
+    A presence bitmap tells a stored value from a missing one.
+    """
+
+    def __init__(self, kind: str):
+        """
+        Raises:
+            ValueError: kind is not one of COLUMN_TYPES
+        """
+        if kind not in COLUMN_TYPES:
+            raise ValueError(f"Column type must be one of {COLUMN_TYPES}, got {kind}")
+        self.kind = kind
+        self.values = array(_TYPECODES[kind]) if kind in _TYPECODES else []
+        self.dictionary = StringDictionary() if kind == "str" else None
+        self.present = Bitmap()
+        self.object_bytes = 0 # getsizeof of the values of an "object" column, kept on write
+
+    def check(self, field: str, value: Any):
+        """
+        Raises:
+            ValueError: The value does not fit the column type
+        """
+        if value is None or self.kind == "object":
+            return
+        kind = self.kind
+        if kind == "bool":
+            valid = type(value) is bool
+        elif kind == "int":
+            valid = type(value) is int and -(1 << 63) <= value < (1 << 63)
+        elif kind == "float":
+            valid = type(value) in (int, float)
+        else:
+            valid = type(value) is str
+        if not valid:
+            raise ValueError(f"The field {field} holds {kind} values, got {value!r}")
+
+    def _grow(self, rows: int):
+        missing = rows - len(self.values)
+        if missing > 0:
+            if self.kind == "object":
+                self.values.extend([None] * missing)
+            else:
+                self.values.frombytes(bytes(missing * self.values.itemsize))
+
+    def set(self, row: int, value: Any):
+        """ Store a value checked with check, None clears the row """
+        if value is None:
+            self.clear(row)
+            return
+        self._grow(row + 1)
+        if self.dictionary is not None:
+            # the new string is counted before the old one is released, rewriting the same string keeps its code
+            code = self.dictionary.encode(value)
+            if self.present.get(row):
+                self.dictionary.release(self.values[row])
+            value = code
+        elif self.kind == "object":
+            if self.present.get(row):
+                self.object_bytes -= sys.getsizeof(self.values[row])
+            self.object_bytes += sys.getsizeof(value)
+        self.values[row] = value
+        self.present.set(row)
+
+    def clear(self, row: int):
+        if self.present.get(row):
+            if self.dictionary is not None:
+                self.dictionary.release(self.values[row])
+            elif self.kind == "object":
+                self.object_bytes -= sys.getsizeof(self.values[row])
+        self.present.clear(row)
+        if self.kind == "object" and row < len(self.values):
+            self.values[row] = None
+
+    def get(self, row: int) -> Any:
+        value = self.values[row]
+        if self.dictionary is not None:
+            return self.dictionary.values[value]
+        if self.kind == "bool":
+            return bool(value)
+        return value
+
+    def copy(self):
+        column = Column.__new__(Column)
+        column.kind = self.kind
+        column.values = self.values[:]
+        column.dictionary = self.dictionary.copy() if self.dictionary is not None else None
+        column.present = self.present.copy()
+        column.object_bytes = self.object_bytes
+        return column
+
+    def memory_bytes(self) -> int:
+        """ Approximate bytes held by the column, O(1): the string and object sizes are kept on write """
+        size = sys.getsizeof(self.values) + len(self.present.data)
+        if self.dictionary is not None:
+            size += self.dictionary.string_bytes + sys.getsizeof(self.dictionary.codes)
+        return size + self.object_bytes
+
+
+def check_schema(schema: Dict[str, str]) -> Dict[str, str]:
+    """ Validate a schema of field name -> column type
+
+    Raises:
+        ValueError: Empty schema, a field name that is not a string or an unknown column type
+    """
+    if not isinstance(schema, dict) or not schema:
+        raise ValueError("A schema maps field names to column types")
+    for field, kind in schema.items():
+        if not isinstance(field, str):
+            raise ValueError(f"Field names must be strings, got {field!r}")
+        if kind not in COLUMN_TYPES:
+            raise ValueError(f"The type of {field} must be one of {COLUMN_TYPES}, got {kind!r}")
+    return dict(schema)
+
+
+class ColumnarTable(MutableMapping):
+    """
+    Table of a declared schema stored column by column.
+
+    The row of a record is its id, ids are handed out in order so the columns stay dense.
+    A validity bitmap marks the live rows, deleting a record only clears its bit.
+    Reads rebuild a dict on demand: it is a copy, changing it does not change the table.
+    A field missing from a record, or set to None, is not stored and is left out of the rebuilt record.
+    """
+
+    def __init__(self, schema: Dict[str, str]):
+        """
+        Args:
+            schema (dict): field name -> one of COLUMN_TYPES
+
+        Raises:
+            ValueError: Not a valid schema, see check_schema
+        """
+        self.schema = check_schema(schema)
+        self.columns = {field: Column(kind) for field, kind in self.schema.items()}
+        self.valid = Bitmap()
+        self._len = 0
+        # a reader never sees a record half written
+        self._lock = threading.Lock()
+
+    def check(self, record: dict):
+        """ Raise ValueError when a record does not fit the schema
+
+        Raises:
+            ValueError: Not a dict, an undeclared field or a value of the wrong type
+        """
+        if not isinstance(record, dict):
+            raise ValueError(f"Records of a table with a schema are objects, got {record!r}")
+        for field, value in record.items():
+            column = self.columns.get(field)
+            if column is None:
+                raise ValueError(f"The field {field} is not in the table schema")
+            column.check(field, value)
+
+    def _record(self, uid: int) -> dict:
+        byte, mask = uid >> 3, 1 << (uid & 7)
+        record = {}
+        for field, column in self.columns.items():
+            present = column.present.data
+            if byte < len(present) and present[byte] & mask:
+                record[field] = column.get(uid)
+        return record
+
+    def get(self, uid: int, default=None):
+        with self._lock:
+            if not isinstance(uid, int) or uid < 0 or not self.valid.get(uid):
+                return default
+            return self._record(uid)
+
+    def __getitem__(self, uid: int) -> dict:
+        record = self.get(uid)
+        if record is None:
+            raise KeyError(uid)
+        return record
+
+    def __contains__(self, uid) -> bool:
+        return isinstance(uid, int) and uid >= 0 and self.valid.get(uid)
+
+    def __setitem__(self, uid: int, record: dict):
+        """
+        Raises:
+            ValueError: The record does not fit the schema or the id is negative, the table is unchanged
+        """
+        self.check(record)
+        if uid < 0:
+            raise ValueError(f"Ids of a table with a schema are not negative, got {uid}")
+        with self._lock:
+            for field, column in self.columns.items():
+                column.set(uid, record.get(field))
+            if not self.valid.get(uid):
+                self.valid.set(uid)
+                self._len += 1
+
+    def __delitem__(self, uid: int):
+        with self._lock:
+            if uid not in self:
+                raise KeyError(uid)
+            for column in self.columns.values():
+                column.clear(uid)
+            self.valid.clear(uid)
+            self._len -= 1
+
+    def __iter__(self) -> Iterator[int]:
+        """ Live ids in ascending order """
+        return iter(self.valid.rows())
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self) -> Iterator[Tuple[int, dict]]:
+        for uid in self.valid.copy().rows():
+            record = self.get(uid)
+            if record is not None:
+                yield uid, record
+
+    def column(self, field: str) -> Dict[int, Any]:
+        """ id -> value of the live records holding the field, read from the column without building records
+
+        Raises:
+            KeyError: The field is not in the schema
+        """
+        column = self.columns.get(field)
+        if column is None:
+            raise KeyError(f"The field {field} is not in the table schema")
+        with self._lock:
+            rows = self.valid.intersection(column.present).rows()
+            values = column.values.tolist() if column.kind != "object" else list(column.values)
+            # codes are reused once released, decode with the strings of the same instant
+            strings = column.dictionary.values[:] if column.dictionary is not None else None
+        if strings is not None:
+            return {uid: strings[values[uid]] for uid in rows}
+        if column.kind == "bool":
+            return {uid: bool(values[uid]) for uid in rows}
+        return {uid: values[uid] for uid in rows}
+
+    def frozen(self):
+        """ Point in time view for snapshots: copies the arrays, bitmaps and string dictionaries """
+        with self._lock:
+            view = ColumnarTable.__new__(ColumnarTable)
+            view.schema = self.schema
+            view.columns = {field: column.copy() for field, column in self.columns.items()}
+            view.valid = self.valid.copy()
+            view._len = self._len
+            view._lock = threading.Lock()
+            return view
+
+    def to_dict(self) -> Dict[int, dict]:
+        return dict(self.items())
+
+    def memory_bytes(self) -> int:
+        """ Approximate bytes held by the columns and the validity bitmap """
+        return sum(column.memory_bytes() for column in self.columns.values()) + len(self.valid.data)
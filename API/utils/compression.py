@@ -0,0 +1,104 @@
+import lzma
+import zlib
+from typing import (
+    Iterable,
+    Iterator,
+    Optional
+)
+
+COMPRESSIONS = ("gzip", "zlib", "lzma")
+# a table created with one of these extensions is compressed with the matching codec
+COMPRESSED_EXTENSIONS = {".json.gz": "gzip", ".json.zz": "zlib", ".json.xz": "lzma"}
+COMPRESS_SLICE = 1 << 20 # bytes handed to the compressor at a time
+_GZIP_MAGIC = b"\x1f\x8b"
+_XZ_MAGIC = b"\xfd7zXZ\x00"
+_WBITS = {"gzip": 31, "zlib": 15}
+
+
+def check_compression(compression: Optional[str]) -> Optional[str]:
+    """
+    Raises:
+        ValueError: Not None or one of COMPRESSIONS
+    """
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"Compression must be one of {COMPRESSIONS}, got {compression}")
+    return compression
+
+
+def _compressor(compression: str, level: Optional[int] = None):
+    if compression == "lzma":
+        return lzma.LZMACompressor(preset=level)
+    return zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION if level is None else level, zlib.DEFLATED,
+                            _WBITS[compression])
+
+
+def compress_chunks(chunks: Iterable[bytes], compression: str, level: Optional[int] = None) -> Iterator[bytes]:
+    """ Compress a stream of byte chunks, compressed output is yielded as soon as the codec produces it
+
+    Args:
+        chunks (Iterable[bytes]): plain bytes
+        compression (str): one of COMPRESSIONS
+        level (int, optional): codec level, the lzma preset for lzma. Defaults to the codec default.
+    """
+    compressor = _compressor(compression, level)
+    for chunk in chunks:
+        for start in range(0, len(chunk), COMPRESS_SLICE):
+            output = compressor.compress(chunk[start:start + COMPRESS_SLICE])
+            if output:
+                yield output
+    output = compressor.flush()
+    if output:
+        yield output
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """ Codec of a stream from its first bytes, None for plain data """
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(_XZ_MAGIC):
+        return "lzma"
+    # zlib header: deflate method, 32K window, check bits making the first two bytes a multiple of 31
+    if len(head) >= 2 and head[0] == 0x78 and (head[0] << 8 | head[1]) % 31 == 0:
+        return "zlib"
+    return None
+
+
+def _decompressor(compression: str):
+    if compression == "lzma":
+        return lzma.LZMADecompressor()
+    return zlib.decompressobj(_WBITS[compression])
+
+
+def decompress_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """ Decompress a stream whose codec is detected from its first bytes, plain streams pass through """
+    chunks = iter(chunks)
+    head = b""
+    # a first chunk shorter than the longest magic is joined with the next ones
+    for chunk in chunks:
+        head += chunk
+        if len(head) >= len(_XZ_MAGIC):
+            break
+    if not head:
+        return
+    compression = detect_compression(head)
+    if compression is None:
+        yield head
+        yield from chunks
+        return
+    decompressor = _decompressor(compression)
+    for chunk in _prepend(head, chunks):
+        output = decompressor.decompress(chunk)
+        if output:
+            yield output
+    if not decompressor.eof:
+        raise ValueError(f"Truncated {compression} stream")
+
+
+def decompress(data: bytes) -> bytes:
+    """ Whole buffer version of decompress_chunks """
+    return b"".join(decompress_chunks([data]))
+
+
+def _prepend(head: bytes, chunks: Iterator[bytes]) -> Iterator[bytes]:
+    yield head
+    yield from chunks
@@ -0,0 +1,82 @@
+import heapq
+import threading
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+
+def check_ttl(ttl) -> Optional[float]:
+    """
+    Raises:
+        ValueError: Not None or a positive number of seconds
+    """
+    if ttl is None:
+        return None
+    if isinstance(ttl, bool) or not isinstance(ttl, (int, float)) or not ttl > 0:
+        raise ValueError(f"A TTL is a positive number of seconds, got {ttl!r}")
+    return float(ttl)
+
+
+class ExpiryHeap:
+    """
+    Deadlines of the records of a table that expire, in a min-heap ordered by deadline.
+
+    Setting or replacing a deadline pushes a new heap entry, the previous one is left in place and
+    skipped when it reaches the top, so every change costs O(log n). The heap is rebuilt once the
+    stale entries outnumber the live ones. Deadlines are wall clock times, time.time(), so they
+    still hold after a restart.
+    """
+    COMPACT_MIN_ENTRIES = 1024 # stale entries tolerated whatever the number of live ones
+
+    def __init__(self, deadlines: Optional[Dict[int, float]] = None):
+        self._deadlines: Dict[int, float] = dict(deadlines or {}) # id -> deadline
+        self._heap = [(deadline, uid) for uid, deadline in self._deadlines.items()]
+        heapq.heapify(self._heap)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def get(self, uid: int) -> Optional[float]:
+        return self._deadlines.get(uid)
+
+    def set(self, uid: int, deadline: float):
+        with self._lock:
+            self._deadlines[uid] = deadline
+            heapq.heappush(self._heap, (deadline, uid))
+            self._maybe_compact()
+
+    def discard(self, uid: int):
+        with self._lock:
+            if self._deadlines.pop(uid, None) is not None:
+                self._maybe_compact()
+
+    def due(self, now: float) -> bool:
+        """ Whether a deadline may have passed, O(1). A stale entry can make it answer True for nothing """
+        heap = self._heap
+        return bool(heap) and heap[0][0] <= now
+
+    def pop_due(self, now: float) -> List[int]:
+        """ Forget and return the ids whose deadline has passed, O(log n) per id """
+        expired = []
+        with self._lock:
+            heap = self._heap
+            while heap and heap[0][0] <= now:
+                deadline, uid = heapq.heappop(heap)
+                # entries of replaced or discarded deadlines are stale
+                if self._deadlines.get(uid) == deadline:
+                    del self._deadlines[uid]
+                    expired.append(uid)
+        return expired
+
+    def to_dict(self) -> Dict[int, float]:
+        """ id -> deadline copy, for snapshots """
+        with self._lock:
+            return dict(self._deadlines)
+
+    def _maybe_compact(self):
+        if len(self._heap) > 2 * len(self._deadlines) + self.COMPACT_MIN_ENTRIES:
+            self._heap = [(deadline, uid) for uid, deadline in self._deadlines.items()]
+            heapq.heapify(self._heap)
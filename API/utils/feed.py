@@ -0,0 +1,157 @@
+import asyncio
+import threading
+from collections import deque
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Optional
+)
+
+
+class FeedClosed(Exception):
+    """ The subscription ended, reason is "overflow" when the client fell behind or "closed" with its table """
+
+    def __init__(self, reason: str, seq: int):
+        super().__init__(f"The change feed subscription ended: {reason}")
+        self.reason = reason
+        self.seq = seq # last event delivered, a client resumes from it
+
+
+class FeedSubscription:
+    """
+    Events of one client of a ChangeFeed, in a bounded buffer.
+
+    Writers push from any thread, the client reads on its event loop. A client that lets the buffer fill up
+    is dropped instead of slowing the writers down or growing without bound: its subscription ends with
+    reason "overflow" and it resumes from the last sequence number it got.
+    """
+
+    def __init__(self, feed: "ChangeFeed", buffer_size: int, seq: int, loop: asyncio.AbstractEventLoop):
+        self.feed = feed
+        self.buffer_size = buffer_size
+        self.seq = seq # last event handed to the client
+        self.ended = None # reason the subscription ended, see FeedClosed
+        self._events = deque()
+        self._loop = loop
+        self._loop_thread = threading.get_ident()
+        self._ready = asyncio.Event()
+
+    def push(self, events: List[Dict]):
+        """ Buffer events for the client, called by the writers under the table write lock """
+        if self.ended is not None:
+            return
+        if len(self._events) + len(events) > self.buffer_size:
+            self.end("overflow")
+            return
+        self._events.extend(events)
+        self._wake()
+
+    def end(self, reason: str):
+        if self.ended is None:
+            self.ended = reason
+            self._wake()
+
+    def _wake(self):
+        if threading.get_ident() == self._loop_thread:
+            self._ready.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    async def get(self) -> List[Dict]:
+        """ Wait for the next events and take every buffered one
+
+        Raises:
+            FeedClosed: The client fell behind or the table was closed, the events buffered before are delivered first
+        """
+        while not self._events:
+            if self.ended is not None:
+                raise FeedClosed(self.ended, self.seq)
+            self._ready.clear()
+            await self._ready.wait()
+        events = [self._events.popleft() for _ in range(len(self._events))]
+        self.seq = events[-1]["seq"]
+        return events
+
+    def close(self):
+        self.feed.unsubscribe(self)
+
+
+class ChangeFeed:
+    """
+    Insert, update and delete events of a table, for clients keeping a copy of it.
+
+    Events are the operations of the write ahead log with their sequence number: "add" carries the record,
+    "update" the changed fields and "delete" only the id. Operations logged in one batch share a number.
+    The last `history` events stay in memory so a client that reconnects resumes from its sequence number,
+    an older one needs a snapshot again. A table gets its feed with its first subscriber.
+    """
+    DEFAULT_HISTORY = 100000 # events kept for the clients that resume
+    DEFAULT_BUFFER = 10000 # events buffered per client before it is dropped
+
+    def __init__(self, seq: int, history: int = None):
+        """
+        Args:
+            seq (int): sequence number of the table when the feed starts, resuming from an older one needs a snapshot
+            history (int, optional): events kept for the clients that resume. Defaults to DEFAULT_HISTORY.
+        """
+        self.history = history or self.DEFAULT_HISTORY
+        self._events = deque()
+        self._floor = seq # events up to this sequence number are not in the history
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def publish(self, events: Iterable[Dict]):
+        """ Keep events for the clients that resume and hand them to the subscribers,
+        called under the table write lock so the events of a table are published in sequence order
+        """
+        events = list(events)
+        with self._lock:
+            self._events.extend(events)
+            while len(self._events) > self.history:
+                self._floor = self._events.popleft()["seq"]
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(events)
+
+    def since(self, seq: int) -> Optional[List[Dict]]:
+        """ Events after a sequence number, None when some of them left the history """
+        with self._lock:
+            if seq < self._floor:
+                return None
+            # events of one batch share a number, the ones after seq are at the end
+            events = []
+            for event in reversed(self._events):
+                if event["seq"] <= seq:
+                    break
+                events.append(event)
+        events.reverse()
+        return events
+
+    def subscribe(self, seq: int, buffer_size: int = None, loop: asyncio.AbstractEventLoop = None) -> FeedSubscription:
+        """ New client that gets the events after seq, the caller holds the table write lock
+
+        Args:
+            seq (int): sequence number of the state the client has
+            buffer_size (int, optional): events buffered for the client. Defaults to DEFAULT_BUFFER.
+            loop (asyncio.AbstractEventLoop, optional): loop the client reads on. Defaults to the running loop.
+        """
+        subscription = FeedSubscription(self, buffer_size or self.DEFAULT_BUFFER, seq,
+                                        loop or asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: FeedSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def close(self):
+        """ End every subscription, the table is closed """
+        with self._lock:
+            subscribers, self._subscribers = list(self._subscribers), set()
+        for subscriber in subscribers:
+            subscriber.end("closed")
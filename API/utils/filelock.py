@@ -0,0 +1,155 @@
+import os
+import time
+import errno
+import threading
+from typing import Optional
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:  # only available on Windows
+    msvcrt = None
+
+LOCK_SUFFIX = ".lock"
+
+
+class FileLockTimeout(TimeoutError):
+    """ The lock could not be acquired before the timeout """
+
+
+class FileLock:
+    """
+    Advisory lock between processes on a snapshot file.
+
+    The lock is taken on a `<file>.lock` sidecar instead of the snapshot itself, since
+    snapshots are published with os.replace and a lock on the replaced file would be lost.
+    Readers share the lock, a writer holds it alone. Acquiring retries without blocking
+    and backs off until the timeout, then raises FileLockTimeout.
+
+    POSIX uses fcntl.flock. Windows has no shared byte range locks in msvcrt,
+    shared locks are exclusive there.
+    """
+
+    def __init__(self, filepath: str, shared: bool = False, timeout: float = 10.0,
+                 retry_interval: float = 0.01, max_retry_interval: float = 0.1):
+        """
+        Args:
+            filepath (str): the file to protect
+            shared (bool, optional): reader lock, writers use an exclusive one. Defaults to False.
+            timeout (float, optional): seconds to keep retrying. Defaults to 10.0.
+            retry_interval (float, optional): first pause between two attempts, doubled each time. Defaults to 0.01.
+            max_retry_interval (float, optional): longest pause between two attempts. Defaults to 0.1.
+        """
+        self.lock_path = filepath + LOCK_SUFFIX
+        self.shared = shared
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self._fd: Optional[int] = None
+
+    def _try_lock(self) -> bool:
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except (BlockingIOError, PermissionError):
+            return False
+        except OSError as e:
+            # msvcrt reports a lock held by another process as EDEADLK
+            if fcntl is None and e.errno == errno.EDEADLK:
+                return False
+            raise
+
+    def _unlock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        elif msvcrt is not None:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    def acquire(self):
+        """
+        Raises:
+            FileLockTimeout: Another process held a conflicting lock for longer than the timeout
+        """
+        os.makedirs(os.path.dirname(self.lock_path) or ".", exist_ok=True)
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o664)
+        deadline = time.monotonic() + self.timeout
+        interval = self.retry_interval
+        while not self._try_lock():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                os.close(self._fd)
+                self._fd = None
+                mode = "shared" if self.shared else "exclusive"
+                raise FileLockTimeout(f"Could not take the {mode} lock on {self.lock_path} in {self.timeout}s")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, self.max_retry_interval)
+        return self
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            self._unlock()
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def temp_path(filepath: str) -> str:
+    """ Temporary file next to filepath, one per process and thread since writers no longer hold the lock while writing it """
+    return f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def publish(tmp_path: str, filepath: str, lock: Optional[FileLock] = None):
+    """ Replace filepath with a written temporary file, holding lock only for the rename """
+    if lock is None:
+        os.replace(tmp_path, filepath)
+        return
+    with lock:
+        os.replace(tmp_path, filepath)
+
+
+def write_atomic(filepath: str, chunks, fsync: bool = True, lock: Optional[FileLock] = None) -> str:
+    """ Write chunks of bytes to a temporary file and publish it with os.replace,
+    readers see the old file or the new one, never a partial write
+
+    Args:
+        filepath (str): destination file
+        chunks (Iterable[bytes]): content, consumed while the temporary file is written
+        fsync (bool, optional): flush the temporary file to disk before publishing it. Defaults to True.
+        lock (FileLock, optional): exclusive lock on filepath, taken only around os.replace so loaders
+            sharing it are not held up by the serialization. Defaults to None.
+
+    Raises:
+        FileLockTimeout: The lock was not acquired, filepath is unchanged
+
+    Returns:
+        str: the file path
+    """
+    tmp_path = temp_path(filepath)
+    try:
+        with open(tmp_path, "wb") as tmp_file:
+            for chunk in chunks:
+                tmp_file.write(chunk)
+            tmp_file.flush()
+            if fsync:
+                os.fsync(tmp_file.fileno())
+        publish(tmp_path, filepath, lock)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return filepath
@@ -1,7 +1,24 @@
 from cryptography.fernet import Fernet
 import secrets 
 import base64
-import json
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Tuple
+)
+from .compression import decompress
+from .serializers import get_serializer
+
+CHUNK_SIZE = 1 << 22 # plaintext bytes per Fernet token of an encrypted JSON snapshot
+# the server runs log flushers, snapshot jobs and the replica tailer on threads: a forked worker would
+# inherit the locks they hold and could wait on one forever, so workers start from a fresh interpreter
+POOL_START_METHOD = "spawn"
 
 def generate_key(key_size=32):
     """Generates a random cryptographic key of the specified size in bytes."""
@@ -9,15 +26,98 @@ def generate_key(key_size=32):
     encoded_key = base64.urlsafe_b64encode(key).decode('utf-8')
     return encoded_key
 
-def encrypt_data(fernet: Fernet, data: dict):
+def encrypt_data(fernet: Fernet, data: dict, serializer=None, pretty: bool = False):
     """ Encrypts the data in json format using the fernet instance """
-    encrypted_data = fernet.encrypt(json.dumps(data, indent=4).encode())
-    print(encrypted_data)
+    serializer = serializer or get_serializer()
+    encrypted_data = fernet.encrypt(serializer.dumps(data, pretty))
     return encrypted_data.decode()
 
-def decrypt_data(fernet: Fernet, data):
-    """ Decrypts the data in json format using the fernet instance """
-    decrypted_data = json.loads(fernet.decrypt(data).decode())
+def encrypt_chunks(fernet: Fernet, data: dict, serializer=None, pretty: bool = False, chunk_size: int = CHUNK_SIZE,
+                   workers: int = 1):
+    """ Encrypts the data in json format as independent Fernet tokens of at most chunk_size plaintext bytes,
+    so a loader decrypts one chunk at a time instead of holding the whole ciphertext and plaintext.
+    With several workers and several chunks the chunks are encrypted on a process pool.
+    """
+    serializer = serializer or get_serializer()
+    payload = serializer.dumps(data, pretty)
+    chunks = ((None, [payload[start:start + chunk_size]]) for start in range(0, max(len(payload), 1), chunk_size))
+    if len(payload) <= chunk_size:
+        workers = 1
+    for _, tokens in encrypt_batches(fernet, chunks, workers):
+        yield tokens[0]
+
+def encrypt_stream(fernet: Fernet, chunks: Iterable[bytes], chunk_size: int = CHUNK_SIZE, workers: int = 1):
+    """ Encrypts a stream of bytes as independent Fernet tokens of chunk_size plaintext bytes, the last one shorter,
+    in the layout of encrypt_chunks. Only about workers x 2 tokens are held at once.
+    """
+    def pieces():
+        buffer = bytearray()
+        emitted = False
+        for chunk in chunks:
+            buffer += chunk
+            while len(buffer) >= chunk_size:
+                yield None, [bytes(buffer[:chunk_size])]
+                del buffer[:chunk_size]
+                emitted = True
+        if buffer or not emitted:
+            yield None, [bytes(buffer)]
+
+    for _, tokens in encrypt_batches(fernet, pieces(), workers):
+        yield tokens[0]
+
+def _encrypt_batch(fernet: Fernet, payloads: List[bytes]) -> List[bytes]:
+    return [fernet.encrypt(payload) for payload in payloads]
+
+def _decrypt_batch(fernet: Fernet, tokens: List[bytes]) -> List[bytes]:
+    return [fernet.decrypt(token) for token in tokens]
+
+def process_pool(workers: int) -> ProcessPoolExecutor:
+    """ Process pool of the encryption and shard workers, started with POOL_START_METHOD """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START_METHOD))
+
+def _map_batches(fn: Callable, fernet: Fernet, batches: Iterable[Tuple[Any, List[bytes]]],
+                 workers: int) -> Iterator[Tuple[Any, List[bytes]]]:
+    """ Apply fn(fernet, payloads) to (context, payloads) batches and yield (context, result) in order.
+    With several workers the batches run on a process pool with at most 2 x workers batches in flight,
+    so memory stays bounded whatever the number of batches.
+    """
+    if workers <= 1:
+        for context, payloads in batches:
+            yield context, fn(fernet, payloads)
+        return
+    with process_pool(workers) as pool:
+        pending = deque()
+        for context, payloads in batches:
+            pending.append((context, pool.submit(fn, fernet, payloads)))
+            if len(pending) >= 2 * workers:
+                context, future = pending.popleft()
+                yield context, future.result()
+        while pending:
+            context, future = pending.popleft()
+            yield context, future.result()
+
+def encrypt_batches(fernet: Fernet, batches: Iterable[Tuple[Any, List[bytes]]],
+                    workers: int = 1) -> Iterator[Tuple[Any, List[bytes]]]:
+    """ Encrypts batches of payloads independently, in order, on workers processes when workers > 1
+
+    Args:
+        fernet (Fernet): key of the table
+        batches (Iterable): (context, payloads) pairs, the context is handed back untouched
+        workers (int, optional): size of the process pool, 1 encrypts on the calling thread. Defaults to 1.
+    """
+    return _map_batches(_encrypt_batch, fernet, batches, workers)
+
+def decrypt_batches(fernet: Fernet, batches: Iterable[Tuple[Any, List[bytes]]],
+                    workers: int = 1) -> Iterator[Tuple[Any, List[bytes]]]:
+    """ Decrypts batches of tokens, see encrypt_batches """
+    return _map_batches(_decrypt_batch, fernet, batches, workers)
+
+def decrypt_data(fernet: Fernet, data, serializer=None):
+    """ Decrypts the data in json format using the fernet instance, data holds one token per line.
+    The plaintext may be compressed, see compression.detect_compression """
+    serializer = serializer or get_serializer()
+    tokens = data.split()
+    decrypted_data = serializer.loads(decompress(b"".join(fernet.decrypt(token) for token in tokens)))
     return decrypted_data
 
 def create_fernet_instance(key: str):
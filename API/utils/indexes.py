@@ -0,0 +1,341 @@
+import json
+from bisect import bisect_left, insort
+from itertools import islice
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set
+)
+
+_MISSING = object()
+
+
+def index_key(value: Any):
+    """ Hashable key for a field value. bools are kept apart from ints
+    and unhashable JSON values (lists, dicts) are keyed by their canonical JSON.
+    """
+    if isinstance(value, bool):
+        return ("bool", value)
+    if isinstance(value, (list, dict)):
+        return ("json", json.dumps(value, sort_keys=True))
+    return value
+
+
+class HashIndex:
+    """
+    Equality index on one field of a table: field value -> ids of the records holding it.
+    Records without the field are not indexed.
+    """
+    kind = "hash"
+
+    def __init__(self, field: str, unique: bool = False):
+        self.field = field
+        self.unique = unique
+        self._entries: Dict[Any, Set[int]] = {}
+
+    def build(self, table: Dict[int, dict]):
+        """ Index every record of the table
+
+        Raises:
+            ValueError: A unique index found a duplicate value
+        """
+        self._entries = {}
+        for uid, record in table.items():
+            self.check(record, uid)
+            self.add(uid, record)
+
+    def check(self, record: dict, uid: int = None):
+        """ Raise if inserting the record would break the unique constraint
+
+        Args:
+            record (dict): record about to be stored
+            uid (int, optional): id the record is stored under, it may already hold the value
+        """
+        if not self.unique:
+            return
+        value = record.get(self.field, _MISSING)
+        if value is _MISSING:
+            return
+        holders = self._entries.get(index_key(value))
+        if holders and holders != {uid}:
+            raise ValueError(f"Duplicate value {value!r} for unique index on {self.field}")
+
+    def add(self, uid: int, record: dict):
+        value = record.get(self.field, _MISSING)
+        if value is _MISSING:
+            return
+        self._entries.setdefault(index_key(value), set()).add(uid)
+
+    def remove(self, uid: int, record: dict):
+        value = record.get(self.field, _MISSING)
+        if value is _MISSING:
+            return
+        key = index_key(value)
+        holders = self._entries.get(key)
+        if holders is None:
+            return
+        holders.discard(uid)
+        if not holders:
+            del self._entries[key]
+
+    def lookup(self, value: Any) -> Iterable[int]:
+        """ ids of the records whose field equals value """
+        return self._entries.get(index_key(value), ())
+
+    def describe(self) -> dict:
+        return {"field": self.field, "kind": self.kind, "unique": self.unique}
+
+
+class _SortedList:
+    """
+    Sorted list split into bounded chunks with a list of chunk maxima on top.
+    Insert and delete bisect the maxima then the chunk, so the memmove per operation
+    is bounded by the chunk size instead of the table size.
+    """
+    LOAD = 512
+
+    def __init__(self):
+        self._lists = []
+        self._maxes = []
+        self._len = 0
+
+    def __len__(self):
+        return self._len
+
+    def clear(self):
+        self._lists = []
+        self._maxes = []
+        self._len = 0
+
+    def add(self, value):
+        if not self._maxes:
+            self._lists.append([value])
+            self._maxes.append(value)
+        else:
+            pos = bisect_left(self._maxes, value)
+            if pos == len(self._maxes):
+                pos -= 1
+                self._lists[pos].append(value)
+                self._maxes[pos] = value
+            else:
+                insort(self._lists[pos], value)
+            self._split(pos)
+        self._len += 1
+
+    def _split(self, pos: int):
+        chunk = self._lists[pos]
+        if len(chunk) > 2 * self.LOAD:
+            half = chunk[self.LOAD:]
+            del chunk[self.LOAD:]
+            self._maxes[pos] = chunk[-1]
+            self._lists.insert(pos + 1, half)
+            self._maxes.insert(pos + 1, half[-1])
+
+    def remove(self, value):
+        pos = bisect_left(self._maxes, value)
+        if pos == len(self._maxes):
+            return False
+        chunk = self._lists[pos]
+        idx = bisect_left(chunk, value)
+        if idx == len(chunk) or chunk[idx] != value:
+            return False
+        del chunk[idx]
+        self._len -= 1
+        if chunk:
+            self._maxes[pos] = chunk[-1]
+        else:
+            del self._lists[pos]
+            del self._maxes[pos]
+        return True
+
+    def irange(self, low, high, reverse: bool = False) -> Iterator:
+        """ Values v with low <= v < high, in order or in reverse order """
+        if not self._maxes:
+            return
+        if not reverse:
+            pos = bisect_left(self._maxes, low)
+            if pos == len(self._maxes):
+                return
+            idx = bisect_left(self._lists[pos], low)
+            for chunk in islice(self._lists, pos, None):
+                for value in islice(chunk, idx, None):
+                    if not value < high:
+                        return
+                    yield value
+                idx = 0
+        else:
+            pos = bisect_left(self._maxes, high)
+            if pos == len(self._maxes):
+                pos -= 1
+            idx = bisect_left(self._lists[pos], high)
+            while pos >= 0:
+                chunk = self._lists[pos]
+                for i in range(idx - 1, -1, -1):
+                    value = chunk[i]
+                    if value < low:
+                        return
+                    yield value
+                pos -= 1
+                if pos >= 0:
+                    idx = len(self._lists[pos])
+
+
+_NUMBER, _STRING = 0, 1
+_ID_CEILING = float("inf")
+
+
+def _rank(value: Any):
+    """ Sort rank of an indexable value, None for values an ordered index skips """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return _NUMBER
+    if isinstance(value, str):
+        return _STRING
+    return None
+
+
+class OrderedIndex:
+    """
+    Ordered index on one field for range, prefix and top-N queries.
+    Entries are (rank, value, id) tuples kept in a _SortedList, numbers sort before strings.
+    Records whose field is missing or is not a number or a string are not indexed.
+    """
+    kind = "ordered"
+
+    def __init__(self, field: str, unique: bool = False):
+        self.field = field
+        self.unique = unique
+        self._entries = _SortedList()
+
+    def _entry(self, uid: int, record: dict):
+        value = record.get(self.field, _MISSING)
+        if value is _MISSING:
+            return None
+        rank = _rank(value)
+        if rank is None:
+            return None
+        return (rank, value, uid)
+
+    def build(self, table: Dict[int, dict]):
+        """ Index every record of the table
+
+        Raises:
+            ValueError: A unique index found a duplicate value
+        """
+        self._entries.clear()
+        for uid, record in table.items():
+            self.check(record, uid)
+            self.add(uid, record)
+
+    def check(self, record: dict, uid: int = None):
+        """ Raise if inserting the record would break the unique constraint """
+        if not self.unique:
+            return
+        entry = self._entry(uid, record)
+        if entry is None:
+            return
+        holders = set(self.lookup(entry[1]))
+        if holders and holders != {uid}:
+            raise ValueError(f"Duplicate value {entry[1]!r} for unique index on {self.field}")
+
+    def add(self, uid: int, record: dict):
+        entry = self._entry(uid, record)
+        if entry is not None:
+            self._entries.add(entry)
+
+    def remove(self, uid: int, record: dict):
+        entry = self._entry(uid, record)
+        if entry is not None:
+            self._entries.remove(entry)
+
+    def lookup(self, value: Any) -> Iterable[int]:
+        """ ids of the records whose field equals value """
+        rank = _rank(value)
+        if rank is None:
+            return []
+        return [uid for _, _, uid in self._entries.irange((rank, value), (rank, value, _ID_CEILING))]
+
+    def range(self, low: Any = None, high: Any = None, prefix: Optional[str] = None,
+              reverse: bool = False) -> Iterator[int]:
+        """ ids of the records in value order, O(log n) to find the start then O(1) per id
+
+        Args:
+            low (optional): smallest value, inclusive
+            high (optional): largest value, inclusive
+            prefix (str, optional): only strings starting with prefix, replaces low and high
+            reverse (bool, optional): largest value first. Defaults to False.
+
+        Raises:
+            ValueError: A bound is neither a number nor a string
+        """
+        if prefix is not None:
+            start = (_STRING, prefix)
+            if prefix and ord(prefix[-1]) < 0x10FFFF:
+                end = (_STRING, prefix[:-1] + chr(ord(prefix[-1]) + 1))
+            else:
+                end = (_STRING + 1,)
+        else:
+            ranks = [_rank(bound) for bound in (low, high) if bound is not None]
+            if None in ranks:
+                raise ValueError("Range bounds must be numbers or strings")
+            start = (_rank(low), low) if low is not None else (ranks[0] if ranks else _NUMBER,)
+            end = (_rank(high), high, _ID_CEILING) if high is not None else ((ranks[-1] if ranks else _STRING) + 1,)
+        for _, _, uid in self._entries.irange(start, end, reverse):
+            yield uid
+
+    def describe(self) -> dict:
+        return {"field": self.field, "kind": self.kind, "unique": self.unique}
+
+
+class IdIndex:
+    """
+    Ids of the live records in ascending order, for cursor pagination.
+    Ids are not dense: a table without auto_increment or a replayed log may use any of them,
+    a page costs O(log n + limit) wherever they are.
+    Every table keeps one, it is not listed in the table metadata.
+    """
+
+    def __init__(self):
+        self._ids = _SortedList()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def build(self, ids: Iterable[int]):
+        self._ids.clear()
+        for uid in sorted(ids):
+            self._ids.add(uid)
+
+    def add(self, uid: int):
+        self._ids.add(uid)
+
+    def remove(self, uid: int):
+        """ Removing an id the index does not hold is a no op """
+        self._ids.remove(uid)
+
+    def after(self, uid: Optional[int], limit: int) -> List[int]:
+        """ Up to limit ids greater than uid, all of them from the first when uid is None """
+        low = -_ID_CEILING if uid is None else uid + 1
+        return list(islice(self._ids.irange(low, _ID_CEILING), limit))
+
+
+INDEX_TYPES = {
+    HashIndex.kind: HashIndex,
+    OrderedIndex.kind: OrderedIndex,
+}
+
+
+def make_index(kind: str, field: str, unique: bool = False):
+    """ Build an empty index of the given kind
+
+    Raises:
+        ValueError: Unknown index kind
+    """
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Index kind must be one of {list(INDEX_TYPES)}, got {kind}")
+    return INDEX_TYPES[kind](field, unique)
@@ -0,0 +1,106 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Callable,
+    Optional,
+    Dict
+)
+
+
+class SnapshotJob:
+    """
+    Status of one snapshot running off the event loop.
+    """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(self, table_name: str):
+        self.job_id = uuid.uuid4().hex
+        self.table_name = table_name
+        self.status = self.PENDING
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+
+    def wait(self, timeout: Optional[float] = None):
+        """ Block until the job is finished and return its result, errors are re-raised """
+        return self.future.result(timeout)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "table_name": self.table_name,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SnapshotJobs:
+    """
+    Runs snapshot writes on a worker thread, one at a time and in submission order,
+    and keeps the status of the most recent jobs.
+    """
+    MAX_HISTORY = 100
+
+    def __init__(self, max_workers: int = 1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="burp-snapshot")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, table_name: str, fn: Callable, *args) -> SnapshotJob:
+        """ Queue fn(*args) and return the job tracking it """
+        job = SnapshotJob(table_name)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.MAX_HISTORY:
+                self._jobs.popitem(last=False)
+        job.future = self._executor.submit(self._run, job, fn, *args)
+        return job
+
+    def _run(self, job: SnapshotJob, fn: Callable, *args):
+        job.status = SnapshotJob.RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(*args)
+            job.status = SnapshotJob.DONE
+            return job.result
+        except Exception as e:
+            job.error = f"{type(e).__name__} - {e}"
+            job.status = SnapshotJob.FAILED
+            raise
+        finally:
+            job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[SnapshotJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self, table_name: str) -> Optional[SnapshotJob]:
+        """ The most recent pending or running job of a table, None when there is none """
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.table_name == table_name and job.status in (SnapshotJob.PENDING, SnapshotJob.RUNNING):
+                    return job
+        return None
+
+    def active(self, table_name: Optional[str] = None) -> bool:
+        """ Whether a job is pending or running, optionally for one table """
+        with self._lock:
+            return any(job.status in (SnapshotJob.PENDING, SnapshotJob.RUNNING)
+                       and (table_name is None or job.table_name == table_name)
+                       for job in self._jobs.values())
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
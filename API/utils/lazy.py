@@ -0,0 +1,95 @@
+from collections.abc import MutableMapping
+from typing import (
+    Dict,
+    Iterator
+)
+from .binary import BinarySnapshot
+
+
+class LazyTable(MutableMapping):
+    """
+    Table backed by a memory mapped binary snapshot.
+
+    Opening it only maps the file and its id -> offset index. A record is decoded
+    the first time it is read and cached, so resident memory follows the working set.
+    Writes and deletes go to an in memory overlay on top of the snapshot, which is never modified.
+    """
+
+    def __init__(self, snapshot: BinarySnapshot, cache: bool = True):
+        """
+        Args:
+            snapshot (BinarySnapshot): snapshot opened with use_mmap=True
+            cache (bool, optional): keep decoded records. Defaults to True.
+        """
+        self.snapshot = snapshot
+        self.cache = cache
+        self._records: Dict[int, dict] = {} # decoded or written records
+        self._deleted = set() # snapshot ids deleted since the load
+        self._len = len(snapshot)
+
+    def _in_snapshot(self, uid: int) -> bool:
+        return uid not in self._deleted and uid in self.snapshot
+
+    def __contains__(self, uid) -> bool:
+        return uid in self._records or self._in_snapshot(uid)
+
+    def __getitem__(self, uid: int) -> dict:
+        record = self._records.get(uid)
+        if record is not None:
+            return record
+        if uid in self._deleted:
+            raise KeyError(uid)
+        record = self.snapshot.get(uid)
+        if record is None:
+            raise KeyError(uid)
+        if self.cache:
+            self._records[uid] = record
+        return record
+
+    def __setitem__(self, uid: int, record: dict):
+        if uid not in self:
+            self._len += 1
+        self._records[uid] = record
+        self._deleted.discard(uid)
+
+    def __delitem__(self, uid: int):
+        if uid not in self:
+            raise KeyError(uid)
+        self._records.pop(uid, None)
+        if uid in self.snapshot:
+            self._deleted.add(uid)
+        self._len -= 1
+
+    def __iter__(self) -> Iterator[int]:
+        """ Snapshot ids in order, then the ids added since the load """
+        for uid in self.snapshot.ids:
+            if uid not in self._deleted:
+                yield uid
+        for uid in [uid for uid in self._records if uid not in self.snapshot]:
+            yield uid
+
+    def __len__(self) -> int:
+        return self._len
+
+    def items(self):
+        """ (id, record) pairs without filling the cache """
+        for uid in self:
+            record = self._records.get(uid)
+            yield uid, record if record is not None else self.snapshot.get(uid)
+
+    def cached_records(self) -> int:
+        """ Number of records decoded or written in memory """
+        return len(self._records)
+
+    def frozen(self):
+        """ Point in time view for snapshots: shares the mapping, copies only the overlay
+        and never caches what it reads
+        """
+        view = LazyTable(self.snapshot, cache=False)
+        view._records = dict(self._records)
+        view._deleted = set(self._deleted)
+        view._len = self._len
+        return view
+
+    def to_dict(self) -> Dict[int, dict]:
+        return dict(self.items())
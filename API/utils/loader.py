@@ -0,0 +1,177 @@
+import re
+import json
+import codecs
+from collections.abc import MutableMapping
+from json.scanner import make_scanner
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple
+)
+from cryptography.fernet import Fernet
+from .compression import decompress_chunks
+from .generator import decrypt_batches
+
+_OPEN = re.compile(r"[ \t\n\r]*\{")
+_CLOSE = re.compile(r"[ \t\n\r]*\}")
+_KEY = re.compile(r'[ \t\n\r]*"((?:[^"\\]|\\.)*)"[ \t\n\r]*:[ \t\n\r]*')
+_SEPARATOR = re.compile(r"[ \t\n\r]*([,}])")
+READ_CHUNK_SIZE = 1 << 20 # bytes read from the file at a time
+
+
+class StreamingJsonLoader:
+    """
+    Incremental loader for table snapshots, a JSON object of id -> record.
+
+    Records are decoded one at a time from a bounded text buffer and inserted straight
+    into the int keyed table, so the file contents, the parsed str keyed dict and the
+    int keyed copy never coexist. The highest id is computed in the same pass.
+    """
+
+    def __init__(self, progress: Optional[Callable[[int, int], None]] = None, progress_every: int = 100000,
+                 workers: int = 1):
+        """
+        Args:
+            progress (Callable, optional): called with (records loaded, bytes read) every progress_every
+                records and once at the end. Defaults to None.
+            progress_every (int, optional): records between two progress reports. Defaults to 100000.
+            workers (int, optional): processes decrypting the tokens of an encrypted snapshot. Defaults to 1.
+        """
+        self.progress = progress
+        self.progress_every = progress_every
+        self.workers = workers
+        self.bytes_read = 0
+        # the C scanner behind json.loads, it decodes one value at a given index
+        self._scan = make_scanner(json.JSONDecoder())
+
+    def load_file(self, filepath: str, encoding: str = "utf-8",
+                  table: Optional[MutableMapping] = None) -> Tuple[MutableMapping, Optional[int]]:
+        """ Load a plaintext snapshot, compressed or not """
+        return self.load(self._text_chunks(decompress_chunks(self._file_chunks(filepath)), encoding), table)
+
+    def load_encrypted_file(self, filepath: str, fernet: Fernet, encoding: str = "utf-8",
+                            table: Optional[MutableMapping] = None) -> Tuple[MutableMapping, Optional[int]]:
+        """ Load an encrypted snapshot made of one Fernet token per line.
+        Tokens are decrypted one at a time, a snapshot written as a single token is a file with one line.
+        The plaintext may be a compressed stream split across the tokens.
+        """
+        return self.load(self._text_chunks(decompress_chunks(self._decrypted_chunks(filepath, fernet)), encoding),
+                         table)
+
+    def _file_chunks(self, filepath: str) -> Iterator[bytes]:
+        with open(filepath, "rb") as snapshot_file:
+            while True:
+                chunk = snapshot_file.read(READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                self.bytes_read += len(chunk)
+                yield chunk
+
+    def _tokens(self, filepath: str) -> Iterator[Tuple[None, List[bytes]]]:
+        with open(filepath, "rb") as snapshot_file:
+            for token in snapshot_file:
+                self.bytes_read += len(token)
+                token = token.strip()
+                if token:
+                    yield None, [token]
+
+    def _decrypted_chunks(self, filepath: str, fernet: Fernet) -> Iterator[bytes]:
+        for _, chunks in decrypt_batches(fernet, self._tokens(filepath), self.workers):
+            yield chunks[0]
+
+    def _text_chunks(self, chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def load(self, chunks: Iterable[str],
+             table: Optional[MutableMapping] = None) -> Tuple[MutableMapping, Optional[int]]:
+        """ Build the int keyed table from the text of a snapshot given in chunks
+
+        Args:
+            chunks (Iterable[str]): text of the snapshot
+            table (MutableMapping, optional): filled with the records, such as a cache.SpillTable. Defaults to a dict.
+
+        Raises:
+            json.JSONDecodeError: The snapshot is not a JSON object
+        """
+        if table is None:
+            table = {}
+        max_id = None
+        count = 0
+        for key, value in self.iter_items(chunks):
+            uid = int(key)
+            table[uid] = value
+            if max_id is None or uid > max_id:
+                max_id = uid
+            count += 1
+            if self.progress is not None and count % self.progress_every == 0:
+                self.progress(count, self.bytes_read)
+        if self.progress is not None:
+            self.progress(count, self.bytes_read)
+        return table, max_id
+
+    def iter_items(self, chunks: Iterable[str]) -> Iterator[Tuple[str, Any]]:
+        """ Yield the (key, value) pairs of a top level JSON object.
+        A record cut by the end of the buffer is decoded again once the next chunk is appended.
+        """
+        chunks = iter(chunks)
+        buffer = ""
+        pos = 0
+        eof = False
+        scan = self._scan
+        while True:
+            # the opening brace
+            match = _OPEN.match(buffer, pos)
+            if match is not None:
+                pos = match.end()
+                break
+            if eof or buffer[pos:].strip():
+                raise json.JSONDecodeError("Expecting '{'", buffer, pos)
+            buffer, pos, eof = self._fill(chunks, buffer, pos)
+        match = _CLOSE.match(buffer, pos)
+        while match is None and not eof and not buffer[pos:].strip():
+            buffer, pos, eof = self._fill(chunks, buffer, pos)
+            match = _CLOSE.match(buffer, pos)
+        if match is not None:
+            return
+        while True:
+            end = len(buffer)
+            key_match = _KEY.match(buffer, pos)
+            if key_match is not None and key_match.end() < end:
+                try:
+                    value, value_end = scan(buffer, key_match.end())
+                except (StopIteration, json.JSONDecodeError):
+                    value_end = None
+                # a number cut by the end of the buffer decodes fine, the separator proves it ended
+                separator = _SEPARATOR.match(buffer, value_end) if value_end is not None else None
+                if separator is not None:
+                    key = key_match.group(1)
+                    if "\\" in key:
+                        key = json.loads(f'"{key}"')
+                    yield key, value
+                    pos = separator.end()
+                    if separator.group(1) == "}":
+                        return
+                    continue
+            if eof:
+                raise json.JSONDecodeError("Malformed or truncated snapshot", buffer, pos)
+            buffer, pos, eof = self._fill(chunks, buffer, pos)
+
+    @staticmethod
+    def _fill(chunks: Iterator[str], buffer: str, pos: int):
+        """ Drop the consumed text and append the next chunk """
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return buffer, pos, True
+        return buffer[pos:] + chunk, 0, False
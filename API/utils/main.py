@@ -1,30 +1,64 @@
 from .persist import DataPersister, DataPersistSettings
 import os
-from .generator import generate_key, create_fernet_instance
+import time
+import logging
+import uuid
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .scheduler import SavePolicy
+from .jobs import SnapshotJobs
+from .indexes import make_index
+from .cache import SpillTable
+from .columnar import ColumnarTable, check_schema
+from .compression import COMPRESSED_EXTENSIONS, check_compression
+from .binary import BINARY_EXTENSION
+from .lazy import LazyTable
+from .table import Table
+from .filelock import LOCK_SUFFIX
+from .wal import log_operations
+from .metrics import timed
+from .expiry import ExpiryHeap, check_ttl
+from .feed import ChangeFeed
+from itertools import islice
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+
+logger = logging.getLogger(__name__)
 
 class Burp:
     """
-    Main class for the burp database
+    Main class for the burp database, every open table of the database is held in memory
     """
+    # "writer" publishes a manifest of its tables for the read replicas, a "replica" only applies the writer's log
+    ROLES = ("standalone", "writer", "replica")
+    ITER_BATCH = 256 # ids iter_records reads under the table read lock at a time
+
     def __init__(self, **kwargs):
         self.settings = DataPersistSettings()
         self.COMMON_ENCODINGS = ["utf-8", "utf-16", "latin-1", "ascii"]
         self.db_name = None
         self.db_instance = None
         self.filepath = None
-        self.tables = {}
-        self.auto_inc_id = 0
-        self.auto_inc_status = False
+        self.tables = {} # table name -> Table
         self.starter_file = "base"
-        self.table_name = ""
+        self.table_name = "" # default table of the calls that do not name one
         self.cur_dir = os.path.join(os.getcwd(), "utils")
-        self.encryption_key = None
-        self.encrypt = False
-        self.fernet_instance = None
+        self.save_policy = SavePolicy.parse("auto")
+        self.jobs = SnapshotJobs()
+        self.role = "standalone"
+        self.loading = {} # table name -> DataPersister.load_progress of the loads in progress
+        self._load_lock = threading.Lock() # loads run on worker threads, a table is loaded once
+        self._manifest_lock = threading.Lock()
         for key, value in kwargs.items():
-            if isinstance(key, str):
+            if not isinstance(key, str):
                 raise TypeError(f"Attribute names must be strings, got {key}")
             setattr(self, key, value)
+        if self.role not in self.ROLES:
+            raise ValueError(f"role must be one of {self.ROLES}, got {self.role}")
     
     
     def create_database(self, db_name: str, encoding=None, save="auto"):
@@ -37,7 +71,9 @@ class Burp:
         Raises:
             ValueError: Not a command encoding format. 
             ValueError: Database name already exists.
+            ValueError: Not a valid save option, see SavePolicy.
         """
+        self.save_policy = SavePolicy.parse(save)
         if encoding:
             if encoding not in self.COMMON_ENCODINGS:
                 raise ValueError("Please provide a valid common encoding format")
@@ -58,225 +94,1208 @@ class Burp:
         try:
             self.db_instance = DataPersister(self.settings)
         except Exception as e:
-            print(f"An unexpected error occurred: {type(e).__name__} - {e}")
+            logger.error("An unexpected error occurred: %s - %s", type(e).__name__, e)
             return False
         return True
 
     
-    def _create_table_file_and_save(self):
+    def _create_table_file_and_save(self, table: Table):
         """create a new table
         Returns:
             str: file path
         """
-        filepath = self.db_instance.create_table_file(self.table_name, self.db_name, self.cur_dir)
+        if table.shards:
+            self.db_instance.save_shards({}, table.shards, table.name, self.db_name, self.cur_dir, table.extension,
+                                         table.encrypt, table.fernet_instance, compression=table.compression)
+            setattr(self, "filepath", os.path.join(self.cur_dir, self.db_name, table.name))
+            return self.filepath
+        filepath = self.db_instance.create_table_file(table.name, self.db_name, self.cur_dir, extension=table.extension)
+        if table.encrypt or table.compression:
+            # the empty snapshot is encrypted and compressed too, a replica loads the table before its first save
+            self.db_instance.save_data({}, table.name, self.db_name, self.cur_dir, table.extension,
+                                       table.encrypt, table.fernet_instance, compression=table.compression)
         setattr(self, "filepath", filepath)
         return self.filepath
+
+
+    def get_table(self, table_name: str = None) -> Table:
+        """ Open table by name, the default table when no name is given
+
+        Raises:
+            KeyError: No open table with that name
+        """
+        table_name = table_name or self.table_name
+        if not table_name:
+            raise KeyError(f"There is not table to search from")
+        table = self.tables.get(table_name)
+        if table is None:
+            raise KeyError(f"The table name: {table_name} does not exist")
+        return table
     
     
-    def _table_name_id_exists(self, uid:int):
-        """ Check if the table with self.table name exists
+    def _table_name_id_exists(self, uid:int, table_name: str = None):
+        """ Check if the table exists
         and whether it contains id object in it
 
         Args:
             id (int): ID of the user
+            table_name (str, optional): table to search, the default table when None
 
         Raises:
             KeyError: No table name existing
             KeyError: The id not found in the table
         """
-        if self.table_name == "":
-            raise KeyError(f"There is not table to search from")
-        if self.tables[self.table_name].get(uid) is None:
+        if self.get_table(table_name).records.get(uid) is None:
             raise KeyError(f"The id {uid} does not exist in the table")
         return True
     
     
-    def create_table(self, table_name: str, extension: str = None, auto_increment=True, encrypt=False):
-        """ Create a new table 
+    def create_table(self, table_name: str, extension: str = None, auto_increment=True, encrypt=False, pretty=False,
+                     memory_budget: int = None, schema: Dict[str, str] = None, compression: str = None,
+                     shards: int = None, ttl: float = None):
+        """ Create a new table, it becomes the default table
 
         Args:
             table_name (str): table name 
-            schema (dict): structure of the input data 
             auto_increment (bool, optional): Auto increment the unique ID. Defaults to True.
+            pretty (bool, optional): Indent the JSON snapshots. Defaults to False.
+            memory_budget (int, optional): bytes of records kept in memory, the cold ones spill to disk.
+                Defaults to settings.memory_budget.
+            schema (dict, optional): field name -> "int", "float", "bool", "str" or "object". Records are then
+                checked against it and stored column by column, see ColumnarTable. Defaults to None.
+            compression (str, optional): "gzip", "zlib" or "lzma" for the JSON snapshots. Defaults to the codec
+                named by the extension (".json.gz", ".json.zz", ".json.xz"), then to settings.compression.
+            shards (int, optional): hash partition the snapshot into that many files, db_name/table_name/shard-K.
+                Saves only write the shards that changed and run on a process pool, loads read the shards
+                in parallel. Defaults to None, a single snapshot file.
+            ttl (float, optional): seconds a record lives when it is added without a TTL of its own, for cache
+                tables. Defaults to None, records never expire.
 
         Raises:
-            ValueError: _description_
-            TypeError: _description_
+            KeyError: A table with that name is open or saved in the database, load it instead
+            ValueError: Not a valid schema, budget, cache policy, compression, number of shards or TTL
         """
         
         if self.tables.get(table_name)  is not None:
             raise KeyError(f"A table with name {table_name} already exists")
-        self.tables[table_name] = {}
-        if auto_increment:
-            self.auto_inc_status = True
-        if encrypt:
-            setattr(self, "encryption_key", generate_key())
-            setattr(self, "fernet_instance", create_fernet_instance(self.encryption_key))
-            self.encrypt = True
-        
-        filepath = os.path.join(self.cur_dir, table_name + self.settings.extension)
-        if self.db_instance.check_exists(filepath):
-            # print(f"The database with name {table_name} already exists")
-            return f"The table with name {table_name} already exists"
-        if extension:
-            self.settings.extension = extension
+        # a table saved by another process or before a restart: creating it again would truncate its log
+        # and overwrite its snapshot
+        if self.db_instance.table_exists(table_name, self.db_name, self.cur_dir, extension):
+            raise KeyError(f"A table with name {table_name} already exists")
+        table = Table(table_name, extension or self.settings.extension,
+                      auto_increment=bool(auto_increment), encrypt=encrypt, pretty=pretty)
+        table.schema = check_schema(schema) if schema is not None else None
+        table.compression = self._snapshot_compression(table.extension, check_compression(compression))
+        if shards is not None and (not isinstance(shards, int) or shards < 1):
+            raise ValueError(f"The number of shards must be a positive integer, got {shards}")
+        table.shards = shards
+        table.ttl = check_ttl(ttl)
+        table.records = self._new_records(table, memory_budget)
+        self.tables[table_name] = table
         setattr(self, "table_name", table_name)
         try:
-            self._create_table_file_and_save()
-            print(f"The new database table with name {table_name} has been created")
+            self._create_table_file_and_save(table)
+            table.wal = self.db_instance.open_log(table_name, self.db_name, self.cur_dir, table.fernet_instance, truncate=True)
+            table.incarnation = uuid.uuid4().hex
+            self.db_instance.save_meta({"pretty": pretty, "incarnation": table.incarnation, "schema": table.schema,
+                                        "compression": table.compression, "shards": table.shards,
+                                        "extension": table.extension, "encrypt": table.encrypt, "ttl": table.ttl},
+                                       table_name, self.db_name, self.cur_dir)
+            self._publish_manifest()
+            logger.info("The new database table with name %s has been created", table_name)
         except Exception as e:
             raise Exception(f"An unexpected error occurred: {type(e).__name__} - {e}")
     
     
-    def add_one(self, data: dict):
+    @timed("add_one", "write")
+    def add_one(self, data: dict, table_name: str = None, ttl: float = None):
         """Add Data to the table
 
         Args:
-            table_name (str): name of the table to add the data to
             data (dict): data to be added
+            table_name (str, optional): name of the table to add the data to, the default table when None
+            ttl (float, optional): seconds the record lives. Defaults to the TTL of the table.
 
         Raises:
-            ValueError: A table with that name already exists
-            KeyError: The given structure does not match the predefined structure 
+            KeyError: No table with that name
+            ValueError: The data breaks a unique index or the TTL is not positive
+            OSError: The write could not be logged, the table is unchanged
         """
-        if self.table_name is  None:
-            raise KeyError(f"A table with name {self.table_name} does not exists")
+        table = self.get_table(table_name)
+        expires_at = self._deadline(table, check_ttl(ttl))
         # if list(data.keys()) != list(self.tables[table_name].keys()):
         #     raise KeyError(f"The schema of the given data does not match with the predefined schema")
-        self.tables[self.table_name][self.auto_inc_id] = data
-        self._auto_increment_id()
-        #self._append_data_to_db(table_name)
-        return self.auto_inc_id-1
+        with table.lock.write():
+            uid = table.auto_inc_id
+            table.check_record(uid, data)
+            seq = table.seq
+            previous = table.records.get(uid)
+            deadline = table.expiry.get(uid)
+            try:
+                if previous is not None:
+                    table.unindex(uid, previous)
+                table.records[uid] = data
+                table.index(uid, data)
+                table.auto_increment_id()
+                if expires_at is not None:
+                    table.expiry.set(uid, expires_at)
+                elif previous is not None:
+                    table.expiry.discard(uid)
+                table.record_mutation("add", uid, data, expires_at)
+            except Exception:
+                # a write the log did not get is not served either
+                if table.seq == seq:
+                    self._undo_write(table, uid, data, previous, deadline)
+                    table.auto_inc_id = uid
+                raise
+        return uid
     
         
-    def delete(self, id: int):
+    @timed("delete", "write")
+    def delete(self, id: int, table_name: str = None):
         """ Delete a value from the table 
 
         Args:
             id (int): id of the doc
+            table_name (str, optional): the default table when None
         """
-        if not self._table_name_id_exists(id):
-            print("ID or table not found")
-        del self.tables[self.table_name][id]
+        table = self.get_table(table_name)
+        with table.lock.write():
+            if not self._table_name_id_exists(id, table_name):
+                logger.warning("The id %s is not in the table %s", id, table.name)
+            seq = table.seq
+            previous = table.records[id]
+            deadline = table.expiry.get(id)
+            try:
+                table.unindex(id, previous)
+                del table.records[id]
+                table.expiry.discard(id)
+                table.record_mutation("delete", id)
+            except Exception:
+                if table.seq == seq:
+                    self._undo_write(table, id, None, previous, deadline)
+                raise
         # print(self.tables)
         return f"Deleted the id {id} successfully"
     
     
-    def update(self, id: int, data: dict):
+    @timed("update", "write")
+    def update(self, id: int, data: dict, table_name: str = None, ttl: float = None):
         """ Update the data 
 
         Args:
             id (int): ID of the object to update
             data (dict): data which is to be updated 
+            table_name (str, optional): the default table when None
+            ttl (float, optional): seconds the record lives from now on. Defaults to None, the record keeps
+                its deadline.
+
+        Raises:
+            ValueError: The update breaks a unique index or the TTL is not positive
+            OSError: The update could not be logged, the record is unchanged
         """
-        if not self._table_name_id_exists(id):
-            return "ID or table not found"
-        for key, value in data.items():
-            self.tables[self.table_name][id][key] = value
-        return self.tables[self.table_name][id]
+        table = self.get_table(table_name)
+        ttl = check_ttl(ttl)
+        self._expire(table)
+        with table.lock.write():
+            if not self._table_name_id_exists(id, table_name):
+                return "ID or table not found"
+            previous = table.records[id]
+            # copy on write, readers and a snapshot in progress keep the previous version of the record
+            record = {**previous, **data}
+            table.check_record(id, record)
+            seq = table.seq
+            deadline = table.expiry.get(id)
+            try:
+                table.unindex(id, previous)
+                table.records[id] = record
+                table.index(id, record)
+                expires_at = None
+                if ttl is not None:
+                    expires_at = time.time() + ttl
+                    table.expiry.set(id, expires_at)
+                table.record_mutation("update", id, data, expires_at)
+            except Exception:
+                if table.seq == seq:
+                    self._undo_write(table, id, record, previous, deadline)
+                raise
+        return record
     
-    def delete_table(self):
+    @timed("add_many", "write")
+    def add_many(self, records: List[dict], table_name: str = None):
+        """ Add a batch of records under a contiguous id range.
+        The batch is applied under the table write lock and logged as one unit, either every record is stored or none
+
+        Args:
+            records (List[dict]): records to add
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: No table with that name
+            ValueError: The table does not auto increment its ids
+            ValueError: A record breaks a unique index, nothing is stored
+            TypeError: A record is not a dict, nothing is stored
+
+        Returns:
+            dict: "first_id" and "last_id" of the stored records, both None for an empty batch, and "count"
+        """
+        table = self.get_table(table_name)
+        if not table.auto_inc_status:
+            raise ValueError("Batch inserts need a table with auto_increment")
+        expires_at = self._deadline(table)
+        with table.lock.write():
+            first_id = table.auto_inc_id
+            seq = table.seq
+            operations = []
+            try:
+                for uid, data in enumerate(records, first_id):
+                    table.check_record(uid, data)
+                    operations.append({"op": "add", "id": uid, "data": data})
+                    table.records[uid] = data
+                    table.index(uid, data)
+                table.auto_inc_id = first_id + len(operations)
+                if expires_at is not None:
+                    for operation in operations:
+                        operation["expires_at"] = expires_at
+                        table.expiry.set(operation["id"], expires_at)
+                table.record_batch(operations)
+            except Exception:
+                # whatever failed, the batch is undone unless it reached the log
+                if table.seq == seq:
+                    self._undo_adds(table, first_id, operations)
+                raise
+        if not operations:
+            return {"first_id": None, "last_id": None, "count": 0}
+        return {"first_id": first_id, "last_id": table.auto_inc_id - 1, "count": len(operations)}
+
+
+    @timed("update_many", "write")
+    def update_many(self, updates: Dict[int, dict], table_name: str = None):
+        """ Update a batch of records, applied under the table write lock and logged as one unit
+
+        Args:
+            updates (Dict[int, dict]): id -> fields to change
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: An id does not exist in the table, nothing is updated
+            ValueError: An update breaks a unique index, nothing is updated
+            TypeError: An update is not a dict, nothing is updated
+
+        Returns:
+            dict: "count" of the updated records
+        """
+        table = self.get_table(table_name)
+        self._expire(table)
+        with table.lock.write():
+            missing = [uid for uid in updates if table.records.get(uid) is None]
+            if missing:
+                raise KeyError(f"The ids {missing} do not exist in the table")
+            seq = table.seq
+            previous_records = []
+            try:
+                for uid, data in updates.items():
+                    previous = table.records[uid]
+                    previous_records.append((uid, previous))
+                    # copy on write, see update
+                    record = {**previous, **data}
+                    table.check_record(uid, record)
+                    table.unindex(uid, previous)
+                    table.records[uid] = record
+                    table.index(uid, record)
+                table.record_batch([{"op": "update", "id": uid, "data": data} for uid, data in updates.items()])
+            except Exception:
+                # whatever failed, the batch is undone unless it reached the log
+                if table.seq == seq:
+                    self._undo_updates(table, previous_records)
+                raise
+        return {"count": len(updates)}
+
+
+    @staticmethod
+    def _undo_write(table: Table, uid: int, written: Optional[dict], previous: Optional[dict],
+                    deadline: Optional[float]):
+        """ Put a record back after a failed add_one, update or delete, the write may be applied only in part
+
+        Args:
+            written (dict): the record the write stored, None for a delete
+            previous (dict): the record it replaced, None for a new id
+            deadline (float): the expiry deadline of the id before the write
+        """
+        # removing an entry an index does not hold is a no op
+        if written is not None:
+            table.unindex(uid, written)
+        if previous is not None:
+            table.unindex(uid, previous)
+            table.records[uid] = previous
+            table.index(uid, previous)
+        elif table.records.get(uid) is not None:
+            del table.records[uid]
+        if deadline is not None:
+            table.expiry.set(uid, deadline)
+        else:
+            table.expiry.discard(uid)
+
+
+    @staticmethod
+    def _undo_adds(table: Table, first_id: int, operations: List[dict]):
+        """ Remove the records of a failed add_many, the last one may be stored or indexed only in part """
+        for operation in reversed(operations):
+            uid = operation["id"]
+            # removing an entry an index does not hold is a no op
+            table.unindex(uid, operation["data"])
+            if table.records.get(uid) is not None:
+                del table.records[uid]
+            table.expiry.discard(uid)
+        table.auto_inc_id = first_id
+
+
+    @staticmethod
+    def _undo_updates(table: Table, previous_records: List[tuple]):
+        """ Restore the records of a failed update_many, the last one may be changed only in part """
+        for uid, previous in reversed(previous_records):
+            table.unindex(uid, table.records[uid])
+            table.unindex(uid, previous)
+            table.records[uid] = previous
+            table.index(uid, previous)
+
+
+    @timed("delete_many", "write")
+    def delete_many(self, ids: List[int], table_name: str = None):
+        """ Delete a batch of records, applied under the table write lock and logged as one unit
+
+        Args:
+            ids (List[int]): ids to delete, repeated ids are deleted once
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: An id does not exist in the table, nothing is deleted
+
+        Returns:
+            dict: "count" of the deleted records
+        """
+        table = self.get_table(table_name)
+        ids = list(dict.fromkeys(ids))
+        self._expire(table)
+        with table.lock.write():
+            missing = [uid for uid in ids if table.records.get(uid) is None]
+            if missing:
+                raise KeyError(f"The ids {missing} do not exist in the table")
+            for uid in ids:
+                table.unindex(uid, table.records[uid])
+                del table.records[uid]
+                table.expiry.discard(uid)
+            table.record_batch([{"op": "delete", "id": uid} for uid in ids])
+        return {"count": len(ids)}
+
+
+    def _deadline(self, table: Table, ttl: float = None):
+        """ Deadline of a record added now with a TTL of its own or the one of its table, None when neither is set """
+        ttl = ttl if ttl is not None else table.ttl
+        return time.time() + ttl if ttl is not None else None
+
+
+    def _expire(self, table: Table):
+        """ Delete the records of a table whose deadline has passed, called before its reads and snapshots.
+        Costs one heap peek when nothing is due. The writer logs the deletes so its replicas follow them.
+
+        Returns:
+            int: number of deleted records
+        """
+        now = time.time()
+        if not table.expiry.due(now):
+            return 0
+        log = self.role != "replica"
+        expired = 0
+        with table.lock.write():
+            for uid in table.expiry.pop_due(now):
+                record = table.records.get(uid)
+                if record is None:
+                    continue
+                table.unindex(uid, record)
+                del table.records[uid]
+                if log:
+                    table.record_mutation("delete", uid)
+                expired += 1
+        if expired:
+            logger.debug("Expired %d records of the table %s", expired, table.name)
+        return expired
+
+
+    def expire_records(self, table_name: str = None):
+        """ Delete the expired records of a table now instead of on its next read, see SnapshotScheduler
+
+        Args:
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: No table with that name
+
+        Returns:
+            int: number of deleted records
+        """
+        return self._expire(self.get_table(table_name))
+
+    def delete_table(self, table_name: str = None):
         """ Delete the table
 
+        Args:
+            table_name (str, optional): the default table when None
+
         Returns:
             str: status of the operation
         """
-        if self.table_name  is None:
-            raise KeyError(f"A table with name {self.table_name} already exists")
-        self.db_instance.delete_file(self.table_name, self.db_name, self.settings.extension)
-        del self.tables[self.table_name]
-        deleted_table = self.table_name
-        setattr(self, "table_name", None)
-        setattr(self, "auto_inc_status", False)
-        setattr(self, "auto_inc_id", 0)
-        self.fernet_instance = None
-        self.encryption_key = None
-        self.encrypt = False
-        return f"Table with name: {deleted_table} has been deleted"
+        table = self.get_table(table_name)
+        with table.lock.write():
+            del self.tables[table.name]
+            if table.shards:
+                shutil.rmtree(os.path.join(self.cur_dir, self.db_name, table.name), ignore_errors=True)
+            else:
+                self.db_instance.delete_file(table.name, self.db_name, table.extension, self.cur_dir)
+            had_log = table.wal is not None
+            table.close()
+            if had_log:
+                self.db_instance.delete_file(table.name, self.db_name, self.settings.log_extension, self.cur_dir)
+            self.db_instance.delete_file(table.name, self.db_name, self.settings.meta_extension, self.cur_dir)
+            self.db_instance.save_expiry({}, table.name, self.db_name, self.cur_dir)
+            self.db_instance.delete_file(table.name, self.db_name, table.extension + LOCK_SUFFIX, self.cur_dir)
+        self._publish_manifest()
+        if self.table_name == table.name:
+            # the most recently opened table left becomes the default one
+            setattr(self, "table_name", next(reversed(list(self.tables)), None))
+        return f"Table with name: {table.name} has been deleted"
     
     
-    def get_one(self, id: int):
+    @timed("get_one", "read")
+    def get_one(self, id: int, table_name: str = None):
         """ Get one object from the table
 
         Args:
             id (int): ID of the object
+            table_name (str, optional): the default table when None
         Returns:
             dict: object of the data
         """
-        self._table_name_id_exists(id)
-        return self.tables[self.table_name][id]
+        table = self.get_table(table_name)
+        self._expire(table)
+        record = table.records.get(id)
+        if record is None:
+            raise KeyError(f"The id {id} does not exist in the table")
+        return record
     
     
-    def get_all(self):
-        """ Get all the data in memory
+    @timed("get_all", "read")
+    def get_all(self, table_name: str = None):
+        """ Get all the data in memory, a point in time copy that later writes do not change
+
+        Args:
+            table_name (str, optional): the default table when None
         Returns:
             List[dict] : list of all the objects
         """
-        if self.tables.get(self.table_name) is None or self.table_name == "":
+        try:
+            table = self.get_table(table_name)
+        except KeyError:
             return "Table name does not exists"
-        return self.tables[self.table_name]
+        self._expire(table)
+        if isinstance(table.records, (LazyTable, SpillTable, ColumnarTable)):
+            return table.records.frozen().to_dict()
+        # one C level copy, it cannot interleave with a write
+        return dict(table.records)
+
+
+    def iter_records(self, after_id: int = None, table_name: str = None):
+        """ Yield (id, record) pairs of a table in id order without copying the table.
+        Ids are read from the id index ITER_BATCH at a time under the read lock, so a page costs
+        O(log n + limit) however sparse the ids are and records added while iterating are picked up.
+
+        Args:
+            after_id (int, optional): cursor, only ids greater than it are returned. Defaults to None.
+            table_name (str, optional): the default table when None
+        """
+        table = self.get_table(table_name)
+        self._expire(table)
+        uid = after_id
+        while True:
+            with table.lock.read():
+                ids = table.ids.after(uid, self.ITER_BATCH)
+            if not ids:
+                return
+            records = table.records
+            # a scan reads the spilled records without evicting the hot set
+            read = records.peek if isinstance(records, SpillTable) else records.get
+            for uid in ids:
+                record = read(uid)
+                if record is not None:
+                    yield uid, record
+
+
+    @timed("get_page", "read")
+    def get_page(self, limit: int, after_id: int = None, table_name: str = None):
+        """ Get one page of a table for cursor pagination
+
+        Args:
+            limit (int): max number of records
+            after_id (int, optional): id of the last record of the previous page. Defaults to None.
+            table_name (str, optional): the default table when None
+
+        Returns:
+            dict: "data" with the records keyed by id and "next_after_id", None on the last page
+        """
+        if limit <= 0:
+            raise ValueError("limit must be positive")
+        data = dict(islice(self.iter_records(after_id, table_name), limit))
+        next_after_id = None
+        if len(data) == limit:
+            last_id = next(reversed(data))
+            if any(True for _ in islice(self.iter_records(last_id, table_name), 1)):
+                next_after_id = last_id
+        return {"data": data, "next_after_id": next_after_id}
     
-    def save_snapshot(self):
+    def save_snapshot(self, force: bool = False, table_name: str = None):
         """ Save a snapshot of the in memory data to a file with structures as db_name/table_name.[extension]
 
+        Args:
+            force (bool, optional): rewrite the file even if nothing changed since the last snapshot. Defaults to False.
+            table_name (str, optional): the default table when None
+
         Returns:
             str: Message 
         """
-        if self.table_name == "":
+        if not (table_name or self.table_name):
             return "Table name does not exist"
-        if self.tables.get(self.table_name) is None:
-            raise KeyError("Table with name : {table_name} not found")
-        status = self.db_instance.save_data(self.tables[self.table_name], self.table_name, self.db_name, self.cur_dir,
-                                            self.settings.extension,
-                                            self.encrypt,
-                                            self.fernet_instance)
+        table = self.get_table(table_name)
+        if not force and table.dirty_count == 0:
+            return "No changes since the last snapshot"
+        # goes through the job queue so it never overlaps a background snapshot of the same file
+        return self.jobs.submit(table.name, self._snapshot, table).wait()
+
+
+    def submit_snapshot(self, force: bool = False, table_name: str = None):
+        """ Save a snapshot on a worker thread so the event loop keeps serving requests, the table is
+        frozen there too. A call made while a snapshot of the table is still queued or running gets that job:
+        a queued job freezes the table when it starts and saves the writes made until then, the writes made
+        after a running job froze it stay dirty for the next snapshot.
+
+        Args:
+            force (bool, optional): rewrite the file even if nothing changed since the last snapshot. Defaults to False.
+            table_name (str, optional): the default table when None
+
+        Returns:
+            SnapshotJob: the queued job, None when there is nothing to save
+        """
+        table = self.get_table(table_name)
+        if not force and table.dirty_count == 0:
+            return None
+        job = self.jobs.active_job(table.name)
+        if job is not None:
+            return job
+        return self.jobs.submit(table.name, self._snapshot, table)
+
+
+    def snapshot_status(self, job_id: str):
+        """ Status of a job returned by submit_snapshot """
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"No snapshot job with id {job_id}")
+        return job.to_dict()
+
+
+    def _snapshot(self, table: Table):
+        """ Job of save_snapshot and submit_snapshot: freeze the table, then write it.
+        Both run on the snapshot worker, the O(n) copy and the log checkpoint never block the event loop,
+        and jobs run one at a time so the tables are frozen in the order their snapshots are written.
+        """
+        if self.tables.get(table.name) is not table:
+            return "Table was deleted before the snapshot was written"
+        return self._write_snapshot(self._freeze_table(table))
+
+
+    @timed("freeze", "snapshot")
+    def _freeze_table(self, table: Table):
+        """ Point in time copy of a table, taken on the snapshot worker under the table read lock.
+        Only the id -> record mapping is copied, records are never mutated in place so they can be shared.
+        Expired records are deleted first, they never reach a snapshot.
+        """
+        self._expire(table)
+        records = table.records
+        with table.lock.read():
+            changed_ids, generation = table.freeze_changes()
+            return {
+                "expiry": table.expiry.to_dict(),
+                "table": table,
+                "data": records.frozen() if isinstance(records, (LazyTable, SpillTable, ColumnarTable)) else dict(records),
+                "db_name": self.db_name,
+                "wal_seq": table.wal.checkpoint() if table.wal is not None else None,
+                "dirty_count": table.dirty_count,
+                "changed_ids": changed_ids,
+                "generation": generation,
+            }
+
+
+    @timed("write_snapshot", "snapshot")
+    def _write_snapshot(self, frozen: dict):
+        """ Serialize a frozen table, safe to run off the event loop """
+        table = frozen["table"]
+        if self.tables.get(table.name) is not table:
+            return "Table was deleted before the snapshot was written"
+        # unchanged records are copied from the snapshot on disk when it is the previous one
+        changed_ids = frozen["changed_ids"] if table.extends_saved(frozen["generation"]) else None
+        if table.shards:
+            # a failed shard raises, an empty list means no shard changed and the snapshot still holds
+            self.db_instance.save_shards(frozen["data"], table.shards, table.name, frozen["db_name"],
+                                         self.cur_dir, table.extension, table.encrypt, table.fernet_instance,
+                                         pretty=table.pretty, changed_ids=changed_ids,
+                                         compression=table.compression)
+            status = True
+        else:
+            status = self.db_instance.save_data(frozen["data"], table.name, frozen["db_name"], self.cur_dir,
+                                            table.extension,
+                                            table.encrypt,
+                                            table.fernet_instance,
+                                            pretty=table.pretty,
+                                            changed_ids=changed_ids,
+                                            compression=table.compression)
         if status:
+            self.db_instance.save_expiry(frozen["expiry"], table.name, frozen["db_name"], self.cur_dir)
+            # the snapshot now holds every operation logged before the freeze
+            if table.wal is not None:
+                table.wal.truncate(frozen["wal_seq"])
+            table.mark_saved(frozen["dirty_count"], frozen["generation"])
             return "Data saved successfull"
-        
-        
-    def _auto_increment_id(self):
-        if self.auto_inc_status:
-            self.auto_inc_id += 1
             
     
-    def load_data(self, db_name: str, table_name: str, encrypt: bool= False, key: str = ""):
-        """ Load a persisting db table in memory
+    @timed("load_data", "load")
+    def load_data(self, db_name: str, table_name: str, encrypt: bool= False, key: str = "", save: str = "auto",
+                  extension: str = None, lazy: bool = False, read_only: bool = False, memory_budget: int = None):
+        """ Load a persisting db table in memory next to the tables already open, it becomes the default table
 
         Args:
             db_name (str): database name
             table_name (str): table name
+            save (str, optional): options for persisting to permanent storage. Defaults to "auto".
+            extension (str, optional): snapshot format, ".json" or ".burp". Defaults to the one found on disk.
+            lazy (bool, optional): memory map a ".burp" snapshot and decode records on first access,
+                startup no longer depends on the table size. Indexes still read every record. Defaults to False.
+            read_only (bool, optional): open no log and never save, for read replicas. Defaults to False.
+            memory_budget (int, optional): bytes of records kept in memory, the cold ones spill to disk.
+                Defaults to settings.memory_budget. A lazy table keeps its cold records in the snapshot instead,
+                a table with a schema is held in columns.
+
+        Raises:
+            ValueError: The instance already serves another database
+            ValueError: lazy is set for a table with a schema or a sharded table
+            KeyError: The table is already loaded or being loaded
 
         Returns:
             str: message
         """
+        if self.db_name is not None and self.db_name != db_name:
+            raise ValueError(f"This instance serves the database {self.db_name}, not {db_name}")
+        with self._load_lock:
+            if table_name in self.tables or table_name in self.loading:
+                raise KeyError(f"The table {table_name} is already loaded")
+            progress = self.loading[table_name] = {}
+        try:
+            return self._load_table(db_name, table_name, encrypt, key, save, extension, lazy, read_only,
+                                    memory_budget, progress)
+        finally:
+            self.loading.pop(table_name, None)
+
+
+    def _load_table(self, db_name: str, table_name: str, encrypt: bool, key: str, save: str, extension: str,
+                    lazy: bool, read_only: bool, memory_budget: int, progress: dict):
+        """ Body of load_data once the table name is reserved, progress receives the loader's progress """
+        self.save_policy = SavePolicy.parse("manual" if read_only else save)
         if self.db_instance is None:
-            print("Intitiazling a new instance in memory")
-            status = self._create_db_instance()
-            if status:
-                print("New instance initialized")
+            logger.debug("Initializing a new instance in memory")
+            if not self._create_db_instance():
+                logger.error("Something went wrong while creating the instance")
+        meta = self.db_instance.load_meta(table_name, db_name, self.cur_dir)
+        if meta.get("shards"):
+            # the shards are in a folder, the meta records their format
+            extension = meta["extension"]
+        else:
+            extension = self.db_instance.detect_extension(table_name, db_name, self.cur_dir, extension)
+        table = Table(table_name, extension, encrypt=bool(encrypt), encryption_key=key)
+        table.schema = meta.get("schema")
+        table.shards = meta.get("shards")
+        if lazy and table.schema is not None:
+            raise ValueError("A table with a schema is held in columns, it cannot be loaded lazily")
+        if lazy and table.shards:
+            raise ValueError("A sharded table is loaded from several snapshots, it cannot be loaded lazily")
+        records = None if lazy else self._new_records(table, memory_budget)
+        # a persister of its own keeps the replay counters of tables loaded concurrently apart, see warm_start
+        loader = DataPersister(self.settings)
+        loader.load_progress = progress
+        if table.shards:
+            existing_data, max_uid = loader.load_shards(db_name, table_name, table.shards, extension,
+                                                                  self.cur_dir, table.encrypt, table.fernet_instance,
+                                                                  records)
+        else:
+            existing_data, max_uid = loader.load_data(db_name, table_name, extension, self.cur_dir,
+                                                      table.encrypt, table.fernet_instance, lazy, records)
+        table.records = existing_data
+        table.auto_inc_id = max_uid + 1 if max_uid is not None else 0
+        setattr(self, "db_name", db_name)
+        table.pretty = meta.get("pretty", False)
+        # snapshots are read whatever their codec, this one is used for the next saves
+        table.compression = meta.get("compression", self._snapshot_compression(extension))
+        table.incarnation = meta.get("incarnation")
+        table.ttl = meta.get("ttl")
+        # deadlines of the snapshot, then the ones the log set or cleared after it
+        deadlines = loader.load_expiry(table_name, db_name, self.cur_dir)
+        for uid, deadline in loader.replayed_expiry.items():
+            if deadline is None:
+                deadlines.pop(uid, None)
             else:
-                print("Something went wrong")
-        if encrypt:
-            setattr(self, "encrypt", encrypt)
-            setattr(self, "encryption_key", key)
-            setattr(self, "fernet_instance", create_fernet_instance(key))
-        existing_data, max_uid = self.db_instance.load_data(db_name, table_name, self.settings.extension, self.cur_dir, self.encrypt, self.fernet_instance)
-        self.auto_inc_status = True
-        self.auto_inc_id = max_uid + 1
-        self.tables[table_name] = existing_data
+                deadlines[uid] = deadline
+        table.expiry = ExpiryHeap({uid: deadline for uid, deadline in deadlines.items()
+                                   if existing_data.get(uid) is not None})
+        self._rebuild_indexes(table)
+        table.applied_seq = loader.replayed_seq
+        if not read_only:
+            table.wal = self.db_instance.open_log(table_name, db_name, self.cur_dir, table.fernet_instance)
+            # records replayed from the log are not in the snapshot yet
+            table.dirty_count = loader.replayed_records
+            table.changed_ids = set(loader.replayed_ids)
+        # records that expired while the table was closed
+        self._expire(table)
+        self.tables[table_name] = table
         setattr(self, "table_name", table_name)
-        setattr(self, "db_name", db_name)
-        print("Initialized the existing database table")
+        self._publish_manifest()
+        logger.info("Loaded the table %s with %d records", table_name, len(table))
         return "Loaded the data in memory"
+
+
+    def load_progress(self) -> Dict[str, dict]:
+        """ Progress of the tables being loaded, for another thread while load_data runs
+
+        Returns:
+            dict: table name -> "filepath" being read, "records" and "bytes_read" so far and "total_bytes" of the file.
+                Only JSON snapshots streamed from disk report progress, the other loads are listed empty.
+        """
+        return {name: dict(progress) for name, progress in list(self.loading.items())}
+
+
+    def discover_tables(self, db_name: str) -> List[str]:
+        """ Names of the tables saved in a database folder: snapshot files and the folders of sharded tables
+
+        Raises:
+            FileNotFoundError: No folder for the database
+        """
+        folder = os.path.join(self.cur_dir, db_name)
+        if not os.path.isdir(folder):
+            raise FileNotFoundError(f"The database {db_name} does not exist in {self.cur_dir}")
+        # ".json.gz" before ".json"
+        extensions = sorted(DataPersister.SNAPSHOT_EXTENSIONS, key=len, reverse=True)
+        names = set()
+        for entry in os.listdir(folder):
+            if entry.endswith(self.settings.meta_extension):
+                name = entry[:-len(self.settings.meta_extension)]
+                if os.path.isdir(os.path.join(folder, name)):
+                    names.add(name)
+                continue
+            for extension in extensions:
+                if entry.endswith(extension) and len(entry) > len(extension):
+                    names.add(entry[:-len(extension)])
+                    break
+        return sorted(names)
+
+
+    def warm_start(self, db_name: str, keys: Dict[str, str] = None, save: str = "auto", workers: int = None):
+        """ Load every table saved in a database folder, concurrently, so the first requests find them in memory
+
+        Args:
+            db_name (str): database name
+            keys (dict, optional): table name -> key of the encrypted tables, the ones without a key are skipped
+            save (str, optional): options for persisting to permanent storage. Defaults to "auto".
+            workers (int, optional): tables loaded at once. Defaults to the number of CPUs.
+
+        Raises:
+            ValueError: The instance already serves another database
+            FileNotFoundError: No folder for the database
+
+        Returns:
+            dict: table name -> seconds its load took, or the error that stopped it
+        """
+        if self.db_name is not None and self.db_name != db_name:
+            raise ValueError(f"This instance serves the database {self.db_name}, not {db_name}")
+        names = self.discover_tables(db_name)
+        keys = keys or {}
+        if self.db_instance is None:
+            self._create_db_instance()
+        pending = []
+        for name in names:
+            if name in self.tables:
+                continue
+            if self.db_instance.load_meta(name, db_name, self.cur_dir).get("encrypt") and not keys.get(name):
+                logger.warning("No key for the encrypted table %s, it is not loaded", name)
+                continue
+            pending.append(name)
+
+        def load(name):
+            started = time.perf_counter()
+            try:
+                self.load_data(db_name, name, bool(keys.get(name)), keys.get(name, ""), save)
+            except Exception as e:
+                logger.error("Could not load the table %s: %s - %s", name, type(e).__name__, e)
+                return f"{type(e).__name__} - {e}"
+            seconds = time.perf_counter() - started
+            logger.info("Warm start loaded the table %s with %d records in %.3fs", name, len(self.tables[name]), seconds)
+            return seconds
+
+        self.save_policy = SavePolicy.parse(save)
+        setattr(self, "db_name", db_name)
+        timings = {}
+        if pending:
+            with ThreadPoolExecutor(max_workers=workers or min(len(pending), os.cpu_count() or 1)) as pool:
+                timings = dict(zip(pending, pool.map(load, pending)))
+        loaded = [name for name in pending if name in self.tables]
+        if loaded:
+            # the default table does not depend on which load finished last
+            setattr(self, "table_name", loaded[-1])
+        return timings
     
     
-    # This is will not work for now
-    def _append_data_to_db(self, table_name: str):
-        if self.tables.get(table_name) is None:
-            raise KeyError(f"The table name: {table_name} does not exist")
-        self.db_instance.add_single_data(self.db_name, table_name, self.settings.extension, self.auto_inc_id-1, self.tables[table_name][self.auto_inc_id-1], self.settings.encoding)
-        
-            
+    def create_index(self, table_name: str, field: str, unique: bool = False, kind: str = "hash"):
+        """ Create an index on a field, "hash" for O(1) equality lookups
+        or "ordered" for range, prefix and top-N queries as well
 
-        
-        
\ No newline at end of file
+        Args:
+            table_name (str): table to index
+            field (str): record field to index
+            unique (bool, optional): reject records that repeat a value of the field. Defaults to False.
+            kind (str, optional): "hash" or "ordered". Defaults to "hash".
+
+        Raises:
+            KeyError: No table with that name
+            KeyError: The field is already indexed
+            ValueError: Unknown index kind
+            ValueError: unique is set and the table already holds duplicate values
+
+        Returns:
+            dict: description of the index
+        """
+        table = self.get_table(table_name)
+        with table.lock.write():
+            if field in table.indexes:
+                raise KeyError(f"The field {field} of {table.name} is already indexed")
+            index = make_index(kind, field, unique)
+            index.build(table.records)
+            table.indexes[field] = index
+            self._save_index_definitions(table)
+        self._publish_manifest()
+        return index.describe()
+
+
+    def drop_index(self, table_name: str, field: str):
+        """ Drop the index on a field
+
+        Raises:
+            KeyError: The field is not indexed
+        """
+        table = self.get_table(table_name)
+        with table.lock.write():
+            if field not in table.indexes:
+                raise KeyError(f"The field {field} of {table.name} is not indexed")
+            del table.indexes[field]
+            self._save_index_definitions(table)
+        self._publish_manifest()
+        return f"Dropped the index on {field}"
+
+
+    @timed("find", "read")
+    def find(self, field: str, value, table_name: str = None):
+        """ Records of a table whose field equals value, answered from the index on that field
+
+        Args:
+            field (str): indexed field
+            value: value to look up
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: The field is not indexed
+
+        Returns:
+            dict: matching records keyed by id
+        """
+        table = self.get_table(table_name)
+        self._expire(table)
+        with table.lock.read():
+            index = table.indexes.get(field)
+            if index is None:
+                raise KeyError(f"The field {field} is not indexed, create an index first")
+            records = table.records
+            return {uid: records[uid] for uid in sorted(index.lookup(value))}
+
+
+    @timed("range", "read")
+    def range(self, field: str, low=None, high=None, prefix: str = None,
+              limit: int = None, offset: int = 0, order: str = "asc", table_name: str = None):
+        """ Records of a table in the order of an ordered index,
+        costs O(log n + offset + limit) instead of a table scan
+
+        Args:
+            field (str): field with an ordered index
+            low (optional): smallest value, inclusive
+            high (optional): largest value, inclusive
+            prefix (str, optional): only string values starting with prefix
+            limit (int, optional): max number of records. Defaults to None.
+            offset (int, optional): number of matching records to skip. Defaults to 0.
+            order (str, optional): "asc" or "desc", "desc" with a limit gives the top-N. Defaults to "asc".
+            table_name (str, optional): the default table when None
+
+        Raises:
+            KeyError: The field has no ordered index
+            ValueError: Invalid order or bounds
+
+        Returns:
+            dict: matching records keyed by id, in index order
+        """
+        table = self.get_table(table_name)
+        index = table.indexes.get(field)
+        if index is None or not hasattr(index, "range"):
+            raise KeyError(f"The field {field} has no ordered index, create one with kind='ordered'")
+        if order not in ("asc", "desc"):
+            raise ValueError(f"order must be asc or desc, got {order}")
+        stop = offset + limit if limit is not None else None
+        self._expire(table)
+        with table.lock.read():
+            uids = islice(index.range(low, high, prefix, reverse=order == "desc"), offset, stop)
+            records = table.records
+            return {uid: records[uid] for uid in uids}
+
+
+    def _save_index_definitions(self, table: Table):
+        meta = self.db_instance.load_meta(table.name, self.db_name, self.cur_dir)
+        meta["indexes"] = [index.describe() for index in table.indexes.values()]
+        self.db_instance.save_meta(meta, table.name, self.db_name, self.cur_dir)
+
+
+    def _rebuild_indexes(self, table: Table):
+        """ Build the id index and the indexes recorded in the table metadata from the loaded records """
+        table.ids.build(table.records)
+        meta = self.db_instance.load_meta(table.name, self.db_name, self.cur_dir)
+        table.indexes = {}
+        for definition in meta.get("indexes", []):
+            index = make_index(definition.get("kind", "hash"), definition["field"], definition.get("unique", False))
+            index.build(table.records)
+            table.indexes[index.field] = index
+
+
+    def unload_table(self, table_name: str):
+        """ Close a table and drop it from memory, its files stay on disk
+
+        Raises:
+            KeyError: No open table with that name
+        """
+        table = self.get_table(table_name)
+        with table.lock.write():
+            del self.tables[table.name]
+            table.close()
+        if self.table_name == table.name:
+            setattr(self, "table_name", next(reversed(list(self.tables)), None))
+        self._publish_manifest()
+        return f"Table with name: {table.name} has been unloaded"
+
+
+    @timed("apply_log_records", "write")
+    def apply_log_records(self, table_name: str, records: List[dict]):
+        """ Apply records tailed from the writer's log to a table of a read replica, indexes included
+
+        Args:
+            table_name (str): table the log belongs to
+            records (List[dict]): log records in sequence order
+        """
+        table = self.get_table(table_name)
+        with table.lock.write():
+            for record in records:
+                events = []
+                for operation in log_operations(record):
+                    uid = operation["id"]
+                    previous = table.records.get(uid)
+                    if operation["op"] == "update":
+                        if previous is None:
+                            continue
+                        record_data = {**previous, **operation["data"]}
+                    elif operation["op"] == "add":
+                        record_data = operation["data"]
+                    else:
+                        record_data = None
+                    if previous is not None:
+                        table.unindex(uid, previous)
+                    if record_data is None:
+                        table.records.pop(uid, None)
+                        table.expiry.discard(uid)
+                    else:
+                        table.records[uid] = record_data
+                        table.index(uid, record_data)
+                        if "expires_at" in operation:
+                            table.expiry.set(uid, operation["expires_at"])
+                        elif operation["op"] == "add":
+                            table.expiry.discard(uid)
+                    table.auto_inc_id = max(table.auto_inc_id, uid + 1)
+                    events.append(operation)
+                table.applied_seq = record.get("seq", table.applied_seq)
+                if table.feed is not None and events:
+                    table.feed.publish({**operation, "seq": table.applied_seq} for operation in events)
+
+
+    def subscribe_changes(self, table_name: str = None, after_seq: int = None, incarnation: str = None,
+                          buffer_size: int = None, loop=None):
+        """ Follow the inserts, updates and deletes of a table, see ChangeFeed
+
+        A client that knows the table up to after_seq gets the events after it. A new client, or one
+        whose events left the history or that knew another incarnation of the table, gets a copy of
+        the table first. The copy and the subscription are taken under the write lock, so no event
+        is missed or applied twice.
+
+        Args:
+            table_name (str, optional): the default table when None
+            after_seq (int, optional): sequence number of the last event the client applied. Defaults to None.
+            incarnation (str, optional): incarnation of the table after_seq belongs to. Defaults to None.
+            buffer_size (int, optional): events buffered for the client. Defaults to settings.feed_buffer.
+            loop (optional): event loop the client reads on. Defaults to the running loop.
+
+        Raises:
+            KeyError: No table with that name
+
+        Returns:
+            dict: "seq" of the state the client starts from, "incarnation", "snapshot" with the records
+                keyed by id or None when resuming, "events" to apply before the live ones and "subscription",
+                a FeedSubscription to close once the client is gone
+        """
+        table = self.get_table(table_name)
+        # expired records are deleted first, the copy never holds them
+        self._expire(table)
+        with table.lock.write():
+            if table.feed is None:
+                table.feed = ChangeFeed(table.seq, self.settings.feed_history)
+            seq = table.seq
+            events = None
+            if after_seq is not None and after_seq <= seq and incarnation in (None, table.incarnation):
+                events = table.feed.since(after_seq)
+            snapshot = None
+            if events is None:
+                records = table.records
+                snapshot = records.frozen() if isinstance(records, (LazyTable, SpillTable, ColumnarTable)) \
+                    else dict(records)
+                events = []
+            subscription = table.feed.subscribe(seq, buffer_size or self.settings.feed_buffer, loop)
+        return {"seq": seq, "incarnation": table.incarnation, "snapshot": snapshot, "events": events,
+                "subscription": subscription}
+
+
+    def follow_indexes(self, table_name: str, definitions: List[dict]):
+        """ Build and drop indexes of a replica table to match the writer's definitions, nothing is saved """
+        table = self.get_table(table_name)
+        wanted = {definition["field"]: definition for definition in definitions}
+        with table.lock.write():
+            for field in [field for field, index in table.indexes.items() if index.describe() != wanted.get(field)]:
+                del table.indexes[field]
+            for field, definition in wanted.items():
+                if field not in table.indexes:
+                    index = make_index(definition.get("kind", "hash"), field, definition.get("unique", False))
+                    index.build(table.records)
+                    table.indexes[field] = index
+
+
+    def _publish_manifest(self):
+        """ Tell the read replicas which tables a writer serves """
+        if self.role != "writer" or self.db_instance is None:
+            return
+        manifest = {
+            "db_name": self.db_name,
+            "tables": {name: {"extension": table.extension,
+                              "encrypt": table.encrypt,
+                              "incarnation": table.incarnation,
+                              "indexes": [index.describe() for index in table.indexes.values()]}
+                       for name, table in list(self.tables.items())},
+        }
+        # tables loaded concurrently publish through the same temporary file
+        with self._manifest_lock:
+            self.db_instance.save_manifest(manifest, self.db_name, self.cur_dir)
+
+
+    def snapshot_due(self, table_name: str = None):
+        """ Whether the save policy asks for a snapshot of a table """
+        table = self.tables.get(table_name or self.table_name)
+        if table is None:
+            return False
+        return self.save_policy.is_due(table.dirty_count, table.seconds_since_save())
+
+
+    def dirty_tables(self):
+        """ Names of the open tables with changes that are not in their snapshot yet """
+        return [name for name, table in list(self.tables.items()) if table.dirty_count]
+
+
+    def _snapshot_compression(self, extension: str, compression: str = None):
+        """ Codec of the JSON snapshots of a table: the one asked for, the one its extension names, then the setting
+
+        Raises:
+            ValueError: Compression asked for a binary snapshot
+        """
+        if extension == BINARY_EXTENSION:
+            if compression is not None:
+                raise ValueError("Binary snapshots are read in place and are not compressed, use a JSON extension")
+            return None
+        return compression or COMPRESSED_EXTENSIONS.get(extension) or self.settings.compression
+
+
+    def _new_records(self, table: Table, memory_budget: int = None):
+        """ Empty records of a table, a ColumnarTable when it has a schema
+        and a SpillTable when a memory budget applies
+
+        Raises:
+            ValueError: Not a valid budget or cache policy
+        """
+        if table.schema is not None:
+            return ColumnarTable(table.schema)
+        budget = memory_budget if memory_budget is not None else self.settings.memory_budget
+        if budget is None:
+            return {}
+        return SpillTable(budget, self.settings.cache_policy, self.db_instance.serializer,
+                          table.fernet_instance, self.settings.spill_dir)
+
+
+    @timed("column", "read")
+    def column(self, field: str, table_name: str = None):
+        """ Values of one field keyed by id, read straight from the column of a table with a schema
+
+        Raises:
+            KeyError: No table with that name or the field is not in its schema
+            ValueError: The table has no schema
+        """
+        table = self.get_table(table_name)
+        if table.schema is None:
+            raise ValueError(f"The table {table.name} has no schema, its records are not stored in columns")
+        self._expire(table)
+        return table.records.column(field)
+
+
+    def cache_stats(self, table_name: str = None):
+        """ Hits, misses, evictions and memory use of the tables with a memory budget,
+        of one table or of every open table. Tables without a budget report None
+        """
+        if table_name is not None:
+            tables = {table_name: self.get_table(table_name)}
+        else:
+            tables = dict(self.tables)
+        return {name: table.records.cache_stats() if isinstance(table.records, SpillTable) else None
+                for name, table in tables.items()}
+
+
+    def lock_stats(self, table_name: str = None):
+        """ Lock counters and wait times in seconds, of one table or of every open table """
+        if table_name is not None:
+            return {table_name: self.get_table(table_name).lock.stats()}
+        return {name: table.lock.stats() for name, table in list(self.tables.items())}
+
+
+    def close(self):
+        """ Wait for the running snapshots, commit the pending log records and release the open tables """
+        self.jobs.shutdown(wait=True)
+        for table in list(self.tables.values()):
+            table.close()
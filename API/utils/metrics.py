@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+from bisect import bisect_left
+from functools import wraps
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Tuple
+)
+
+# seconds, from a dict lookup to a snapshot of a large table
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Iterable[str], values: Iterable) -> str:
+    """ {name="value",...} of a sample, empty without labels """
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1 << 53:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """ Monotonic count per label values """
+    TYPE = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        return [(self.name, format_labels(self.labelnames, labels), value) for labels, value in values]
+
+
+class Histogram:
+    """
+    Distribution of observed values per label values, in cumulative buckets.
+
+    An observation is one bisect and three increments under a lock, cheap enough for every call of the engine.
+    """
+    TYPE = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {} # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labelvalues) -> int:
+        series = self._series.get(labelvalues)
+        return sum(series[:-1]) if series is not None else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        samples = []
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), values[:-1]):
+                cumulative += count
+                samples.append((self.name + "_bucket",
+                                format_labels(self.labelnames + ("le",), labels + (format_value(bound),)),
+                                cumulative))
+            label_text = format_labels(self.labelnames, labels)
+            samples.append((self.name + "_count", label_text, cumulative))
+            samples.append((self.name + "_sum", label_text, values[-1]))
+        return samples
+
+
+class Gauge:
+    """ Value per label values read when the metrics are rendered """
+    TYPE = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def set(self, value: float, *labelvalues):
+        self._values[labelvalues] = value
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        return [(self.name, format_labels(self.labelnames, labels), value)
+                for labels, value in list(self._values.items())]
+
+
+def render(metrics: Iterable) -> str:
+    """ Prometheus text exposition format (version 0.0.4) of counters, gauges and histograms """
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.TYPE}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# metrics of the engine, shared by every Burp instance of the process
+OPERATION_SECONDS = Histogram("burp_operation_seconds", "Latency of the Burp operations", ("op", "kind"))
+OPERATION_ERRORS = Counter("burp_operation_errors_total", "Burp operations that raised", ("op", "kind"))
+BYTES_WRITTEN = Counter("burp_bytes_written_total", "Bytes written to snapshots and logs", ("kind",))
+BYTES_READ = Counter("burp_bytes_read_total", "Bytes read from snapshots and logs", ("kind",))
+ENGINE_METRICS = (OPERATION_SECONDS, OPERATION_ERRORS, BYTES_WRITTEN, BYTES_READ)
+
+
+def timed(op: str, kind: str):
+    """ Decorator recording the latency of every call in OPERATION_SECONDS, and the calls that raise
+
+    Args:
+        op (str): operation name, the method name
+        kind (str): "read", "write", "snapshot" or "load"
+    """
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                OPERATION_ERRORS.inc(op, kind)
+                raise
+            finally:
+                OPERATION_SECONDS.observe(time.perf_counter() - started, op, kind)
+        return wrapper
+    return decorate
+
+
+def add_file_bytes(counter: Counter, kind: str, filepath: str):
+    """ Add the size of a file to a byte counter, nothing when the file is gone """
+    try:
+        counter.inc(kind, amount=os.path.getsize(filepath))
+    except OSError:
+        pass
@@ -1,15 +1,26 @@
 import os 
+import copy
 import json 
-import pickle
+import logging
 from typing import (
     List,
     Optional,
-    Dict
+    Dict,
+    Set
 )
-import msvcrt
-from .generator import encrypt_data, decrypt_data
+from .filelock import FileLock, write_atomic
+from .compression import COMPRESSED_EXTENSIONS, check_compression, compress_chunks, decompress
+from .generator import CHUNK_SIZE, encrypt_chunks, encrypt_stream, process_pool
+from .loader import StreamingJsonLoader
+from .wal import WriteAheadLog, apply_log_record, log_operations
+from .serializers import dump_chunks, get_serializer
+from .binary import BINARY_EXTENSION, BinarySnapshot, write_binary_snapshot
+from .lazy import LazyTable
+from .metrics import BYTES_READ, BYTES_WRITTEN, add_file_bytes
 from cryptography.fernet import Fernet
 
+logger = logging.getLogger(__name__)
+
 class DataPersistSettings:
     """
     Base class for data persistence settings.
@@ -17,20 +28,63 @@ class DataPersistSettings:
     DEFAULT_FOLDER = 'data' # describes the database name
     DEFAULT_EXTENSION = '.json'
     DEFAULT_ENCODING = 'utf-8'
+    DEFAULT_LOG_EXTENSION = '.wal'
+    DEFAULT_META_EXTENSION = '.meta'
+    DEFAULT_EXPIRY_EXTENSION = '.ttl' # deadlines of the records of a snapshot that expire
+    DEFAULT_MANIFEST = 'burp.manifest' # open tables of a writer, followed by its read replicas
+    DEFAULT_FSYNC = 'batch' # one of WriteAheadLog.FSYNC_POLICIES
+    DEFAULT_GROUP_COMMIT_SIZE = 64
+    DEFAULT_GROUP_COMMIT_INTERVAL = 0.05 # seconds
+    DEFAULT_CRYPTO_WORKERS = os.cpu_count() or 1
+    DEFAULT_PARALLEL_MIN_RECORDS = 50000 # smaller tables are encrypted on the calling thread
+    DEFAULT_LOCK_TIMEOUT = 10.0 # seconds a save or a load waits for the snapshot file lock
+    DEFAULT_CACHE_POLICY = 'lru' # one of cache.CACHE_POLICIES
+    DEFAULT_SHARD_WORKERS = os.cpu_count() or 1
+    DEFAULT_PARALLEL_MIN_BYTES = 1 << 23 # smaller sharded tables are loaded on the calling thread
 
-    def __init__(self, folder=None, extension=None, encoding=None):
+    def __init__(self, folder=None, extension=None, encoding=None,
+                 wal=True, fsync=None, group_commit_size=None, group_commit_interval=None,
+                 serializer=None, streaming_load=True, crypto_workers=None, parallel_min_records=None,
+                 lock_timeout=None, memory_budget=None, cache_policy=None, spill_dir=None,
+                 compression=None, compression_level=None, shard_workers=None, parallel_min_bytes=None,
+                 feed_history=None, feed_buffer=None):
         """
         Initializes settings with optional overrides.
         """
         self.folder = folder or self.DEFAULT_FOLDER
         self.extension = extension or self.DEFAULT_EXTENSION
         self.encoding = encoding or self.DEFAULT_ENCODING
+        self.wal = wal
+        self.log_extension = self.DEFAULT_LOG_EXTENSION
+        self.meta_extension = self.DEFAULT_META_EXTENSION
+        self.expiry_extension = self.DEFAULT_EXPIRY_EXTENSION
+        self.manifest = self.DEFAULT_MANIFEST
+        self.fsync = fsync or self.DEFAULT_FSYNC
+        self.group_commit_size = group_commit_size or self.DEFAULT_GROUP_COMMIT_SIZE
+        self.group_commit_interval = group_commit_interval if group_commit_interval is not None else self.DEFAULT_GROUP_COMMIT_INTERVAL
+        self.serializer = serializer # "orjson" or "json", None picks orjson when it is installed
+        self.streaming_load = streaming_load # parse JSON snapshots record by record, peak memory ~1x the table
+        self.crypto_workers = crypto_workers or self.DEFAULT_CRYPTO_WORKERS # processes for encrypted saves and loads
+        self.parallel_min_records = parallel_min_records if parallel_min_records is not None else self.DEFAULT_PARALLEL_MIN_RECORDS
+        self.lock_timeout = lock_timeout if lock_timeout is not None else self.DEFAULT_LOCK_TIMEOUT
+        # bytes of records each table keeps in memory, the cold ones spill to disk. None keeps every record in memory
+        self.memory_budget = memory_budget
+        self.cache_policy = cache_policy or self.DEFAULT_CACHE_POLICY
+        self.spill_dir = spill_dir # None uses the system temp directory
+        # "gzip", "zlib" or "lzma" for the JSON snapshots of tables whose extension names no codec, None writes plain JSON
+        self.compression = check_compression(compression)
+        self.compression_level = compression_level # None uses the codec default
+        self.shard_workers = shard_workers or self.DEFAULT_SHARD_WORKERS # processes saving or loading shards
+        self.parallel_min_bytes = parallel_min_bytes if parallel_min_bytes is not None else self.DEFAULT_PARALLEL_MIN_BYTES
+        self.feed_history = feed_history # change events kept per table for resuming clients, None uses ChangeFeed's
+        self.feed_buffer = feed_buffer # change events buffered per client before it is dropped, None uses ChangeFeed's
       
 
 class DataPersister:
     """
     Base class for data persisters.
     """
+    SNAPSHOT_EXTENSIONS = (DataPersistSettings.DEFAULT_EXTENSION, BINARY_EXTENSION) + tuple(COMPRESSED_EXTENSIONS)
 
     def __init__(self, settings):
         """
@@ -44,20 +98,30 @@ class DataPersister:
         self.directory_permissions = 0o755  # Read, write, and execute for owner, read and execute for group and others
         self.file_permissions = 0o664      # Read and write for owner, read for group and others
         self.indent = 4
+        self.replayed_records = 0 # log records applied by the last load
+        self.replayed_ids = set() # ids those records touched
+        self.replayed_seq = 0 # sequence number of the last of them
+        self.replayed_expiry = {} # id -> deadline they set, None for the records left without one
+        self.serializer = get_serializer(settings.serializer)
+        self.load_progress = {} # records and bytes read by the running or last load, updated in place
 
     
     def create_table_file(self, filename, foldername, current_dir,
-                        data = {}
+                        data = {},
+                        extension = None
                         ):
         """
         First creates a file with the table name with empty data 
         Saves data to a file based on settings.
-        
+
+        Args:
+            extension: Snapshot format of the table, the settings extension when None.
 
         Raises:
             OSError: If an error occurs while creating the folder or saving the data.
         """
-        db_filepath = os.path.join(foldername, filename + self.settings.extension)
+        extension = extension or self.settings.extension
+        db_filepath = os.path.join(foldername, filename + extension)
         db_filepath = os.path.join(current_dir, db_filepath)
         if not self.check_exists(db_filepath):
             # Create the folder if it doesn't exist
@@ -66,13 +130,16 @@ class DataPersister:
             #os.chmod(db_filepath, self.file_permissions)
             #os.chmod(os.path.join(os.getcwd(), foldername), self.directory_permissions)
         try:
-            with open(db_filepath, 'w') as persistent_file:
-                json.dump(data, persistent_file)
+            lock = self.file_lock(db_filepath)
+            if extension == BINARY_EXTENSION:
+                write_binary_snapshot(db_filepath, data, self.serializer, lock=lock)
+            else:
+                write_atomic(db_filepath, [self.serializer.dumps(data)], lock=lock)
 
         except Exception as e:
             raise Exception(f"Error saving data to file: {db_filepath} with error {e}")
         else:
-            print(f"The table {db_filepath} already exists")
+            logger.debug("Created the table file %s", db_filepath)
         # print(db_filepath)
         setattr(self, "db_filepath", db_filepath)
         return db_filepath
@@ -98,6 +165,9 @@ class DataPersister:
                   encrypt: bool,
                   fernet_instance: Fernet,
                   encoding: str = None,
+                  pretty: bool = False,
+                  changed_ids: Optional[Set[int]] = None,
+                  compression: Optional[str] = None,
                   )-> str: 
         """
         Saves the data
@@ -107,6 +177,11 @@ class DataPersister:
             file_name: The file name.
             extension: The extension of the file defaults = 'json'.
             encoding: Optional 
+            pretty: Indent the JSON, off by default as it inflates the file.
+            changed_ids: Ids changed since the existing snapshot was saved, a binary snapshot
+                then only serializes and encrypts those records again.
+            compression: "gzip", "zlib" or "lzma" for a JSON snapshot, streamed record batch by record batch.
+                Encrypted snapshots are compressed before they are encrypted.
 
         Returns:
             str: file path to the saved data locally.
@@ -115,11 +190,7 @@ class DataPersister:
             encoding = self.settings.encoding
         filepath = os.path.join(current_dir, folder_name, file_name + extension)
         setattr(self, "filepath", filepath)
-        # print(self.filepath)
-        if not self.check_exists(self.filepath):
-            print(f"The given file path:  {filepath} does not exist")
-        else:
-            print("File already exists")
+        logger.debug("Saving %s", filepath)
         # try:
         #     # Open the file in read mode
         #     # Handle cases where the file is missing or corrupt
@@ -135,73 +206,276 @@ class DataPersister:
         #     print(f"The file not found {filepath}")
         # print(existing_data)
         # print(data)
-        if encrypt:
-            data = encrypt_data(fernet_instance, data)
-            try:
-                with open(self.filepath, 'w') as persistent_file:
-                    print("Locking the file")
-                    msvcrt.locking(persistent_file.fileno(), msvcrt.LK_NBLCK, 100)  # Acquire lock with timeout in 100ms
-                    print("File locked")
-                    persistent_file.write(data)
-                    msvcrt.locking(persistent_file.fileno(), msvcrt.LK_UNLCK, 100) # Unlock the file
-                    print("File unlocked")
-            # Load existing data as a dictionary  
-            except BlockingIOError:  # Handle lock acquisition timeout
-                print("Failed to acquire lock on file. Retrying...")
-                # Implement retry logic or error handling as needed
-
-            finally:
-                # Release the lock after writing (assuming successful acquisition)
-                print(f"The status of the file is closed")
+        # the snapshot is serialized to a temporary file without the lock, loaders in other processes
+        # holding the shared one only delay the rename that publishes it.
+        # A lock timeout or a failed write raises, the log is only truncated after a snapshot is published
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        lock = self.file_lock(filepath)
+        if extension == BINARY_EXTENSION:
+            # records are encrypted one by one inside the binary format
+            write_binary_snapshot(filepath, data, self.serializer, fernet_instance if encrypt else None,
+                                  changed_ids, self.crypto_workers(len(changed_ids) if changed_ids is not None else len(data)),
+                                  lock=lock)
+        elif compression is not None:
+            chunks = compress_chunks(dump_chunks(self.serializer, data, pretty), compression,
+                                     self.settings.compression_level)
+            if encrypt:
+                # the compressed stream is a fraction of the table, it is encrypted on the calling thread
+                tokens = encrypt_stream(fernet_instance, chunks)
+                write_atomic(filepath, (token + b"\n" for token in tokens), lock=lock)
+            else:
+                write_atomic(filepath, chunks, lock=lock)
+        elif encrypt:
+            # one token per line, see StreamingJsonLoader.load_encrypted_file
+            if isinstance(data, dict):
+                tokens = encrypt_chunks(fernet_instance, data, self.serializer, pretty,
+                                        workers=self.crypto_workers(len(data)))
+            else:
+                # views of lazy, spilled and columnar tables are streamed, a spilled table never
+                # comes back into memory whole
+                tokens = encrypt_stream(fernet_instance, dump_chunks(self.serializer, data, pretty),
+                                        workers=self.crypto_workers(len(data)))
+            write_atomic(filepath, (token + b"\n" for token in tokens), lock=lock)
+        elif isinstance(data, dict):
+            write_atomic(filepath, [self.serializer.dumps(data, pretty)], lock=lock)
         else:
-            try:
-                with open(self.filepath, 'w') as persistent_file:
-                    json.dump(data, persistent_file, indent=4)
-            except Exception as e:
-                print(f"An error occured: {e}")
-
-        return self.filepath
+            write_atomic(filepath, dump_chunks(self.serializer, data, pretty), lock=lock)
+        add_file_bytes(BYTES_WRITTEN, "snapshot", filepath)
+        return filepath
     
-    def delete_file(self, file_name: str, folder_name: str, extension: str):
-        filepath = os.path.join(os.getcwd(), folder_name, file_name + extension)
+    def delete_file(self, file_name: str, folder_name: str, extension: str, current_dir: str = None):
+        filepath = os.path.join(current_dir or os.getcwd(), folder_name, file_name + extension)
         # Delete the file
         try:
             os.remove(filepath)
-            print(f"File '{filepath}' deleted successfully.")
+            logger.info("Deleted %s", filepath)
         except FileNotFoundError:
-            print(f"File '{filepath}' not found.")
+            logger.warning("Could not delete %s, it does not exist", filepath)
             
     def load_data(self, folder_name: str, file_name: str, extension: str, current_dir: str,
                   encrypt: bool,
-                  fernet: Fernet):
+                  fernet: Fernet,
+                  lazy: bool = False,
+                  records=None):
+        """
+        Loads a table snapshot and replays its log
+
+        Args:
+            lazy: Memory map a binary snapshot and decode records on first access instead of all at once.
+            records: Mapping the records are loaded into, such as a cache.SpillTable. Defaults to a dict.
+
+        Raises:
+            ValueError: lazy is set for a snapshot that is not in the binary format
+            FileNotFoundError: No snapshot for the table
+
+        Returns:
+            tuple: the table and the highest id in it
+        """
         filepath = os.path.join(current_dir, folder_name, file_name + extension)
         self.filepath = filepath
+        if lazy and extension != BINARY_EXTENSION:
+            raise ValueError(f"Lazy loading needs a snapshot in the {BINARY_EXTENSION} format")
         if self.check_exists(filepath):
-            print("Loading data...")
-            if encrypt:
+            logger.debug("Loading %s", filepath)
+            add_file_bytes(BYTES_READ, "snapshot", filepath)
+            # a writer publishes the next snapshot once the loaders are done with this one
+            with self.file_lock(filepath, shared=True):
+                if lazy:
+                    snapshot = BinarySnapshot(filepath, self.serializer, fernet if encrypt else None, use_mmap=True)
+                    existing_data = LazyTable(snapshot)
+                    return self.replay_log(existing_data, snapshot.max_id(), file_name, folder_name, current_dir,
+                                           fernet if encrypt else None)
+                if extension == BINARY_EXTENSION:
+                    with BinarySnapshot(filepath, self.serializer, fernet if encrypt else None) as snapshot:
+                        existing_data = records if records is not None else {}
+                        existing_data.update(snapshot.items(self.crypto_workers(len(snapshot))))
+                        max_id = snapshot.max_id()
+                    logger.debug("Loaded %s", filepath)
+                    return self.replay_log(existing_data, max_id, file_name, folder_name, current_dir, fernet if encrypt else None)
+                if encrypt:
+                    try:
+                        # every token holds CHUNK_SIZE bytes of the table, a pool only pays off for several of them
+                        workers = self.settings.crypto_workers if os.path.getsize(filepath) > 2 * CHUNK_SIZE else 1
+                        existing_data, max_id = self._streaming_loader(filepath, workers).load_encrypted_file(
+                            filepath, fernet, self.settings.encoding, records)
+                        logger.debug("Loaded %s", filepath)
+                    except (FileNotFoundError, json.JSONDecodeError):
+                        return f"The file not found {filepath}"
+                    return self.replay_log(existing_data, max_id, file_name, folder_name, current_dir, fernet)
                 try:
-                    with open(self.filepath, 'r') as persistent_file:
-                        encrypted_data = persistent_file.read()
-                        existing_data = decrypt_data(fernet, encrypted_data)
-                        # print(existing_data)
-                        print("Loaded data")
+                    if self.settings.streaming_load:
+                        existing_data, max_id = self._streaming_loader(filepath).load_file(filepath, self.settings.encoding,
+                                                                                           records)
+                    else:
+                        with open(self.filepath, 'rb') as persistent_file:
+                            existing_data = self.serializer.loads(decompress(persistent_file.read()))
+                        existing_data, max_id = self.convert_to_int(existing_data)
+                        if records is not None:
+                            records.update(existing_data)
+                            existing_data = records
+                    # print(existing_data)
+                    logger.debug("Loaded %s", filepath)
                 except (FileNotFoundError, json.JSONDecodeError):
                     return f"The file not found {filepath}"
-                existing_data, max_id = self.convert_to_int(existing_data)
-                return existing_data, max_id
-            try:
-                with open(self.filepath, 'r') as persistent_file:
-                    existing_data = json.load(persistent_file)
-                    # print(existing_data)
-                    print("Loaded data")
-            except (FileNotFoundError, json.JSONDecodeError):
-                return f"The file not found {filepath}"
-            existing_data, max_id = self.convert_to_int(existing_data)
-            return existing_data, max_id
+                return self.replay_log(existing_data, max_id, file_name, folder_name, current_dir, None)
         else:
             raise FileNotFoundError(f"The file path {filepath} not found")
         
 
+    def save_shards(self, data, shards: int, file_name: str, folder_name: str, current_dir: str, extension: str,
+                    encrypt: bool, fernet_instance: Fernet, pretty: bool = False,
+                    changed_ids: Optional[Set[int]] = None, compression: Optional[str] = None) -> List[int]:
+        """
+        Saves a hash partitioned table, record id modulo shards picks the shard,
+        as one snapshot per shard in folder_name/file_name/shard-K.
+        Large tables are split on the calling thread and the shards are written on a process pool.
+
+        Args:
+            data: the table, a dict or a frozen view
+            shards: number of shards
+            changed_ids: Ids changed since the existing shards were saved, only the shards holding
+                one of them are written again. None writes every shard.
+
+        Returns:
+            List[int]: the shards written
+        """
+        dirty = set(range(shards)) if changed_ids is None else {uid % shards for uid in changed_ids}
+        parts = {shard: {} for shard in sorted(dirty)}
+        for uid, record in data.items():
+            part = parts.get(uid % shards)
+            if part is not None:
+                part[uid] = record
+        os.makedirs(os.path.join(current_dir, folder_name, file_name), exist_ok=True)
+        jobs = []
+        for shard, part in parts.items():
+            shard_changed = None
+            if changed_ids is not None:
+                shard_changed = {uid for uid in changed_ids if uid % shards == shard}
+            jobs.append(dict(data=part, file_name=shard_file_name(shard), folder_name=os.path.join(folder_name, file_name),
+                             current_dir=current_dir, extension=extension, encrypt=encrypt,
+                             fernet_instance=fernet_instance, pretty=pretty, changed_ids=shard_changed,
+                             compression=compression))
+        workers = min(self.settings.shard_workers, len(jobs))
+        if workers <= 1 or len(data) < self.settings.parallel_min_records:
+            for job in jobs:
+                self.save_data(**job)
+        else:
+            with process_pool(workers) as pool:
+                for future in [pool.submit(_save_shard, self._worker_settings(), job) for job in jobs]:
+                    # the workers count the bytes in their own process
+                    add_file_bytes(BYTES_WRITTEN, "snapshot", future.result())
+        return list(parts)
+
+    def load_shards(self, folder_name: str, file_name: str, shards: int, extension: str, current_dir: str,
+                    encrypt: bool, fernet: Fernet, records=None):
+        """
+        Loads the shards of a hash partitioned table, see save_shards, then replays the log of the table.
+        Large tables are loaded on a process pool, one shard per task.
+
+        Args:
+            records: Mapping the records are loaded into, such as a cache.SpillTable. Defaults to a dict.
+
+        Raises:
+            FileNotFoundError: A shard is missing
+
+        Returns:
+            tuple: the table and the highest id in it
+        """
+        shard_folder = os.path.join(folder_name, file_name)
+        paths = [os.path.join(current_dir, shard_folder, shard_file_name(shard) + extension) for shard in range(shards)]
+        for path in paths:
+            if not self.check_exists(path):
+                raise FileNotFoundError(f"The file path {path} not found")
+        jobs = [(shard_folder, shard_file_name(shard), extension, current_dir, encrypt, fernet) for shard in range(shards)]
+        workers = min(self.settings.shard_workers, shards)
+        total_bytes = sum(os.path.getsize(path) for path in paths)
+        if workers <= 1 or total_bytes < self.settings.parallel_min_bytes:
+            results = (self.load_data(*job) for job in jobs)
+            pool = None
+        else:
+            BYTES_READ.inc("snapshot", amount=total_bytes)
+            pool = process_pool(workers)
+            results = pool.map(_load_shard, [self._worker_settings()] * len(jobs), jobs)
+        existing_data = records if records is not None else {}
+        max_id = None
+        try:
+            for part, part_max_id in results:
+                existing_data.update(part)
+                if part_max_id is not None and (max_id is None or part_max_id > max_id):
+                    max_id = part_max_id
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return self.replay_log(existing_data, max_id, file_name, folder_name, current_dir, fernet if encrypt else None)
+
+    def _worker_settings(self) -> DataPersistSettings:
+        """ Settings for a shard worker, which encrypts and decrypts on its own thread """
+        settings = copy.copy(self.settings)
+        settings.crypto_workers = 1
+        return settings
+
+    def file_lock(self, filepath: str, shared: bool = False) -> FileLock:
+        """ Lock on a snapshot between processes, shared for loaders and exclusive for writers """
+        return FileLock(filepath, shared=shared, timeout=self.settings.lock_timeout)
+
+    def crypto_workers(self, records: int) -> int:
+        """ Processes to encrypt or decrypt that many records with, 1 below settings.parallel_min_records """
+        if records < self.settings.parallel_min_records:
+            return 1
+        return self.settings.crypto_workers
+
+    def _streaming_loader(self, filepath: str, workers: int = 1):
+        """ Loader that records its progress in self.load_progress, see Burp.load_progress """
+        total_bytes = os.path.getsize(filepath)
+        # updated in place, a caller holding the dict follows every file of a sharded load
+        self.load_progress.clear()
+        self.load_progress.update(filepath=filepath, records=0, bytes_read=0, total_bytes=total_bytes)
+
+        def progress(records, bytes_read):
+            self.load_progress.update(records=records, bytes_read=bytes_read)
+
+        return StreamingJsonLoader(progress, workers=workers)
+
+    def read_record(self, folder_name: str, file_name: str, extension: str, current_dir: str, uid: int,
+                    fernet: Fernet = None):
+        """
+        Reads one record straight from a binary snapshot without loading the table
+
+        Raises:
+            ValueError: The snapshot is not in the binary format
+
+        Returns:
+            dict: the record, None when the snapshot does not hold the id
+        """
+        if extension != BINARY_EXTENSION:
+            raise ValueError(f"Single record reads need the {BINARY_EXTENSION} format")
+        filepath = os.path.join(current_dir, folder_name, file_name + extension)
+        with self.file_lock(filepath, shared=True), BinarySnapshot(filepath, self.serializer, fernet) as snapshot:
+            return snapshot.get(uid)
+
+    def detect_extension(self, file_name: str, folder_name: str, current_dir: str, preferred: str = None):
+        """
+        Extension of the snapshot a table was saved with, the preferred one first
+
+        Returns:
+            str: the extension, the preferred one when no snapshot exists
+        """
+        preferred = preferred or self.settings.extension
+        for extension in (preferred,) + self.SNAPSHOT_EXTENSIONS:
+            if self.check_exists(os.path.join(current_dir, folder_name, file_name + extension)):
+                return extension
+        return preferred
+
+    def table_exists(self, file_name: str, folder_name: str, current_dir: str, preferred: str = None) -> bool:
+        """ Whether a table was saved in the database folder: a snapshot in any format, a shard folder,
+        its metadata or its log, whether or not this process loaded it
+        """
+        extension = self.detect_extension(file_name, folder_name, current_dir, preferred)
+        table_path = os.path.join(current_dir, folder_name, file_name)
+        return any(self.check_exists(path) for path in (table_path + extension, table_path,
+                                                        table_path + self.settings.meta_extension,
+                                                        self.log_path(file_name, folder_name, current_dir)))
+
     def convert_to_int(self, data: dict):
         new_data = {}
         max_id = None
@@ -212,56 +486,149 @@ class DataPersister:
                 max_id = int_key
         return new_data, max_id
     
-    #Not in use as of now
-    def add_single_data(self, 
-                           folder_name: str,
-                           filename: str,
-                           extension: str,
-                           id: int,
-                           data: dict,
-                           encoding= None
-                           ):
+    def save_meta(self, meta: dict, file_name: str, folder_name: str, current_dir: str):
+        """
+        Saves the table metadata (index definitions, ...) next to the snapshot
+
+        Returns:
+            str: file path of the metadata
+        """
+        filepath = os.path.join(current_dir, folder_name, file_name + self.settings.meta_extension)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        tmp_path = filepath + ".tmp"
+        with open(tmp_path, 'w', encoding=self.settings.encoding) as meta_file:
+            json.dump(meta, meta_file, indent=self.indent)
+        os.replace(tmp_path, filepath)
+        return filepath
+
+    def load_meta(self, file_name: str, folder_name: str, current_dir: str) -> dict:
+        """ Loads the table metadata, empty when the table has none """
+        filepath = os.path.join(current_dir, folder_name, file_name + self.settings.meta_extension)
+        if not self.check_exists(filepath):
+            return {}
+        with open(filepath, 'r', encoding=self.settings.encoding) as meta_file:
+            return json.load(meta_file)
+
+    def save_expiry(self, deadlines: Dict[int, float], file_name: str, folder_name: str, current_dir: str):
+        """
+        Saves the deadlines of the records of a snapshot next to it, a table without any has no file
+
+        Returns:
+            str: file path of the deadlines, None when there are none
+        """
+        filepath = os.path.join(current_dir, folder_name, file_name + self.settings.expiry_extension)
+        if not deadlines:
+            if self.check_exists(filepath):
+                os.remove(filepath)
+            return None
+        return write_atomic(filepath, [self.serializer.dumps(deadlines)])
+
+    def load_expiry(self, file_name: str, folder_name: str, current_dir: str) -> Dict[int, float]:
+        """ Loads the deadlines saved with save_expiry, empty when the table has none """
+        filepath = os.path.join(current_dir, folder_name, file_name + self.settings.expiry_extension)
+        if not self.check_exists(filepath):
+            return {}
+        with open(filepath, 'rb') as expiry_file:
+            return {int(uid): deadline for uid, deadline in self.serializer.loads(expiry_file.read()).items()}
+
+    def save_manifest(self, manifest: dict, folder_name: str, current_dir: str):
+        """
+        Publishes the manifest of a writer: the tables it serves and how replicas open them
+
+        Returns:
+            str: file path of the manifest
+        """
+        filepath = os.path.join(current_dir, folder_name, self.settings.manifest)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        return write_atomic(filepath, [json.dumps(manifest, indent=self.indent).encode(self.settings.encoding)])
+
+    def load_manifest(self, folder_name: str, current_dir: str) -> Optional[dict]:
+        """ Loads the manifest of the writer of a database, None when no writer published one """
+        filepath = os.path.join(current_dir, folder_name, self.settings.manifest)
+        if not self.check_exists(filepath):
+            return None
+        with open(filepath, 'r', encoding=self.settings.encoding) as manifest_file:
+            return json.load(manifest_file)
+
+    def log_path(self, file_name: str, folder_name: str, current_dir: str):
+        """ Path of the write ahead log that belongs to a table snapshot """
+        return os.path.join(current_dir, folder_name, file_name + self.settings.log_extension)
+
+    def open_log(self, file_name: str, folder_name: str, current_dir: str,
+                 fernet_instance: Fernet = None, truncate: bool = False):
         """
-        Updates a JSON file with new data.
+        Opens the append-only log of a table
 
         Args:
-            filepath (str): Path to the JSON file.
-            new_data (dict): New data to add or update in the file.
+            file_name: The table name.
+            folder_name: The database name.
+            current_dir: The directory holding the database folder.
+            fernet_instance: Encrypts the log records of encrypted tables.
+            truncate: Drop the existing records, used for a freshly created table.
 
-        Raises:
-            OSError: Error opening or writing to the file.
-            json.JSONDecodeError: Error decoding existing JSON data.
+        Returns:
+            WriteAheadLog: the opened log or None when logging is disabled
         """
-        if not encoding:
-            encoding = self.settings.encoding
-        curr_data = {id: data}
-        filepath = os.path.join(os.getcwd(), folder_name, filename + extension)
-        self.filepath = filepath
-        print(self.filepath)
-        if not self.check_exists(self.filepath):
-            # Create the folder if it doesn't exist
-            #os.makedirs(self.filepath, mode=self.file_permissions, exist_ok=True)  # exist_ok=True prevents errors if folder exists
-            print(f"The given file path:  {filepath} does not exist")
-        else:
-            print("File already exists")
+        if not self.settings.wal:
+            return None
+        filepath = self.log_path(file_name, folder_name, current_dir)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        log = WriteAheadLog(filepath,
+                            serializer=self.serializer,
+                            fsync=self.settings.fsync,
+                            group_commit_size=self.settings.group_commit_size,
+                            group_commit_interval=self.settings.group_commit_interval,
+                            fernet_instance=fernet_instance)
+        if truncate:
+            log.truncate()
+        return log
+
+    def replay_log(self, data: dict, max_id, file_name: str, folder_name: str, current_dir: str,
+                   fernet: Fernet = None):
+        """
+        Applies the log records written after the last snapshot on top of it
+
+        Returns:
+            tuple: the table and the highest id in it
+        """
+        filepath = self.log_path(file_name, folder_name, current_dir)
+        self.replayed_records = 0
+        self.replayed_ids = set()
+        self.replayed_seq = 0
+        self.replayed_expiry = {}
+        if not self.check_exists(filepath):
+            return data, max_id
+        add_file_bytes(BYTES_READ, "log", filepath)
+        log = WriteAheadLog(filepath, serializer=self.serializer, fsync="never", fernet_instance=fernet)
         try:
-            # Open the file in read mode
-            # Handle cases where the file is missing or corrupt
-            #os.chmod(self.filepath, self.file_permissions)
-            # print(f"Permission to the file {filepath} is granted")
-            with open(self.filepath, 'r') as persistent_file:
-                # Load existing data as a dictionary
-                existing_data = json.load(persistent_file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            existing_data = {}
-        existing_data.update(curr_data)
-        print(existing_data)
-        # if not existing_data:
-        #     merged_data = data
-        # else:
-        #     # Update existing data with new data using dictionary merging
-        #     merged_data = {**existing_data, **data}
-        # print(merged_data)
-        # Open the file again in write mode (truncates existing content)
-        with open(self.filepath, 'w') as persistent_file:
-            json.dump(existing_data, persistent_file, indent=self.indent)
\ No newline at end of file
+            for record in log.replay():
+                apply_log_record(data, record)
+                self.replayed_seq = record.get("seq", self.replayed_seq)
+                for operation in log_operations(record):
+                    self.replayed_records += 1
+                    self.replayed_ids.add(operation["id"])
+                    if "expires_at" in operation:
+                        self.replayed_expiry[operation["id"]] = operation["expires_at"]
+                    elif operation["op"] != "update":
+                        # an update without a deadline keeps the one the record has
+                        self.replayed_expiry[operation["id"]] = None
+                    # ids of deleted records stay burnt so they are never handed out twice
+                    if max_id is None or operation["id"] > max_id:
+                        max_id = operation["id"]
+        finally:
+            log.close()
+        return data, max_id
+
+
+def shard_file_name(shard: int) -> str:
+    return f"shard-{shard}"
+
+
+def _save_shard(settings: DataPersistSettings, job: dict):
+    """ Process pool task of DataPersister.save_shards """
+    return DataPersister(settings).save_data(**job)
+
+
+def _load_shard(settings: DataPersistSettings, job: tuple):
+    """ Process pool task of DataPersister.load_shards """
+    return DataPersister(settings).load_data(*job)
@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import logging
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Optional
+)
+from cryptography.fernet import Fernet
+from .serializers import get_serializer
+from .metrics import BYTES_READ
+
+logger = logging.getLogger(__name__)
+
+
+class LogTailer:
+    """
+    Follows the write ahead log of a table from another process.
+
+    Complete lines are decoded as they are committed, a line still being written is kept
+    for the next poll. When the writer truncates the log after a snapshot the file is
+    replaced: the rest of the old file is read through the open handle, then the new
+    file is followed from its start. Records whose sequence number was already seen are skipped.
+    """
+
+    def __init__(self, filepath: str, serializer=None, fernet_instance: Optional[Fernet] = None, after_seq: int = 0):
+        """
+        Args:
+            filepath (str): log of the table
+            serializer (optional): see serializers.get_serializer. Defaults to None.
+            fernet_instance (Fernet, optional): key of an encrypted table. Defaults to None.
+            after_seq (int, optional): last sequence number already applied. Defaults to 0.
+        """
+        self.filepath = filepath
+        self.serializer = serializer or get_serializer()
+        self.fernet_instance = fernet_instance
+        self.seq = after_seq
+        self._file = None
+        self._inode = None
+        self._partial = b""
+
+    def _open(self) -> bool:
+        try:
+            self._file = open(self.filepath, "rb")
+        except FileNotFoundError:
+            return False
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._partial = b""
+        return True
+
+    def _decode(self, line: bytes) -> Dict:
+        if self.fernet_instance is not None:
+            line = self.fernet_instance.decrypt(line)
+        return self.serializer.loads(line)
+
+    def _drain(self) -> List[Dict]:
+        data = self._file.read()
+        if not data:
+            return []
+        BYTES_READ.inc("log", amount=len(data))
+        lines = (self._partial + data).split(b"\n")
+        self._partial = lines.pop()
+        records = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = self._decode(line)
+            except Exception:
+                # a record torn by a crash of the writer, the writer's own replay stops there too
+                logger.warning("Skipped an unreadable record of %s", self.filepath)
+                continue
+            seq = record.get("seq")
+            if seq is not None:
+                if seq <= self.seq:
+                    continue
+                self.seq = seq
+            records.append(record)
+        return records
+
+    def poll(self) -> List[Dict]:
+        """ Records committed since the previous poll, in order """
+        if self._file is None and not self._open():
+            return []
+        records = self._drain()
+        try:
+            replaced = os.stat(self.filepath).st_ino != self._inode
+        except FileNotFoundError:
+            return records
+        if replaced:
+            self._file.close()
+            if self._open():
+                records.extend(self._drain())
+        return records
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ReplicaFollower:
+    """
+    Background task of a read replica: opens the tables listed in the writer's manifest
+    and applies the records the writer commits to their logs.
+
+    The replica lags the writer by the writer's group commit interval plus the poll tick.
+    lag() is the time since the last successful poll, reads are refused above max_lag.
+    """
+    DEFAULT_TICK = 0.01 # seconds between two polls
+    DEFAULT_MAX_LAG = 5.0 # seconds
+
+    def __init__(self, get_db: Callable, db_name: str, keys: Optional[Dict[str, str]] = None,
+                 tick: float = DEFAULT_TICK, max_lag: float = DEFAULT_MAX_LAG):
+        """
+        Args:
+            get_db (Callable): returns the Burp instance of the replica
+            db_name (str): database the writer serves
+            keys (dict, optional): table name -> key, encrypted tables without a key are not followed
+            tick (float, optional): seconds between two polls. Defaults to DEFAULT_TICK.
+            max_lag (float, optional): seconds without a successful poll before reads are refused.
+                Defaults to DEFAULT_MAX_LAG.
+        """
+        self.get_db = get_db
+        self.db_name = db_name
+        self.keys = keys or {}
+        self.tick = tick
+        self.max_lag = max_lag
+        self.tailers: Dict[str, LogTailer] = {}
+        self.last_synced_at = None
+        self._manifest_mtime = None
+        self._manifest = None
+        self._skipped = set()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for tailer in self.tailers.values():
+            tailer.close()
+        self.tailers = {}
+
+    async def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Replica sync failed: %s - %s", type(e).__name__, e)
+            await asyncio.sleep(self.tick)
+
+    def run_once(self):
+        """ Follow the manifest then apply the new log records of every table """
+        db = self.get_db()
+        self._sync_manifest(db)
+        for table_name in list(self.tailers):
+            self.poll_table(table_name)
+        self.last_synced_at = time.monotonic()
+
+    def poll_table(self, table_name: str):
+        """ Apply the records the writer committed to one table since the last poll """
+        tailer = self.tailers.get(table_name)
+        if tailer is None:
+            return
+        records = tailer.poll()
+        if records:
+            self.get_db().apply_log_records(table_name, records)
+
+    def lag(self) -> float:
+        """ Seconds since the last successful poll, inf before the first one """
+        if self.last_synced_at is None:
+            return float("inf")
+        return time.monotonic() - self.last_synced_at
+
+    def _read_manifest(self, db):
+        path = os.path.join(db.cur_dir, self.db_name, db.settings.manifest)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return self._manifest
+        if mtime != self._manifest_mtime:
+            self._manifest = db.db_instance.load_manifest(self.db_name, db.cur_dir)
+            self._manifest_mtime = mtime
+        return self._manifest
+
+    def _sync_manifest(self, db):
+        if db.db_instance is None:
+            db._create_db_instance()
+        manifest = self._read_manifest(db)
+        tables = manifest["tables"] if manifest else {}
+        for table_name in list(db.tables):
+            spec = tables.get(table_name)
+            if spec is None or spec.get("incarnation") != db.tables[table_name].incarnation:
+                # deleted or created again by the writer
+                tailer = self.tailers.pop(table_name, None)
+                if tailer is not None:
+                    tailer.close()
+                db.unload_table(table_name)
+        for table_name, spec in tables.items():
+            if table_name not in db.tables:
+                self._open_table(db, table_name, spec)
+            if table_name in db.tables:
+                db.follow_indexes(table_name, spec.get("indexes", []))
+
+    def _open_table(self, db, table_name: str, spec: Dict):
+        key = self.keys.get(table_name, "")
+        if spec.get("encrypt") and not key:
+            if table_name not in self._skipped:
+                logger.warning("No key for the encrypted table %s, it is not followed", table_name)
+                self._skipped.add(table_name)
+            return
+        log_path = db.db_instance.log_path(table_name, self.db_name, db.cur_dir)
+        inode = _inode(log_path)
+        db.load_data(self.db_name, table_name, bool(spec.get("encrypt")), key,
+                     extension=spec.get("extension"), read_only=True)
+        if _inode(log_path) != inode:
+            # the writer saved a snapshot while it was read, the log replayed may not follow it
+            db.unload_table(table_name)
+            return
+        table = db.tables[table_name]
+        self.tailers[table_name] = LogTailer(log_path, db.db_instance.serializer, table.fernet_instance,
+                                             table.applied_seq)
+
+
+def _inode(filepath: str) -> Optional[int]:
+    try:
+        return os.stat(filepath).st_ino
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,97 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+
+class LockStats:
+    """
+    Acquisition counters and wait times of one side of a ReadWriteLock.
+    Updated while the lock's internal mutex is held.
+    """
+
+    def __init__(self):
+        self.acquired = 0
+        self.contended = 0 # acquisitions that had to wait
+        self.total_wait = 0.0 # seconds
+        self.max_wait = 0.0 # seconds
+
+    def record(self, waited: float, contended: bool):
+        self.acquired += 1
+        if contended:
+            self.contended += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+
+    def to_dict(self) -> Dict:
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "total_wait": self.total_wait,
+            "max_wait": self.max_wait,
+            "mean_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+        }
+
+
+class ReadWriteLock:
+    """
+    Lock held by any number of readers or by a single writer.
+
+    Waiting writers go first, so a steady flow of readers cannot starve them.
+    The lock is not reentrant: a thread holding it must not acquire it again.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+        self.read_stats = LockStats()
+        self.write_stats = LockStats()
+
+    @contextmanager
+    def read(self):
+        """ Shared access, waits while a writer holds or waits for the lock """
+        start = time.perf_counter()
+        with self._cond:
+            contended = self._writer or self._waiting_writers > 0
+            while self._writer or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+            self.read_stats.record(time.perf_counter() - start, contended)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        """ Exclusive access, waits for the readers and the writer holding the lock """
+        start = time.perf_counter()
+        with self._cond:
+            contended = self._writer or self._readers > 0
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+            self.write_stats.record(time.perf_counter() - start, contended)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        """ Counters and wait times in seconds of both sides """
+        with self._cond:
+            return {"read": self.read_stats.to_dict(), "write": self.write_stats.to_dict(),
+                    "readers": self._readers, "writer": self._writer,
+                    "waiting_writers": self._waiting_writers}
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+from typing import (
+    Callable,
+    Optional
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SavePolicy:
+    """
+    Decides when a table snapshot is due.
+
+    Accepted `save` options:
+        "manual"                         : only /saveSnapshot persists the table
+        "auto"                           : every `interval` seconds or `mutations` writes, whichever comes first
+        "interval:30"                    : every 30 seconds
+        "mutations:1000"                 : every 1000 writes
+        "interval:30,mutations:1000"     : whichever comes first
+    A table without changes since the last snapshot is never due.
+    """
+    DEFAULT_INTERVAL = 60.0 # seconds
+    DEFAULT_MUTATIONS = 1000
+
+    def __init__(self, mode: str = "auto", interval: Optional[float] = None, mutations: Optional[int] = None):
+        self.mode = mode
+        self.interval = interval
+        self.mutations = mutations
+
+    @classmethod
+    def parse(cls, save: Optional[str]):
+        """ Build a policy from the `save` option of create_database
+
+        Raises:
+            ValueError: Not a valid save option
+        """
+        save = (save or "auto").strip().lower()
+        if save == "manual":
+            return cls("manual")
+        if save == "auto":
+            return cls("auto", cls.DEFAULT_INTERVAL, cls.DEFAULT_MUTATIONS)
+        interval = mutations = None
+        try:
+            for part in save.split(","):
+                name, value = part.split(":")
+                name = name.strip()
+                if name == "interval":
+                    interval = float(value)
+                elif name == "mutations":
+                    mutations = int(value)
+                else:
+                    raise ValueError(name)
+        except ValueError:
+            raise ValueError(f"Invalid save option {save}, expected manual, auto, interval:N and/or mutations:N")
+        if (interval is not None and interval <= 0) or (mutations is not None and mutations <= 0):
+            raise ValueError("Save interval and mutations must be positive")
+        return cls(save, interval, mutations)
+
+    def is_due(self, dirty_count: int, seconds_since_save: float) -> bool:
+        """ Whether a snapshot should be written now """
+        if self.mode == "manual" or dirty_count == 0:
+            return False
+        if self.mutations is not None and dirty_count >= self.mutations:
+            return True
+        if self.interval is not None and seconds_since_save >= self.interval:
+            return True
+        return False
+
+    def __repr__(self):
+        return f"SavePolicy(mode={self.mode!r}, interval={self.interval}, mutations={self.mutations})"
+
+
+class SnapshotScheduler:
+    """
+    Background task that queues snapshots of every open table according to the save policy of the database
+    and bounds how long log records stay in the group commit buffer. It also deletes the expired records
+    of the tables that are not read.
+    The snapshots themselves are written by the worker thread of Burp.jobs.
+    """
+
+    def __init__(self, get_db: Callable, tick: float = 1.0):
+        """
+        Args:
+            get_db (Callable): returns the current Burp instance or None, the API creates it lazily
+            tick (float, optional): seconds between two policy checks. Defaults to 1.0.
+        """
+        self.get_db = get_db
+        self.tick = tick
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error("Scheduled snapshot failed: %s - %s", type(e).__name__, e)
+
+    def run_once(self):
+        """ Delete the expired records, commit the buffered log records and snapshot the tables the policy says are due """
+        db = self.get_db()
+        if db is None:
+            return
+        for table_name, table in list(db.tables.items()):
+            db.expire_records(table_name)
+            if table.wal is not None:
+                table.wal.flush()
+            if db.snapshot_due(table_name) and not db.jobs.active(table_name):
+                db.submit_snapshot(table_name=table_name)
@@ -0,0 +1,87 @@
+import json
+from typing import (
+    Any,
+    Iterator,
+    Optional,
+    Union
+)
+try:
+    import orjson
+except ImportError:  # optional, stdlib json is the fallback
+    orjson = None
+
+
+class JsonSerializer:
+    """
+    stdlib json serializer. Int keys of the in memory tables are written as strings.
+    """
+    name = "json"
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        if pretty:
+            return json.dumps(data, indent=4).encode()
+        return json.dumps(data, separators=(",", ":")).encode()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+
+class OrjsonSerializer:
+    """
+    orjson serializer, several times faster than stdlib json on both paths.
+    Pretty printing uses orjson's two space indent.
+    """
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise ImportError("orjson is not installed")
+
+    def dumps(self, data: Any, pretty: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+
+SERIALIZERS = {
+    JsonSerializer.name: JsonSerializer,
+    OrjsonSerializer.name: OrjsonSerializer,
+}
+
+
+def get_serializer(name: Optional[str] = None):
+    """ Serializer by name, orjson when it is installed and no name is given
+
+    Raises:
+        ValueError: Unknown serializer
+        ImportError: orjson was asked for but is not installed
+    """
+    if name is None:
+        name = OrjsonSerializer.name if orjson is not None else JsonSerializer.name
+    if name not in SERIALIZERS:
+        raise ValueError(f"Serializer must be one of {list(SERIALIZERS)}, got {name}")
+    return SERIALIZERS[name]()
+
+
+def dump_chunks(serializer, data, pretty: bool = False, batch_size: int = 4096) -> Iterator[bytes]:
+    """ Serialize an id keyed table as a JSON object, batch_size records per chunk,
+    so the text of the whole table is never held at once. Pretty output is produced in one piece.
+    """
+    if pretty:
+        yield serializer.dumps(data if isinstance(data, dict) else dict(data.items()), pretty)
+        return
+    yield b"{"
+    batch = []
+    first = True
+    for uid, record in data.items():
+        batch.append(b'"%d":%s' % (uid, serializer.dumps(record)))
+        if len(batch) >= batch_size:
+            yield (b"" if first else b",") + b",".join(batch)
+            batch, first = [], False
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+    yield b"}"
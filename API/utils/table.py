@@ -0,0 +1,194 @@
+import sys
+import time
+import threading
+from itertools import islice
+from typing import (
+    Dict,
+    List,
+    Optional
+)
+from .generator import generate_key, create_fernet_instance
+from .cache import SpillTable, record_size
+from .columnar import ColumnarTable
+from .lazy import LazyTable
+from .expiry import ExpiryHeap
+from .rwlock import ReadWriteLock
+from .indexes import IdIndex
+
+
+class Table:
+    """
+    State of one open table: its records, id counter, encryption, snapshot format,
+    indexes and write ahead log. A Burp instance holds one Table per open table.
+    """
+
+    def __init__(self, name: str, extension: str, records: Optional[Dict[int, dict]] = None,
+                 auto_increment: bool = True, encrypt: bool = False, encryption_key: Optional[str] = None,
+                 pretty: bool = False):
+        """
+        Args:
+            name (str): table name, also the snapshot file name
+            extension (str): snapshot format, ".json" or ".burp"
+            records (dict, optional): loaded records keyed by id. Defaults to an empty table.
+            auto_increment (bool, optional): hand out increasing ids. Defaults to True.
+            encrypt (bool, optional): encrypt the snapshot and the log. Defaults to False.
+            encryption_key (str, optional): key of an existing encrypted table, a new one is generated when missing.
+            pretty (bool, optional): indent the JSON snapshots. Defaults to False.
+        """
+        self.name = name
+        self.extension = extension
+        self.records = records if records is not None else {}
+        self.auto_inc_id = 0
+        self.auto_inc_status = auto_increment
+        self.encrypt = bool(encrypt)
+        self.encryption_key = None
+        self.fernet_instance = None
+        if encrypt:
+            self.encryption_key = encryption_key or generate_key()
+            self.fernet_instance = create_fernet_instance(self.encryption_key)
+        self.pretty = pretty
+        self.schema = None # field -> column type, the records are then a ColumnarTable
+        self.compression = None # codec of the JSON snapshots, see compression.COMPRESSIONS
+        self.shards = None # snapshot files the table is hash partitioned into, None keeps a single file
+        self.ttl = None # seconds a record lives when it is added without a TTL of its own, None keeps it
+        self.expiry = ExpiryHeap() # deadlines of the records that expire
+        self.indexes = {} # field -> index
+        self.ids = IdIndex() # live ids in order, kept with the field indexes
+        self.wal = None
+        self.dirty_count = 0 # mutations since the last snapshot
+        self.changed_ids = set() # ids written or deleted since the last freeze
+        self.frozen_generation = 0 # number of snapshots frozen so far
+        self.saved_generation = 0 # the snapshot on disk, 0 is the one the table was created or loaded from
+        self.incarnation = None # id given at creation, a replica reloads the table when it changes
+        self.applied_seq = 0 # last log record applied on a read replica, or last write of a table without a log
+        self.feed = None # ChangeFeed of the table, created by its first subscriber
+        self.last_saved_at = time.monotonic()
+        self._dirty_lock = threading.Lock()
+        # writers hold it alone so every write call is atomic, index walks and snapshot freezes share it.
+        # get_one and get_all never take it, records are replaced instead of mutated in place.
+        # get_page only holds it to read a batch of ids
+        self.lock = ReadWriteLock()
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def seq(self) -> int:
+        """ Sequence number of the last write, logged by a writer or applied by a replica """
+        return self.wal.seq if self.wal is not None else self.applied_seq
+
+    def auto_increment_id(self):
+        if self.auto_inc_status:
+            self.auto_inc_id += 1
+
+    def check_record(self, uid: int, record: dict):
+        """ Raise ValueError when a record breaks the schema or a unique index, TypeError when it is not a dict,
+        before anything is changed
+        """
+        if not isinstance(record, dict):
+            raise TypeError(f"A record is a dict, got {type(record).__name__}")
+        if self.schema is not None:
+            self.records.check(record)
+        for index in self.indexes.values():
+            index.check(record, uid)
+
+    def index(self, uid: int, record: dict):
+        self.ids.add(uid)
+        for index in self.indexes.values():
+            index.add(uid, record)
+
+    def unindex(self, uid: int, record: dict):
+        self.ids.remove(uid)
+        for index in self.indexes.values():
+            index.remove(uid, record)
+
+    def record_mutation(self, op: str, uid: int, data: dict = None, expires_at: float = None):
+        """ Append a mutation to the write ahead log, mark the table dirty and publish it to the change feed """
+        if self.wal is not None:
+            seq = self.wal.append(op, uid, data, expires_at)
+        else:
+            self.applied_seq += 1
+            seq = self.applied_seq
+        with self._dirty_lock:
+            self.dirty_count += 1
+            self.changed_ids.add(uid)
+        if self.feed is not None:
+            event = {"op": op, "id": uid, "seq": seq}
+            if data is not None:
+                event["data"] = data
+            if expires_at is not None:
+                event["expires_at"] = expires_at
+            self.feed.publish((event,))
+
+    def record_batch(self, operations: List[dict]):
+        """ Append a batch of mutations to the write ahead log as one record, mark the table dirty
+        and publish them to the change feed
+        """
+        if not operations:
+            return
+        if self.wal is not None:
+            seq = self.wal.append_batch(operations)
+        else:
+            self.applied_seq += 1
+            seq = self.applied_seq
+        with self._dirty_lock:
+            self.dirty_count += len(operations)
+            self.changed_ids.update(operation["id"] for operation in operations)
+        if self.feed is not None:
+            self.feed.publish({**operation, "seq": seq} for operation in operations)
+
+    def freeze_changes(self):
+        """ Start a snapshot: the ids changed since the previous one and the generation of the new one """
+        with self._dirty_lock:
+            changed_ids, self.changed_ids = self.changed_ids, set()
+            self.frozen_generation += 1
+            return changed_ids, self.frozen_generation
+
+    def extends_saved(self, generation: int) -> bool:
+        """ Whether the snapshot on disk is the one right before generation,
+        the changes frozen with generation are then the whole difference between the two
+        """
+        return self.saved_generation == generation - 1
+
+    def mark_saved(self, saved_count: int, generation: int):
+        """ Forget the mutations a finished snapshot holds, later ones stay dirty """
+        with self._dirty_lock:
+            self.dirty_count = max(0, self.dirty_count - saved_count)
+            self.saved_generation = generation
+        self.last_saved_at = time.monotonic()
+
+    def seconds_since_save(self) -> float:
+        return time.monotonic() - self.last_saved_at
+
+    def memory_bytes(self, sample: int = 64) -> int:
+        """ Approximate bytes held by the records in memory, extrapolated from the first `sample` records.
+        Cold records of a spilled table and undecoded records of a lazy table are not counted.
+        """
+        records = self.records
+        if isinstance(records, ColumnarTable):
+            return records.memory_bytes()
+        if isinstance(records, SpillTable):
+            return records.resident_bytes
+        if isinstance(records, LazyTable):
+            records, count = records._records, records.cached_records()
+        else:
+            count = len(records)
+        # one C level pass, a write cannot interleave with it
+        sizes = [record_size(record) for record in list(islice(records.values(), sample)) if isinstance(record, dict)]
+        if not sizes:
+            return sys.getsizeof(records)
+        return sys.getsizeof(records) + sum(sizes) * count // len(sizes)
+
+    def close(self):
+        """ Commit the pending log records and release the log, the memory mapped snapshot and the spill file.
+        The subscribers of the change feed are dropped
+        """
+        if self.feed is not None:
+            self.feed.close()
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
+        if isinstance(self.records, LazyTable):
+            self.records.snapshot.close()
+        elif isinstance(self.records, SpillTable):
+            self.records.close()
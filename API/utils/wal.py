@@ -0,0 +1,321 @@
+import os
+import time
+import logging
+import threading
+from typing import (
+    Iterator,
+    Iterable,
+    List,
+    Optional,
+    Dict
+)
+from cryptography.fernet import Fernet
+from .serializers import get_serializer
+from .metrics import BYTES_WRITTEN
+
+logger = logging.getLogger(__name__)
+
+class WriteAheadLog:
+    """
+    Append-only operation log for a single table.
+
+    Every mutation is written as one line, so the cost of a write is proportional
+    to the record instead of the whole table. Records are buffered and committed
+    in groups; the fsync policy decides when the commit is forced to disk:
+
+        "always" : every append is written and fsynced before returning
+        "batch"  : one fsync per group commit (default)
+        "never"  : the OS decides when the data reaches the disk
+
+    A group is committed once it holds group_commit_size records or its first record is
+    group_commit_interval seconds old, whichever comes first. A background thread commits it when no
+    later append does, so a crash loses at most the records of the last interval.
+
+    Records carry an increasing sequence number, "seq", that survives truncation:
+    a truncated log starts with a "checkpoint" record holding the last number handed out.
+    Read replicas use it to resume tailing without applying a record twice.
+    """
+    FSYNC_POLICIES = ("always", "batch", "never")
+    OPERATIONS = ("add", "update", "delete")
+
+    def __init__(self, filepath: str,
+                 serializer=None,
+                 fsync: str = "batch",
+                 group_commit_size: int = 64,
+                 group_commit_interval: float = 0.05,
+                 fernet_instance: Optional[Fernet] = None):
+        """
+        Args:
+            filepath (str): path of the log file, created if it does not exist
+            serializer (optional): encodes the records, see serializers.get_serializer. Defaults to None.
+            fsync (str, optional): one of FSYNC_POLICIES. Defaults to "batch".
+            group_commit_size (int, optional): number of buffered records that triggers a commit. Defaults to 64.
+            group_commit_interval (float, optional): max seconds a record stays buffered, enforced by a
+                background thread. Defaults to 0.05.
+            fernet_instance (Fernet, optional): encrypts every record when given. Defaults to None.
+
+        Raises:
+            ValueError: Unknown fsync policy
+        """
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {self.FSYNC_POLICIES}, got {fsync}")
+        self.filepath = filepath
+        self.serializer = serializer or get_serializer()
+        self.fsync = fsync
+        self.group_commit_size = max(1, group_commit_size)
+        self.group_commit_interval = group_commit_interval
+        self.fernet_instance = fernet_instance
+        self._buffer = []
+        self._first_buffered_at = None
+        self._lock = threading.Lock()
+        self._buffered = threading.Condition(self._lock) # wakes the flusher when a group starts
+        self._marks = {} # sequence number returned by checkpoint -> offset of the records after it
+        self.seq = self._last_seq()
+        self._file = open(self.filepath, "ab")
+        self._flusher = None
+        if self.fsync != "always":
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True,
+                                             name=f"burp-wal-{os.path.basename(filepath)}")
+            self._flusher.start()
+
+    def _flush_loop(self):
+        """ Commit a group once its first record is group_commit_interval seconds old, until the log is closed """
+        with self._buffered:
+            while not self._file.closed:
+                if self._first_buffered_at is None:
+                    self._buffered.wait()
+                    continue
+                delay = self._first_buffered_at + self.group_commit_interval - time.monotonic()
+                if delay > 0:
+                    self._buffered.wait(delay)
+                    continue
+                try:
+                    self._commit()
+                except Exception as e:
+                    # the records stay buffered, the next append or flush retries
+                    logger.error("Group commit of %s failed: %s - %s", self.filepath, type(e).__name__, e)
+                    self._buffered.wait(self.group_commit_interval)
+
+    def _encode(self, record: Dict) -> bytes:
+        line = self.serializer.dumps(record)
+        if self.fernet_instance is not None:
+            line = self.fernet_instance.encrypt(line)
+        return line + b"\n"
+
+    def _decode(self, line: bytes) -> Dict:
+        if self.fernet_instance is not None:
+            line = self.fernet_instance.decrypt(line)
+        return self.serializer.loads(line)
+
+    def _last_seq(self) -> int:
+        """ Sequence number of the last readable record of an existing log """
+        seq = 0
+        if os.path.exists(self.filepath):
+            for record in self._read_records():
+                seq = record.get("seq", seq)
+        return seq
+
+    def append(self, op: str, uid: int, data: Optional[Dict] = None, expires_at: Optional[float] = None) -> int:
+        """ Append one operation to the log
+
+        Args:
+            op (str): one of OPERATIONS
+            uid (int): id of the record
+            data (dict, optional): full record for "add", changed fields for "update"
+            expires_at (float, optional): new deadline of the record, see expiry.ExpiryHeap
+
+        Returns:
+            int: sequence number of the record
+        """
+        if op not in self.OPERATIONS:
+            raise ValueError(f"Unknown log operation {op}")
+        record = {"op": op, "id": uid}
+        if data is not None:
+            record["data"] = data
+        if expires_at is not None:
+            record["expires_at"] = expires_at
+        with self._lock:
+            # encoded before the number is taken, a record that cannot be encoded leaves the log as it was
+            record["seq"] = self.seq + 1
+            line = self._encode(record)
+            self.seq += 1
+            self._buffer.append(line)
+            if self._first_buffered_at is None:
+                self._first_buffered_at = time.monotonic()
+                self._buffered.notify()
+            if (self.fsync == "always"
+                    or len(self._buffer) >= self.group_commit_size
+                    or time.monotonic() - self._first_buffered_at >= self.group_commit_interval):
+                self._commit()
+            return self.seq
+
+    def append_batch(self, operations: List[Dict]) -> int:
+        """ Append several operations as one log record, a replay applies all of them or none
+
+        Args:
+            operations (List[dict]): {"op", "id", "data"} dicts, op is one of OPERATIONS, plus "expires_at"
+                for the records given a deadline
+
+        Returns:
+            int: sequence number of the record
+        """
+        for operation in operations:
+            if operation["op"] not in self.OPERATIONS:
+                raise ValueError(f"Unknown log operation {operation['op']}")
+        with self._lock:
+            # see append
+            line = self._encode({"op": "batch", "ops": operations, "seq": self.seq + 1})
+            self.seq += 1
+            self._buffer.append(line)
+            # a batch is already a group, it is committed right away
+            self._commit()
+            return self.seq
+
+    def _commit(self):
+        """ Write the buffered records in one call. Caller holds the lock """
+        if not self._buffer:
+            return
+        payload = b"".join(self._buffer)
+        self._file.write(payload)
+        self._file.flush()
+        BYTES_WRITTEN.inc("log", amount=len(payload))
+        if self.fsync != "never":
+            os.fsync(self._file.fileno())
+        self._buffer.clear()
+        self._first_buffered_at = None
+
+    def flush(self):
+        """ Commit every buffered record """
+        with self._lock:
+            self._commit()
+
+    def replay(self) -> Iterator[Dict]:
+        """ Yield the committed records in order.
+        A torn record at the end of the log (crash in the middle of a write) ends the replay.
+        """
+        self.flush()
+        yield from self._read_records()
+
+    def _read_records(self) -> Iterator[Dict]:
+        with open(self.filepath, "rb") as log_file:
+            for line in log_file:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield self._decode(line)
+                except Exception:
+                    return
+
+    def checkpoint(self) -> int:
+        """ Commit the buffered records and return the sequence number a snapshot taken now covers """
+        with self._lock:
+            self._commit()
+            self._marks[self.seq] = self._file.tell()
+            return self.seq
+
+    def _cut_offset(self, upto: int) -> int:
+        """ Offset of the first record numbered after upto. Caller holds the lock and committed the buffer """
+        offset = self._marks.get(upto)
+        if offset is not None:
+            return offset
+        # a checkpoint of an earlier file, the records are numbered in order
+        offset = 0
+        with open(self.filepath, "rb") as log_file:
+            for line in log_file:
+                if line.strip():
+                    try:
+                        record = self._decode(line.strip())
+                    except Exception:
+                        # torn record, it is kept and ends the replay as before
+                        break
+                    # a checkpoint carries the last number of the records after it, it is rewritten anyway
+                    if record["op"] != "checkpoint" and record["seq"] > upto:
+                        break
+                offset += len(line)
+        return offset
+
+    def truncate(self, upto: Optional[int] = None):
+        """ Drop the records a snapshot contains
+
+        The cut point is found when the log is rewritten, so snapshots frozen one after the other
+        each drop the records they hold even when an earlier one already rewrote the log.
+
+        Args:
+            upto (int, optional): sequence number returned by checkpoint, records numbered after it are kept.
+                Defaults to None which drops every record.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            if upto is None:
+                self._buffer.clear()
+                self._first_buffered_at = None
+                tail = b""
+                cut = self._file.tell()
+            else:
+                self._commit()
+                cut = self._cut_offset(upto)
+                with open(self.filepath, "rb") as log_file:
+                    log_file.seek(cut)
+                    tail = log_file.read()
+            header = self._encode({"op": "checkpoint", "seq": self.seq})
+            tmp_path = self.filepath + ".tmp"
+            with open(tmp_path, "wb") as tmp_file:
+                # keeps the sequence going, the records after the checkpoint already carry their numbers
+                tmp_file.write(header)
+                tmp_file.write(tail)
+                tmp_file.flush()
+                if self.fsync != "never":
+                    os.fsync(tmp_file.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.filepath)
+            self._file = open(self.filepath, "ab")
+            # checkpoints of snapshots still queued now point into the new file
+            self._marks = {seq: offset - cut + len(header) for seq, offset in self._marks.items()
+                           if upto is not None and seq > upto}
+
+    def close(self):
+        """ Commit the buffered records and close the file """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._commit()
+            self._file.close()
+            self._buffered.notify()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+
+
+def log_operations(record: Dict) -> Iterable[Dict]:
+    """ The single operations held by a log record, a batch record holds several and a checkpoint none """
+    if record["op"] == "batch":
+        return record["ops"]
+    if record["op"] == "checkpoint":
+        return ()
+    return (record,)
+
+
+def apply_log_record(table: Dict, record: Dict):
+    """ Apply one replayed log record to an in memory table
+
+    Args:
+        table (dict): table keyed by int ids
+        record (dict): log record produced by WriteAheadLog.append or append_batch
+    """
+    if record["op"] == "checkpoint":
+        return
+    if record["op"] == "batch":
+        for operation in record["ops"]:
+            apply_log_record(table, operation)
+        return
+    uid = record["id"]
+    op = record["op"]
+    if op == "add":
+        table[uid] = record["data"]
+    elif op == "update":
+        if uid in table:
+            # replaced, not mutated in place, see cache.SpillTable
+            table[uid] = {**table[uid], **record["data"]}
+    elif op == "delete":
+        table.pop(uid, None)